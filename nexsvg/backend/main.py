@@ -6,7 +6,7 @@ import io
 import os
 import torch
 import logging
-from starvector import StarVectorForCausalLM, process_images
+from starvector.model.starvector_arch import StarVectorForCausalLM
 
 # Set up logging
 logging.basicConfig(
@@ -30,6 +30,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+model = None
+
+def get_model():
+    # Loaded once on first use, not on every request
+    global model
+    if model is None:
+        model = StarVectorForCausalLM.from_pretrained("starvector/starvector-1b-im2svg", torch_dtype=torch.float16).cuda()
+        model.eval()
+    return model
+
 @app.post("/convert", 
          description="Convert an image to SVG format",
          responses={
@@ -52,22 +62,20 @@ async def convert_to_svg(file: UploadFile = File(...)):
         logger.info(f"Image loaded and converted to RGB: {image.size}")
 
         try:
-            # Process the image using StarVector
-            processed_image = process_images([image])[0].to(torch.float16).cuda()
-            
-            # Load the model
-            model = StarVectorForCausalLM.from_pretrained("starvector/starvector-1b-im2svg").cuda()
-            model.eval()
+            model = get_model()
+
+            # Process the image into a [1, 3, H, W] batch on the GPU
+            processed_image = model.process_images([image], dtype=torch.float16, device="cuda")
 
             # Generate SVG
             with torch.no_grad():
                 svg_output = model.generate_im2svg(
-                    processed_image,
+                    {"image": processed_image},
                     max_length=4000,
                     temperature=1.5,
                     length_penalty=-1,
                     repetition_penalty=3.1
-                )
+                )[0]
             
             logger.info("Successfully generated SVG")
             return Response(content=svg_output, media_type="image/svg+xml")
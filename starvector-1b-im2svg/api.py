@@ -7,6 +7,7 @@ from starvector.model.starvector_arch import StarVectorForCausalLM
 from transformers import AutoConfig
 import os
 import base64
+import time
 from io import BytesIO
 
 app = FastAPI()
@@ -22,30 +23,73 @@ app.add_middleware(
 
 # Global model variable
 model = None
+# Optional minification of the returned SVG (STARVECTOR_MINIFY=1)
+minifier = None
+# Optional routing of flat-colour images to the classical tracer (STARVECTOR_ROUTER=1)
+router = None
+# Optional geometry simplification of the returned SVG (STARVECTOR_SIMPLIFY_TOLERANCE, fraction of the viewBox),
+# kept only when its raster diff to the model output is within STARVECTOR_SIMPLIFY_MAX_RASTER_DIFF
+simplifier = None
 
 def load_model():
-    global model
+    global model, minifier, simplifier, router
+    if router is None and os.environ.get("STARVECTOR_ROUTER", "0") == "1":
+        from starvector.serve.router import ImageRouter
+        router = ImageRouter(min_fidelity=float(os.environ.get("STARVECTOR_ROUTER_MIN_FIDELITY", 0.97)))
+    if simplifier is None and os.environ.get("STARVECTOR_SIMPLIFY_TOLERANCE"):
+        from starvector.data.simplify import SVGSimplifier
+        simplifier = SVGSimplifier(
+            tolerance=float(os.environ["STARVECTOR_SIMPLIFY_TOLERANCE"]),
+            verify=True,
+            max_raster_diff=float(os.environ.get("STARVECTOR_SIMPLIFY_MAX_RASTER_DIFF", 0.005)))
+    if minifier is None and os.environ.get("STARVECTOR_MINIFY", "0") == "1":
+        from starvector.data.svg_minify import SVGMinifier
+        minifier = SVGMinifier(
+            precision=int(os.environ.get("STARVECTOR_MINIFY_PRECISION", 4)),
+            max_raster_diff=float(os.environ.get("STARVECTOR_MINIFY_MAX_RASTER_DIFF", 0.005)))
     if model is None:
         print("Loading model...")
         device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"Using device: {device}")
+        # Same dtype in both loading modes, and for the images in /convert
+        dtype = torch.float16 if device == "cuda" else torch.float32
         
         model_name = "starvector/starvector-1b-im2svg"
-        config = AutoConfig.from_pretrained(model_name, trust_remote_code=True)
-        config.attn_implementation = "eager"
-        config.use_flash_attention_2 = False
-        
-        model = StarVectorForCausalLM.from_pretrained(
-            model_name, 
-            config=config,
-            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-            use_flash_attention_2=False,
-            attn_implementation="eager",
-            trust_remote_code=True
-        )
+
+        if device == "cpu" and os.environ.get("STARVECTOR_SHARED_WEIGHTS", "0") == "1":
+            # All uvicorn workers on this host share one copy of the weights through the page cache. A checkpoint
+            # stored in another dtype is cast once to a file next to it (or in STARVECTOR_SHARED_WEIGHTS_DIR)
+            from starvector.model.shared_weights import load_shared_pretrained_model
+            model = load_shared_pretrained_model(model_name, torch_dtype=dtype,
+                                                 cache_dir=os.environ.get("STARVECTOR_SHARED_WEIGHTS_DIR"))
+        else:
+            config = AutoConfig.from_pretrained(model_name, trust_remote_code=True)
+            config.attn_implementation = "eager"
+            config.use_flash_attention_2 = False
+            
+            model = StarVectorForCausalLM.from_pretrained(
+                model_name, 
+                config=config,
+                torch_dtype=dtype,
+                use_flash_attention_2=False,
+                attn_implementation="eager",
+                trust_remote_code=True
+            )
         
         model = model.to(device)
         model.eval()
+
+        # Optionally run the image encoder + adapter from an exported ONNX / torch.export artifact
+        image_encoder_runtime = os.environ.get("STARVECTOR_IMAGE_ENCODER_RUNTIME")
+        if image_encoder_runtime:
+            print(f"Using exported image encoder runtime: {image_encoder_runtime}")
+            model.load_image_encoder_runtime(image_encoder_runtime)
+        # Optionally decode with lm_head restricted to the SVG token subset
+        svg_vocabulary = os.environ.get("STARVECTOR_SVG_VOCABULARY")
+        if svg_vocabulary:
+            from starvector.model.llm.svg_vocabulary import SVGVocabulary
+            print(f"Using SVG vocabulary: {svg_vocabulary}")
+            model.set_svg_vocabulary(SVGVocabulary.load(svg_vocabulary))
         print("Model loaded successfully!")
 
 @app.on_event("startup")
@@ -59,12 +103,16 @@ async def convert_image(file: UploadFile = File(...)):
         contents = await file.read()
         image = Image.open(io.BytesIO(contents))
         image = image.convert('RGB')
-        
+
+        if router is not None:
+            traced_svg, _ = router.route(image)
+            if traced_svg is not None:
+                return {"svg": traced_svg, "route": "tracer"}
+            start = time.time()
+
         # Process image for the model
         device = "cuda" if torch.cuda.is_available() else "cpu"
-        processed_image = model.process_images([image])[0].to(torch.float16 if device == "cuda" else torch.float32)
-        if device == "cuda":
-            processed_image = processed_image.cuda()
+        processed_image = model.process_images([image], dtype=torch.float16 if device == "cuda" else torch.float32, device=device)
         
         # Generate SVG
         with torch.no_grad():
@@ -75,7 +123,19 @@ async def convert_image(file: UploadFile = File(...)):
                 length_penalty=-1,
                 repetition_penalty=3.1
             )[0]
+        if router is not None:
+            router.record_model_time(1, time.time() - start)
         
+        if minifier is not None or simplifier is not None:
+            from starvector.data.svg_repair import repair_svg, PLACEHOLDER
+            repaired = repair_svg(svg_output)
+            if repaired.status != PLACEHOLDER:
+                svg_output = repaired.svg
+                if simplifier is not None:
+                    svg_output = simplifier(svg_output)
+                if minifier is not None:
+                    svg_output = minifier(svg_output).svg
+
         return {"svg": svg_output}
     
     except Exception as e:
@@ -83,4 +143,10 @@ async def convert_image(file: UploadFile = File(...)):
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "model_loaded": model is not None} 
\ No newline at end of file
+    health = {"status": "healthy", "model_loaded": model is not None}
+    if router is not None:
+        health["routing"] = router.report()
+    if model is not None and model.model.svg_vocabulary is not None:
+        # Subset coverage and how often generation had to fall back to the full vocabulary
+        health["svg_vocabulary"] = model.model.svg_vocabulary.report()
+    return health 
\ No newline at end of file
@@ -7,7 +7,6 @@ import io
 import os
 import torch
 import traceback
-from starvector import StarVectorForCausalLM, process_images
 import logging
 
 # Set up logging
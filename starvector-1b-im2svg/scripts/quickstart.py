@@ -13,7 +13,7 @@ starvector.eval()
 
 image_pil = Image.open("assets/examples/sample-18.png")
 image_pil = image_pil.convert('RGB')
-image = starvector.process_images([image_pil])[0].to(torch.float16).cuda()
+image = starvector.process_images([image_pil], dtype=torch.float16, device="cuda")
 batch = {"image": image}
 
 raw_svg = starvector.generate_im2svg(batch, max_length=4000, temperature=1.5, length_penalty=-1, repetition_penalty=3.1)[0]
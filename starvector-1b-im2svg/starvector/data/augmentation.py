@@ -1,13 +1,185 @@
 import numpy as np
 from svgpathtools import (
-    Path, Arc, CubicBezier, QuadraticBezier,
+    Path, Line, Arc, CubicBezier, QuadraticBezier,
     parse_path)
 import os 
 from opensimplex import OpenSimplex
 import random
 import re
+import time
+from xml.sax.saxutils import escape
 from bs4 import BeautifulSoup
+from lxml import etree
 from starvector.data.util import get_viewbox_size, clean_attributes, paths2str
+from starvector.data import svg_path
+
+_SVG_PARSER = etree.XMLParser(recover=True, remove_comments=True, huge_tree=True, resolve_entities=False, no_network=True)
+
+# Number of packed points per segment kind: bezier control points, start and end for arcs
+_SEGMENT_POINTS = {'L': 2, 'Q': 3, 'C': 4, 'A': 2}
+_SEGMENT_FORMAT = {'L': 'L {},{}', 'Q': 'Q {},{} {},{}', 'C': 'C {},{} {},{} {},{}'}
+
+_QUOTE_ENTITIES = {'"': '&quot;'}
+
+def _format_attributes(attributes):
+    return ' '.join(f'{k}="{escape(str(v), _QUOTE_ENTITIES)}"' for k, v in attributes.items())
+
+def _element_attributes(element, exclude=()):
+    """Attributes of an lxml element keyed as in the document (`prefix:name` for namespaced ones)"""
+    prefixes = {uri: prefix for prefix, uri in element.nsmap.items() if prefix}
+    prefixes['http://www.w3.org/XML/1998/namespace'] = 'xml'
+    attributes = {}
+    for key, value in element.attrib.items():
+        if key.startswith('{'):
+            uri, name = key[1:].split('}', 1)
+            key = f'{prefixes[uri]}:{name}' if uri in prefixes else name
+        if key not in exclude:
+            attributes[key] = value
+    return attributes
+
+def _arc_radius(start, end, radius, rotation):
+    """Absolute arc radii, scaled up when no ellipse with these radii joins start and end (as svgpathtools `Arc` does)"""
+    rx, ry = abs(radius.real), abs(radius.imag)
+    half = np.exp(-1j * np.radians(rotation)) * (start - end) / 2
+    check = (half.real / rx) ** 2 + (half.imag / ry) ** 2
+    if check > 1:
+        rx, ry = rx * np.sqrt(check), ry * np.sqrt(check)
+    return complex(rx, ry)
+
+def pack_path(d):
+    """
+    Path data as packed arrays: segment kinds ('L', 'Q', 'C' or 'A'), their points as one complex list
+    (all bezier control points, start and end for arcs) and `[radius, rotation, large_arc, sweep]` per
+    arc. Segments are the ones `svgpathtools.parse_path` builds: H/V and closing Z are lines, S/T are
+    cubics/quadratics with reflected controls, zero radius arcs are lines. Raises ValueError if the
+    path data is invalid.
+    """
+    segments = svg_path.parse_path(d)
+    if segments is None:
+        # Fall back to the lenient svgpathtools tokenizer
+        return _pack_segments(parse_path(d))
+
+    kinds, points, arcs = [], [], []
+    current = start = 0j
+    previous = None
+    last_control = None
+    for command, args in segments:
+        if command == 'M':
+            current = start = complex(args[0], args[1])
+        elif command == 'Z':
+            if current != start:
+                kinds.append('L')
+                points += [current, start]
+            current = start
+        elif command in ('L', 'H', 'V'):
+            end = (complex(args[0], current.imag) if command == 'H'
+                   else complex(current.real, args[0]) if command == 'V'
+                   else complex(args[0], args[1]))
+            kinds.append('L')
+            points += [current, end]
+            current = end
+        elif command in ('C', 'S'):
+            if command == 'C':
+                control1 = complex(args[0], args[1])
+                args = args[2:]
+            else:
+                control1 = 2 * current - last_control if previous in ('C', 'S') else current
+            control2, end = complex(args[0], args[1]), complex(args[2], args[3])
+            kinds.append('C')
+            points += [current, control1, control2, end]
+            last_control = control2
+            current = end
+        elif command in ('Q', 'T'):
+            if command == 'Q':
+                control = complex(args[0], args[1])
+                args = args[2:]
+            else:
+                control = 2 * current - last_control if previous in ('Q', 'T') else current
+            end = complex(args[0], args[1])
+            kinds.append('Q')
+            points += [current, control, end]
+            last_control = control
+            current = end
+        else:
+            radius, end = complex(args[0], args[1]), complex(args[5], args[6])
+            if radius.real == 0 or radius.imag == 0:
+                kinds.append('L')
+                points += [current, end]
+            elif end == current:
+                raise ValueError(f"Arc with coincident start and end in {d}")
+            else:
+                kinds.append('A')
+                points += [current, end]
+                arcs.append([_arc_radius(current, end, radius, args[2]), args[2], bool(args[3]), bool(args[4])])
+            current = end
+        previous = command
+    return kinds, points, arcs
+
+def _pack_segments(path):
+    kinds, points, arcs = [], [], []
+    for segment in path:
+        if isinstance(segment, Arc):
+            kinds.append('A')
+            points += [segment.start, segment.end]
+            arcs.append([segment.radius, segment.rotation, segment.large_arc, segment.sweep])
+        else:
+            kinds.append({2: 'L', 3: 'Q', 4: 'C'}[len(segment.bpoints())])
+            points += list(segment.bpoints())
+    return kinds, points, arcs
+
+def _point_slots(kinds):
+    """Slot of each packed point in its segment, -1 on lines, which `add_noise` leaves in place"""
+    slots = [i if kind != 'L' else -1 for kind in kinds for i in range(_SEGMENT_POINTS[kind])]
+    return np.array(slots, dtype=int)
+
+def _unpack_segments(kinds, points, arcs):
+    """svgpathtools segments from packed arrays (see `pack_path`)"""
+    points = points.tolist()
+    segments = []
+    offset = 0
+    arc_index = 0
+    for kind in kinds:
+        count = _SEGMENT_POINTS[kind]
+        segment_points = points[offset:offset + count]
+        offset += count
+        if kind == 'A':
+            radius, rotation, large_arc, sweep = arcs[arc_index]
+            arc_index += 1
+            segments.append(Arc(segment_points[0], radius, rotation, large_arc, sweep, segment_points[1]))
+        elif kind == 'C':
+            segments.append(CubicBezier(*segment_points))
+        elif kind == 'Q':
+            segments.append(QuadraticBezier(*segment_points))
+        else:
+            segments.append(Line(*segment_points))
+    return segments
+
+def path_data(kinds, points, arcs):
+    """Path data of packed segments (see `pack_path`), written like svgpathtools `Path.d()`"""
+    if not kinds:
+        return ''
+    counts = np.array([_SEGMENT_POINTS[k] for k in kinds])
+    first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    last = first + counts - 1
+    # A new subpath starts wherever a segment does not start at the end of the previous one
+    move = np.ones(len(kinds), dtype=bool)
+    move[1:] = points[first[1:]] != points[last[:-1]]
+    include = np.ones(len(points), dtype=bool)
+    include[first[~move]] = False
+    values = np.stack([points.real, points.imag], axis=1)[include].ravel().tolist()
+
+    parts = []
+    arc_index = 0
+    for kind, moved in zip(kinds, move.tolist()):
+        if moved:
+            parts.append('M {},{}')
+        if kind == 'A':
+            radius, rotation, large_arc, sweep = arcs[arc_index]
+            arc_index += 1
+            parts.append(f'A {radius.real},{radius.imag} {rotation} {int(large_arc):d},{int(sweep):d} {{}},{{}}')
+        else:
+            parts.append(_SEGMENT_FORMAT[kind])
+    return ' '.join(parts).format(*values)
 
 class SVGTransforms:
     def __init__(self, transforms):
@@ -24,6 +196,13 @@ class SVGTransforms:
         self.color_change = self.transforms.get('color_change', False)
         self.colors = self.transforms.get('colors', ['#ff0000', '#0000ff', '#000000'])
 
+    def reseed(self, seed):
+        """Make the next `augment` deterministic: seeds the random draws and the noise generator"""
+        random.seed(seed)
+        np.random.seed(seed)
+        self.noise_gen = OpenSimplex(seed=seed)
+        self._slot_noise = None
+
     def sample_transformations(self):
         """Sample random values for transformations"""
         if self.rotate:
@@ -41,52 +220,14 @@ class SVGTransforms:
         """Add Perlin noise to SVG path coordinates"""
         if random.random() > self.p:
             return path
-            
-        # Get path segments
-        segments = path._segments
-        
-        # Create new segments with noise
-        new_segments = []
-        for segment in segments:
-            # Get control points
-            points = segment.bpoints()
-            
-            # Add noise to each point
-            noisy_points = []
-            for i, point in enumerate(points):
-                # Generate noise with different offsets for x and y
-                x_noise = self.noise_gen.noise2(i * 20, 0) * noise_std
-                y_noise = self.noise_gen.noise2(0, i * 20) * noise_std
-                
-                # Apply noise to coordinates
-                noisy_point = complex(
-                    point.real + x_noise,
-                    point.imag + y_noise
-                )
-                noisy_points.append(noisy_point)
-            
-            # Create new segment with noisy points
-            if isinstance(segment, CubicBezier):
-                new_segment = CubicBezier(*noisy_points)
-            elif isinstance(segment, QuadraticBezier):
-                new_segment = QuadraticBezier(*noisy_points)
-            elif isinstance(segment, Arc):
-                new_segment = Arc(
-                    noisy_points[0],
-                    noisy_points[1],
-                    segment.radius,
-                    segment.rotation,
-                    segment.large_arc,
-                    segment.sweep
-                )
-            else:
-                new_segment = segment
-                
-            new_segments.append(new_segment)
-        
-        # Create new path with noisy segments
-        return Path(*new_segments)
-    
+
+        # Perturb the points of all segments at once and rebuild the segments from the arrays
+        kinds, points, arcs = _pack_segments(path)
+        if not kinds:
+            return path
+        points = np.array(points, dtype=complex) + noise_std * self.point_noise(kinds)
+        return Path(*_unpack_segments(kinds, points, arcs))
+
     def do_rotate(self, path, viewbox_width, viewbox_height):
         """Apply rotation to path"""
         if not self.rotate or random.random() > self.p:
@@ -129,8 +270,123 @@ class SVGTransforms:
             
         return attributes
     
+    def slot_noise(self):
+        """
+        Noise offsets by control point slot: the i-th point of every segment moves by
+        (noise2(i * 20, 0), noise2(0, i * 20)) times the noise std, fixed per instance. The x and y
+        offsets of all slots are each generated with one array call.
+        """
+        if getattr(self, '_slot_noise', None) is None:
+            coordinates = np.arange(max(_SEGMENT_POINTS.values())) * 20.0
+            origin = np.zeros(1)
+            self._slot_noise = (self.noise_gen.noise2array(coordinates, origin)[0]
+                                + 1j * self.noise_gen.noise2array(origin, coordinates)[:, 0])
+        return self._slot_noise
+
+    def point_noise(self, kinds):
+        """Unit noise offsets for the packed points of `kinds` segments (see `pack_path`), zero on lines"""
+        slots = _point_slots(kinds)
+        return np.where(slots >= 0, self.slot_noise()[slots], 0)
+
     def augment(self, svg_content):
-        """Apply transformations to SVG content"""
+        """
+        Apply transformations to SVG content. Same transformations and random draws as
+        `augment_legacy`, computed on packed arrays: the document is parsed once, the points of all
+        paths are packed into one complex array and transformed with one composed affine map per path
+        (z -> a * z + b, rotation about the viewBox center, then shift, then scale), plus noise.
+        """
+        if not svg_content.lstrip().startswith('<') and os.path.isfile(svg_content):
+            with open(svg_content, 'r') as f:
+                svg_content = f.read()
+
+        # Sample transformations
+        self.sample_transformations()
+
+        try:
+            document = etree.fromstring(svg_content.strip().encode('utf-8'), _SVG_PARSER)
+        except etree.XMLSyntaxError:
+            document = None
+        if document is None:
+            return svg_content, None
+        svg_tag = document if etree.QName(document).localname == 'svg' else next(document.iter('{*}svg'), None)
+        if svg_tag is None:
+            return svg_content, None
+
+        viewbox = re.split(r'[\s,]+', (svg_tag.get('viewBox') or svg_tag.get('viewbox') or '').strip())
+        viewbox_width, viewbox_height = (float(viewbox[2]), float(viewbox[3])) if len(viewbox) >= 4 else (100, 100)
+        center = complex(viewbox_width / 2, viewbox_height / 2)
+        rotation = np.exp(1j * np.radians(self.rotation_angle)) if self.rotate else 1
+        shift = complex(self.shift_re_value if self.shift_re else 0, self.shift_im_value if self.shift_im else 0)
+
+        # Pack the paths, drawing the random decisions in the order of `augment_legacy`
+        entries, points, kinds_all, coefficients, noise_stds = [], [], [], [], []
+        for path_tag in document.iter('{*}path'):
+            d = path_tag.get('d', '')
+            if not d:
+                continue
+            try:
+                kinds, path_points, arcs = pack_path(d)
+            except Exception as e:
+                print(f"Error processing path: {e}")
+                continue
+            attributes = _element_attributes(path_tag, exclude=('d',))
+
+            rotated = bool(self.rotate) and random.random() <= self.p
+            shifted = bool(self.shift_re or self.shift_im) and random.random() <= self.p
+            scaled = bool(self.scale) and random.random() <= self.p
+            noise_std = 0.0
+            if self.noise_std:
+                noise_std = random.uniform(self.noise_std['from'], self.noise_std['to'])
+                if random.random() > self.p:
+                    noise_std = 0.0
+            attributes = self.do_color_change(attributes)
+
+            # Composed map z -> a * z + b
+            a, b = 1, 0
+            if rotated:
+                a, b = rotation, center - rotation * center
+            if shifted:
+                b = b + shift
+            if scaled:
+                a, b = a * self.scale_value, b * self.scale_value
+            for arc in arcs:
+                if rotated:
+                    arc[1] = arc[1] + self.rotation_angle
+                if scaled:
+                    arc[0] = self.scale_value * arc[0]
+
+            entries.append((kinds, arcs, attributes, len(path_points)))
+            points.extend(path_points)
+            coefficients.append((a, b))
+            kinds_all.extend(kinds)
+            noise_stds.append(noise_std)
+
+        # One transform for all points of the document
+        points = np.array(points, dtype=complex)
+        if len(points):
+            sizes = [entry[3] for entry in entries]
+            a, b = np.repeat(np.array(coefficients, dtype=complex), sizes, axis=0).T
+            # The noise of every point of the document in one lookup
+            points = a * points + b + np.repeat(noise_stds, sizes) * self.point_noise(kinds_all)
+
+        svg_attrs = {('xmlns' if prefix is None else f'xmlns:{prefix}'): uri for prefix, uri in svg_tag.nsmap.items()}
+        svg_attrs.update(_element_attributes(svg_tag))
+        parts = [f'<svg {_format_attributes(svg_attrs)}>']
+        offset = 0
+        for kinds, arcs, attributes, n in entries:
+            path_points = points[offset:offset + n]
+            offset += n
+            if arcs:
+                # Noise moves arc end points, radii that became too small are scaled up as svgpathtools does
+                ends = path_points[np.repeat(np.array(kinds) == 'A', [_SEGMENT_POINTS[k] for k in kinds])]
+                for arc, start, end in zip(arcs, ends[0::2].tolist(), ends[1::2].tolist()):
+                    arc[0] = _arc_radius(start, end, arc[0], arc[1])
+            parts.append(f'<path d="{path_data(kinds, path_points, arcs)}" {_format_attributes(attributes)}/>')
+        parts.append('</svg>')
+        return ''.join(parts), None
+
+    def augment_legacy(self, svg_content):
+        """Apply transformations to SVG content with svgpathtools objects, reference for `augment`"""
         if os.path.isfile(svg_content):
             with open(svg_content, 'r') as f:
                 svg_content = f.read()
@@ -154,7 +410,7 @@ class SVGTransforms:
             if path_data:
                 try:
                     path = parse_path(path_data)
-                    attributes = dict(path_tag.attrs)
+                    attributes = {k: v for k, v in path_tag.attrs.items() if k != 'd'}
                     
                     # Apply transformations
                     path = self.do_rotate(path, viewbox_width, viewbox_height)
@@ -177,14 +433,112 @@ class SVGTransforms:
                     continue
         
         # Create new SVG content
-        svg_attrs = ' '.join([f'{k}="{v}"' for k, v in svg_tag.attrs.items()])
+        svg_attrs = _format_attributes(svg_tag.attrs)
         augmented_svg = f'<svg {svg_attrs}>'
         
         # Add paths
         for path, attributes in paths_and_attributes:
-            path_attrs = ' '.join([f'{k}="{v}"' for k, v in attributes.items()])
+            path_attrs = _format_attributes(attributes)
             augmented_svg += f'<path d="{path.d()}" {path_attrs}/>'
         
         augmented_svg += '</svg>'
         
         return augmented_svg, None  # Return None for image since we're not rendering
+
+def _path_tokens(d):
+    commands, numbers = [], []
+    for kind, text, _ in svg_path.tokenize_path(d):
+        if kind == 'command':
+            commands.append(text)
+        elif kind == 'number':
+            numbers.append(float(text))
+    return commands, np.array(numbers)
+
+def check_equivalence(transforms, svg_content, seed=0, atol=1e-6):
+    """
+    Whether `augment` and `augment_legacy` agree on `svg_content` with the same seed: same elements
+    and attributes, same path commands, and coordinates equal up to floating point rounding (the
+    composed transform does not round like the chain of svgpathtools rebuilds).
+    """
+    outputs = []
+    for method in ('augment_legacy', 'augment'):
+        transformer = SVGTransforms(transforms)
+        transformer.noise_gen = OpenSimplex(seed=seed)
+        random.seed(seed)
+        np.random.seed(seed)
+        outputs.append(getattr(transformer, method)(svg_content)[0])
+    legacy, new = (etree.fromstring(svg.encode('utf-8'), _SVG_PARSER) for svg in outputs)
+    if legacy is None or new is None:
+        return outputs[0] == outputs[1]
+    if dict(legacy.attrib) != dict(new.attrib) or len(legacy) != len(new):
+        return False
+    for legacy_path, new_path in zip(legacy, new):
+        legacy_attributes, new_attributes = dict(legacy_path.attrib), dict(new_path.attrib)
+        legacy_commands, legacy_numbers = _path_tokens(legacy_attributes.pop('d', ''))
+        new_commands, new_numbers = _path_tokens(new_attributes.pop('d', ''))
+        if legacy_attributes != new_attributes or legacy_commands != new_commands or len(legacy_numbers) != len(new_numbers):
+            return False
+        if not np.allclose(legacy_numbers, new_numbers, rtol=0, atol=atol):
+            return False
+    return True
+
+def benchmark(transforms, svgs, seed=0, min_seconds=2.0):
+    """
+    Samples per second of `augment_legacy` and `augment` over `svgs`, in this process: the throughput
+    of one dataloader worker.
+    """
+    report = {'num_svgs': len(svgs)}
+    for method in ('augment_legacy', 'augment'):
+        transformer = SVGTransforms(transforms)
+        random.seed(seed)
+        np.random.seed(seed)
+        augment = getattr(transformer, method)
+        samples, start = 0, time.time()
+        while True:
+            for svg in svgs:
+                augment(svg)
+            samples += len(svgs)
+            elapsed = time.time() - start
+            if elapsed >= min_seconds:
+                break
+        report[f'{method}_samples_per_second'] = samples / elapsed
+    report['speedup'] = report['augment_samples_per_second'] / report['augment_legacy_samples_per_second']
+    report['num_equivalent'] = sum(check_equivalence(transforms, svg, seed=seed + i) for i, svg in enumerate(svgs))
+    return report
+
+def main(config):
+    import glob
+    import json
+    from contextlib import redirect_stdout
+
+    files = sorted(glob.glob(os.path.join(config.corpus_dir, '**', config.get('pattern', '*.svg')), recursive=True))
+    if not files:
+        raise ValueError(f"No SVG files matching {config.get('pattern', '*.svg')} in {config.corpus_dir}")
+    svgs = []
+    for f in files[:config.get('num_samples', 1000)]:
+        with open(f, encoding='utf-8') as fp:
+            svgs.append(fp.read())
+    transforms = config.get('transforms') or {
+        'rotate': {'from': -10, 'to': 10},
+        'shift_re': {'from': -5, 'to': 5},
+        'shift_im': {'from': -5, 'to': 5},
+        'scale': {'from': 0.9, 'to': 1.1},
+        'noise_std': {'from': 0.1, 'to': 0.3},
+        'color_change': True,
+        'p': 0.5,
+    }
+    if not isinstance(transforms, dict):
+        from omegaconf import OmegaConf
+        transforms = OmegaConf.to_container(transforms)
+    # Unparsable paths are reported on stdout by both engines
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        report = benchmark(transforms, svgs, min_seconds=config.get('min_seconds', 2.0))
+    print(json.dumps(report, indent=4))
+
+if __name__ == "__main__":
+    from omegaconf import OmegaConf
+
+    cli_conf = OmegaConf.from_cli()
+    if 'corpus_dir' not in cli_conf:
+        raise ValueError("Usage: python -m starvector.data.augmentation corpus_dir=<dir with SVGs> [pattern=*.svg num_samples=1000 min_seconds=2]")
+    main(cli_conf)
@@ -1,11 +1,25 @@
 from torch.utils.data import Dataset
 from starvector.data.util import ImageTrainProcessor, use_placeholder, rasterize_svg
 from starvector.util import instantiate_from_config
+from starvector.data.materialize import RasterStore, VariantStore, OK
+from starvector.data.pretokenize import TokenStore
+from starvector.data.dataset_index import DatasetIndex
 import numpy as np
 from datasets import load_dataset
 
 class SVGDatasetBase(Dataset):
     def __init__(self, dataset_name, split, im_size, num_samples=-1, **kwargs):
+        self.init_processing(split, im_size, **kwargs)
+        self.data = load_dataset(dataset_name, split=split)
+        if self.index is not None:
+            self.index.check(self.data, self.im_size)
+        # Rows of the index of the selected samples, see `select_rows`
+        self.index_rows = np.arange(len(self.data))
+
+        print(f"Loaded {len(self.data)} samples from {dataset_name} {split} split")
+
+    def init_processing(self, split, im_size, **kwargs):
+        """Augmentation, simplification, precomputed stores and image processing of the samples"""
         self.split = split
         self.im_size = im_size
 
@@ -17,6 +31,40 @@ class SVGDatasetBase(Dataset):
             self.transforms = None
             self.p = 0.0
 
+        # Augmented variants pre-generated with `python -m starvector.data.materialize variants=K`,
+        # sampled instead of augmenting (with the augmentation probability they were generated for)
+        augmented = kwargs.get('augmented', False)
+        if augmented:
+            self.variants = VariantStore(augmented)
+            self.p = self.variants.index['p']
+        else:
+            self.variants = None
+
+        # Optional geometry simplification of the target SVGs, e.g. {tolerance: 0.002, refit: true}
+        simplify = kwargs.get('simplify', False)
+        if simplify:
+            from starvector.data.simplify import SVGSimplifier
+            self.simplifier = SVGSimplifier(**simplify)
+        else:
+            self.simplifier = None
+
+        # Rasters precomputed with `python -m starvector.data.materialize`, read instead of rasterizing
+        materialized = kwargs.get('materialized', False)
+        if materialized:
+            self.rasters = RasterStore(materialized)
+        else:
+            self.rasters = None
+
+        # Target token ids precomputed with `python -m starvector.data.pretokenize`, augmented SVGs are
+        # tokenized in the dataloader workers
+        pretokenized = kwargs.get('pretokenized', False)
+        self.tokens = TokenStore(pretokenized) if pretokenized else None
+        self._stores_checked = False
+
+        # Per-sample facts of the whole split precomputed with `python -m starvector.data.dataset_index`
+        index = kwargs.get('index', False)
+        self.index = DatasetIndex(index) if index else None
+
         normalization = kwargs.get('normalize', False)
         if normalization:
             mean = tuple(normalization.get('mean', None))
@@ -26,24 +74,87 @@ class SVGDatasetBase(Dataset):
             std = None
 
         self.processor = ImageTrainProcessor(size=self.im_size, mean=mean, std=std)
-        self.data = load_dataset(dataset_name, split=split)
-
-        print(f"Loaded {len(self.data)} samples from {dataset_name} {split} split")
 
     def __len__(self):
         return len(self.data_json)
     
-    def get_svg_and_image(self, svg_str, sample_id):
+    def select_rows(self, rows):
+        """Keep the samples at positions `rows` of the current data"""
+        rows = np.asarray(rows, dtype=np.int64)
+        self.data = self.data.select(rows)
+        self.index_rows = self.index_rows[rows]
+
+    def select_model_name(self, model_name):
+        """Keep the samples of `model_name`, read from the index instead of scanning the split when there is one"""
+        if self.index is None:
+            self.data = self.data.filter(lambda example: example["model_name"]==model_name)
+            self.index_rows = np.arange(len(self.data))
+            return
+        self.select_rows(np.flatnonzero(self.index['model_name'][self.index_rows] == model_name))
+
+    def index_column(self, name):
+        """Indexed fact of every selected sample, None without an index"""
+        if self.index is None:
+            return None
+        return self.index[name][self.index_rows]
+
+    def token_lengths(self, tokenizer_name):
+        """Indexed token counts of the selected samples, None without an index counted with `tokenizer_name`"""
+        if self.index is None or self.index.token_lengths(tokenizer_name) is None:
+            return None
+        return self.index_column('num_tokens')
+
+    def process_image(self, image):
+        """Model inputs for a PIL image, or a uint8 [H, W, 3] array from a materialized store (wrapped without copying)"""
+        if self.image_processor and 'siglip' in self.image_processor:
+            return self.processor(image).pixel_values[0]
+        if isinstance(image, np.ndarray):
+            return self.processor.preprocess_array(image)[0]
+        return self.processor(image)
+
+    def get_svg_and_image(self, svg_str, sample_id, idx=None):
+        if self.simplifier is not None:
+            svg_str = self.simplifier(svg_str)
+
         do_augment = np.random.choice([True, False], p=[self.p, 1 - self.p])
         svg, image = None, None
 
-        # Try to augment the image if conditions are met
-        if self.transforms is not None and do_augment:
+        if not self._stores_checked:
+            for store in (self.rasters, self.variants, self.tokens):
+                if store is not None:
+                    store.check(len(self.data), self.im_size, getattr(self.data, '_fingerprint', None))
+            self._stores_checked = True
+
+        # Sample a pre-generated variant, or try to augment the image if conditions are met
+        if self.variants is not None and do_augment and idx is not None:
+            variant = self.variants.sample(idx)
+            if variant is not None:
+                svg, raster = variant
+                return svg, self.process_image(raster)
+        elif self.transforms is not None and do_augment:
             try:
                 svg, image = self.transforms.augment(svg_str)
             except Exception as e:
                 print(f"Error augmenting {sample_id} due to {str(e)}, trying to rasterize SVG")
 
+        # Unaugmented samples read their precomputed raster
+        if svg is None and self.rasters is not None and idx is not None:
+            if self.rasters.flag(idx) != OK:
+                print(f"Image is full white or invalid, using placeholder image for {sample_id}")
+                svg_str = use_placeholder()
+            return svg_str, self.process_image(self.rasters[idx])
+
+        # Unaugmented samples the index flags as blank or unrenderable skip straight to the placeholder
+        if svg is None and self.index is not None and self.simplifier is None and idx is not None \
+                and self.index['flag'][self.index_rows[idx]] != OK:
+            print(f"Image is full white or invalid, using placeholder image for {sample_id}")
+            svg = use_placeholder()
+            return svg, self.process_image(rasterize_svg(svg, self.im_size))
+
+        # Augmentation returns the SVG only, rasterize it
+        if svg is not None and image is None:
+            image = rasterize_svg(svg, self.im_size)
+
         # If augmentation failed or wasn't attempted, try to rasterize the SVG
         if svg is None or image is None:
             try:
@@ -59,13 +170,13 @@ class SVGDatasetBase(Dataset):
             svg = use_placeholder()
             image = rasterize_svg(svg)
 
-        # Process the image
-        if 'siglip' in self.image_processor:
-            image = self.processor(image).pixel_values[0]
-        else:
-            image = self.processor(image)
+        return svg, self.process_image(image)
 
-        return svg, image
+    def add_svg_input_ids(self, sample, idx):
+        """Add the token ids of the sample's target SVG (see `TokenStore.get`) when the dataset is pre-tokenized"""
+        if self.tokens is not None:
+            sample['svg_input_ids'] = self.tokens.get(idx, sample['svg'])
+        return sample
 
     def __getitem__(self, idx):
         raise NotImplementedError("This method should be implemented by subclasses")
@@ -12,11 +12,11 @@ class SVGDataset(SVGDatasetBase):
         select_dataset_name = kwargs.get('select_dataset_name', False)
         
         if select_dataset_name:
-            self.data = self.data.filter(lambda example: example["model_name"]==select_dataset_name)
+            self.select_model_name(select_dataset_name)
         
         self.num_samples = num_samples
         if self.num_samples != -1:
-            self.data = self.data.select(range(self.num_samples))
+            self.select_rows(range(self.num_samples))
 
         self.image_processor = kwargs.get('image_processor', None)
         if 'siglip' in self.image_processor:
@@ -32,11 +32,11 @@ class SVGDataset(SVGDatasetBase):
     def __getitem__(self, idx):
         svg_str = self.data[idx]['Svg']
         sample_id = self.data[idx]['Filename']
-        svg, image = self.get_svg_and_image(svg_str, sample_id)
+        svg, image = self.get_svg_and_image(svg_str, sample_id, idx)
         caption = self.data[idx].get('Caption', "")
-        return {
+        return self.add_svg_input_ids({
             'svg': svg,
             'image': image,
             'id': sample_id,
             'caption': caption
-            }
\ No newline at end of file
+            }, idx)
\ No newline at end of file
@@ -0,0 +1,191 @@
+import json
+import os
+from functools import partial
+import numpy as np
+from starvector.data.materialize import OK, BLANK, INVALID
+from starvector.data.pretokenize import svg_hash
+
+METADATA_KEY = b'starvector'
+FACTS = ('flag', 'num_tokens', 'num_paths', 'num_elements')
+
+def svg_facts(batch, tokenizer=None, im_size=224, column='Svg'):
+    """
+    Facts of a batch of SVGs (a `datasets.map` batch): their flag (OK, BLANK when they rasterize to
+    white, INVALID when they don't parse or render, as in `materialize`), token count of the training
+    text (with an `SVGTokenizer`, which appends the end tokens; -1 without a tokenizer) and path and
+    element counts (0 when they don't parse)
+    """
+    from lxml import etree
+    from starvector.data.rasterizer import get_rasterizer
+
+    svgs = batch[column]
+    parser = etree.XMLParser(huge_tree=True, resolve_entities=False, no_network=True)
+    images, errors = get_rasterizer().rasterize_batch(svgs, resolution=im_size, return_errors=True)
+    facts = {name: [] for name in FACTS}
+    for svg, image, error in zip(svgs, images, errors):
+        try:
+            root = etree.fromstring(svg.encode('utf-8'), parser)
+        except (etree.XMLSyntaxError, ValueError):
+            root = None
+        if root is None or error is not None:
+            flag = INVALID
+        else:
+            flag = BLANK if np.asarray(image).mean() == 255.0 else OK
+        elements = [element for element in root.iter() if isinstance(element.tag, str)] if root is not None else []
+        facts['flag'].append(flag)
+        facts['num_paths'].append(sum(etree.QName(element).localname == 'path' for element in elements))
+        facts['num_elements'].append(len(elements))
+    if tokenizer is not None:
+        facts['num_tokens'] = [len(ids) for ids in tokenizer(svgs)]
+    else:
+        facts['num_tokens'] = [-1] * len(svgs)
+    return facts
+
+class DatasetIndex:
+    """
+    Sidecar Parquet file written by `build_index`, with one row of precomputed facts per row of a
+    dataset split (before any filtering): the hash of the SVG (`svg_hash`), its `model_name`, flag
+    (rendered at the `im_size` recorded in `metadata`), token count of the training text (with the
+    tokenizer and the number of end tokens recorded in `metadata`, along with the split's fingerprint)
+    and path and element counts. Columns are read once as numpy arrays.
+    """
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+
+        self.path = path
+        table = pq.read_table(path)
+        self.metadata = json.loads(table.schema.metadata[METADATA_KEY])
+        self.columns = {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}
+
+    def __len__(self):
+        return len(self.columns['svg_hash'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def token_lengths(self, tokenizer_name):
+        """
+        Token counts of the rows including the end tokens, None if they were not counted with
+        `tokenizer_name` (or by an older index, without the end tokens)
+        """
+        if self.metadata.get('tokenizer') != tokenizer_name or self.metadata.get('num_end_tokens') is None:
+            return None
+        return self.columns['num_tokens']
+
+    def lookup(self, hashes):
+        """Row of each SVG hash (-1 for the ones not indexed)"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not len(self):
+            return np.full(len(hashes), -1, dtype=np.int64)
+        order = np.argsort(self.columns['svg_hash'], kind='stable')
+        sorted_hashes = self.columns['svg_hash'][order]
+        positions = np.minimum(np.searchsorted(sorted_hashes, hashes), len(order) - 1)
+        return np.where(sorted_hashes[positions] == hashes, order[positions], -1)
+
+    def check(self, data, im_size=None, batch_size=256):
+        """
+        Raise if the index was not built for the HF dataset split `data`: another number of rows, or other
+        SVGs or order, or flags rendered at another `im_size`. When the split has the fingerprint recorded
+        at build time it is not read, otherwise (another cache, an index built elsewhere) the hash of every
+        row is compared.
+        """
+        if im_size is not None and self.metadata.get('im_size') != im_size:
+            raise ValueError(f"Index {self.path} was built at im_size {self.metadata.get('im_size')}, the dataset "
+                             f"uses {im_size}. Update it with `python -m starvector.data.dataset_index`.")
+        if len(self) != len(data):
+            raise ValueError(f"Index {self.path} has {len(self)} rows, the dataset split has {len(data)}. "
+                             f"Update it with `python -m starvector.data.dataset_index`.")
+        fingerprint = getattr(data, '_fingerprint', None)
+        if fingerprint is not None and fingerprint == self.metadata.get('fingerprint'):
+            return
+        hashes = _svg_hashes(data, self.metadata.get('column', 'Svg'), batch_size)
+        mismatched = np.flatnonzero(hashes != self.columns['svg_hash'])
+        if len(mismatched):
+            raise ValueError(f"Index {self.path} does not match the dataset split, their SVGs differ in "
+                             f"{len(mismatched)} of {len(self)} rows (first at row {mismatched[0]}). "
+                             f"Update it with `python -m starvector.data.dataset_index`.")
+
+    def report(self):
+        flags = self.columns['flag']
+        return {
+            'num_samples': len(self),
+            'num_blank': int((flags == BLANK).sum()),
+            'num_invalid': int((flags == INVALID).sum()),
+            'num_tokens': int(self.columns['num_tokens'].sum()) if self.metadata.get('tokenizer') else None,
+            **self.metadata,
+        }
+
+def _svg_hashes(data, column, batch_size):
+    hashes = np.zeros(len(data), dtype=np.uint64)
+    for start in range(0, len(data), batch_size):
+        for i, svg in enumerate(data[start:start + batch_size][column]):
+            hashes[start + i] = svg_hash(svg)
+    return hashes
+
+def build_index(data, path, tokenizer=None, tokenizer_name=None, im_size=224, num_proc=None, batch_size=256, column='Svg'):
+    """
+    Compute the facts of every row of a HF dataset split in parallel (`datasets.map` over `num_proc`
+    processes) and write a `DatasetIndex` to `path`. `tokenizer` is an `SVGTokenizer` (see
+    `load_svg_tokenizer`). When `path` holds an index built with the same tokenizer and image size, the facts of the SVGs it already indexed (by hash) are reused, so a grown
+    or edited split only processes its new SVGs. The file is replaced atomically.
+    Returns the index and the number of rows processed.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Tokenizing an empty SVG leaves the end tokens the tokenizer appends
+    num_end_tokens = len(tokenizer([''])[0]) if tokenizer is not None else None
+    settings = {'tokenizer': tokenizer_name, 'num_end_tokens': num_end_tokens, 'im_size': im_size, 'column': column}
+    metadata = {**settings, 'fingerprint': getattr(data, '_fingerprint', None)}
+    hashes = _svg_hashes(data, column, batch_size)
+    columns = {'flag': np.zeros(len(data), dtype=np.uint8)}
+    columns.update({name: np.zeros(len(data), dtype=np.int32) for name in FACTS[1:]})
+
+    rows = np.full(len(data), -1, dtype=np.int64)
+    if os.path.exists(path):
+        previous = DatasetIndex(path)
+        if all(previous.metadata.get(name) == value for name, value in settings.items()):
+            rows = previous.lookup(hashes)
+            for name in FACTS:
+                columns[name][rows >= 0] = previous[name][rows[rows >= 0]]
+    missing = np.flatnonzero(rows < 0)
+    if len(missing):
+        computed = data.select(missing).map(partial(svg_facts, tokenizer=tokenizer, im_size=im_size, column=column),
+                                            batched=True, batch_size=batch_size, num_proc=num_proc,
+                                            remove_columns=data.column_names, desc="Indexing SVGs")
+        for name in FACTS:
+            columns[name][missing] = np.asarray(computed[name])
+
+    model_names = data['model_name'] if 'model_name' in data.column_names else [None] * len(data)
+    table = pa.table({'svg_hash': hashes, 'model_name': pa.array(model_names, type=pa.string()), **columns})
+    table = table.replace_schema_metadata({METADATA_KEY: json.dumps(metadata)})
+    tmp_path = path + '.tmp'
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return DatasetIndex(path), len(missing)
+
+def main(config):
+    from omegaconf import OmegaConf
+    from datasets import load_dataset
+    from starvector.data.pretokenize import load_svg_tokenizer
+
+    model_config = OmegaConf.load(config.config)
+    data_config = model_config.data[config.get('split', 'train')]
+    # The index covers the whole split, datasets filter and select their rows from it
+    data = load_dataset(data_config.params.dataset_name, split=data_config.params.split)
+    tokenizer_name = model_config.model.starcoder_model_name
+    tokenizer = load_svg_tokenizer(tokenizer_name)
+    index, num_processed = build_index(data, config.out, tokenizer=tokenizer, tokenizer_name=tokenizer_name,
+                                       im_size=data_config.params.im_size, num_proc=config.get('num_proc', None),
+                                       batch_size=config.get('batch_size', 256))
+    report = index.report()
+    report['num_processed'] = num_processed
+    print(json.dumps(report, indent=4))
+
+if __name__ == "__main__":
+    from omegaconf import OmegaConf
+
+    cli_conf = OmegaConf.from_cli()
+    if 'config' not in cli_conf or 'out' not in cli_conf:
+        raise ValueError("Usage: python -m starvector.data.dataset_index config=<model config yaml> out=<file.parquet> [split=train num_proc=None batch_size=256]")
+    main(cli_conf)
@@ -8,7 +8,7 @@ class EmojiSVGDataset(SVGDatasetBase):
 
         self.num_samples = num_samples
         if self.num_samples != -1:
-            self.data = self.data.select(range(self.num_samples))
+            self.select_rows(range(self.num_samples))
         
     def __len__(self):
         return len(self.data)
@@ -17,11 +17,11 @@ class EmojiSVGDataset(SVGDatasetBase):
        
         svg_str = self.data[idx]['Svg']
         sample_id = self.data[idx]['Filename']
-        svg, image = self.get_svg_and_image(svg_str, sample_id)
+        svg, image = self.get_svg_and_image(svg_str, sample_id, idx)
         caption = self.data[idx].get('Caption', "")
-        return {
+        return self.add_svg_input_ids({
             'svg': svg,
             'image': image,
             'id': sample_id,
             'caption': caption
-            }
\ No newline at end of file
+            }, idx)
\ No newline at end of file
@@ -9,7 +9,7 @@ class FigrSVGDataset(SVGDatasetBase):
 
         self.num_samples = num_samples
         if self.num_samples != -1:
-            self.data = self.data.select(range(self.num_samples))
+            self.select_rows(range(self.num_samples))
         
     def __len__(self):
         return len(self.data)
@@ -17,11 +17,11 @@ class FigrSVGDataset(SVGDatasetBase):
     def __getitem__(self, idx):
         svg_str = self.data[idx]['Svg']
         sample_id = self.data[idx]['Id']
-        svg, image = self.get_svg_and_image(svg_str, sample_id)
+        svg, image = self.get_svg_and_image(svg_str, sample_id, idx)
         caption = self.data[idx].get('Caption', "")
-        return {
+        return self.add_svg_input_ids({
             'svg': svg,
             'image': image,
             'id': sample_id,
             'caption': caption
-            }
+            }, idx)
@@ -9,7 +9,7 @@ class SVGIconsDataset(SVGDatasetBase):
    
         self.num_samples = num_samples
         if self.num_samples != -1:
-            self.data = self.data.select(range(self.num_samples))
+            self.select_rows(range(self.num_samples))
 
         self.image_processor = kwargs.get('image_processor', None)
         if 'siglip' in self.image_processor:
@@ -28,11 +28,11 @@ class SVGIconsDataset(SVGDatasetBase):
        
         svg_str = self.data[idx]['Svg']
         sample_id = self.data[idx]['Filename']
-        svg, image = self.get_svg_and_image(svg_str, sample_id)
+        svg, image = self.get_svg_and_image(svg_str, sample_id, idx)
         caption = self.data[idx].get('Caption', "")
-        return {
+        return self.add_svg_input_ids({
             'svg': svg,
             'image': image,
             'id': sample_id,
             'caption': caption
-            }
+            }, idx)
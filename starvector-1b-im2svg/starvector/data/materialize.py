@@ -0,0 +1,272 @@
+import json
+import os
+import numpy as np
+
+# Sample flags
+OK = 0
+BLANK = 1
+INVALID = 2
+
+INDEX_FILE = 'index.json'
+FLAGS_FILE = 'flags.npy'
+SEEDS_FILE = 'seeds.npy'
+SVGS_FILE = 'svgs.bin'
+OFFSETS_FILE = 'svg_offsets.npy'
+
+class RasterStore:
+    """
+    Rasters written by `materialize`: uint8 [im_size, im_size, 3] images in memory-mapped .npy shards
+    of `shard_size` samples, and one flag per sample (OK, BLANK or INVALID; the raster of a flagged
+    sample is the placeholder's). Shards are mapped lazily in each process, so the store can be
+    pickled to DataLoader workers. Images are copy-on-write views of the mapping: reading one is
+    pure I/O and wrapping it in a tensor does not copy it.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.flags = np.load(os.path.join(path, FLAGS_FILE))
+        self.shard_size = self.index['shard_size']
+        self.im_size = self.index['im_size']
+        self._shards = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+        return state
+
+    def __len__(self):
+        return len(self.flags)
+
+    def _shard(self, k):
+        if k not in self._shards:
+            self._shards[k] = np.load(os.path.join(self.path, self.index['shards'][k]), mmap_mode='c')
+        return self._shards[k]
+
+    def __getitem__(self, idx):
+        shard, offset = divmod(idx, self.shard_size)
+        return self._shard(shard)[offset]
+
+    def flag(self, idx):
+        return int(self.flags[idx])
+
+    def check(self, num_samples, im_size, fingerprint=None):
+        """
+        Raise if the store was not materialized for a dataset of `num_samples` samples at `im_size`, or
+        from data with another `fingerprint` (same size but other samples or order). The fingerprint is
+        only compared when both the dataset's and the stored one are known.
+        """
+        if len(self) != num_samples or self.im_size != im_size:
+            raise ValueError(f"Rasters in {self.path} were materialized for {len(self)} samples at {self.im_size}px, "
+                             f"the dataset has {num_samples} samples at {im_size}px. Materialize it again.")
+        stored = self.index.get('fingerprint')
+        if fingerprint is not None and stored is not None and stored != fingerprint:
+            raise ValueError(f"Rasters in {self.path} were materialized from data with fingerprint {stored}, "
+                             f"the dataset's is {fingerprint}. Materialize it again.")
+
+    def report(self):
+        return {
+            'num_samples': len(self),
+            'im_size': self.im_size,
+            'num_blank': int((self.flags == BLANK).sum()),
+            'num_invalid': int((self.flags == INVALID).sum()),
+        }
+
+class VariantStore(RasterStore):
+    """
+    `RasterStore` of `num_variants` augmented variants per sample, written by `materialize_variants`:
+    row `idx * num_variants + k` holds the raster of the k-th variant of sample `idx`, whose SVG text
+    is kept in one memory-mapped file and whose seed is recorded in `seeds`.
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        self.num_variants = self.index['num_variants']
+        self.seeds = np.load(os.path.join(path, SEEDS_FILE))
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE))
+        self._svg_data = None
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['_svg_data'] = None
+        return state
+
+    def __len__(self):
+        return len(self.flags) // self.num_variants
+
+    def svg(self, row):
+        if self._svg_data is None:
+            self._svg_data = np.memmap(os.path.join(self.path, SVGS_FILE), dtype=np.uint8, mode='r') if self.offsets[-1] else b''
+        return bytes(self._svg_data[self.offsets[row]:self.offsets[row + 1]]).decode('utf-8')
+
+    def sample(self, idx):
+        """SVG and raster of a random valid variant of sample `idx`, None if none is valid"""
+        rows = idx * self.num_variants + np.flatnonzero(self.flags[idx * self.num_variants:(idx + 1) * self.num_variants] == OK)
+        if not len(rows):
+            return None
+        row = int(np.random.choice(rows))
+        return self.svg(row), self[row]
+
+    def report(self):
+        report = super().report()
+        report['num_variants'] = self.num_variants
+        return report
+
+def _dataset_svgs(dataset, batch_size):
+    """Batches of the dataset's SVGs, simplified as `get_svg_and_image` does"""
+    for start in range(0, len(dataset.data), batch_size):
+        svgs = dataset.data[start:start + batch_size]['Svg']
+        if dataset.simplifier is not None:
+            svgs = [dataset.simplifier(svg) for svg in svgs]
+        yield svgs
+
+def _write_rasters(svg_batches, num_rows, im_size, out_dir, shard_size):
+    """
+    Rasterize batches of SVGs (None for a sample that already failed) into .npy shards in `out_dir`.
+    Returns the shard file names and the flag of each row.
+    """
+    from PIL import Image
+    from starvector.data.rasterizer import get_rasterizer
+    from starvector.data.util import use_placeholder
+
+    rasterizer = get_rasterizer()
+    placeholder = np.asarray(rasterizer.rasterize(use_placeholder(), resolution=im_size))
+    flags = np.zeros(num_rows, dtype=np.uint8)
+    shards = []
+    shard = None
+    i = 0
+    for svgs in svg_batches:
+        valid = [svg for svg in svgs if svg is not None]
+        images, errors = rasterizer.rasterize_batch(valid, resolution=im_size, return_errors=True)
+        rendered = iter(zip(images, errors))
+        for svg in svgs:
+            k, offset = divmod(i, shard_size)
+            if offset == 0:
+                if shard is not None:
+                    shard.flush()
+                shards.append(f'shard-{k:05d}.npy')
+                size = min(shard_size, num_rows - i)
+                shard = np.lib.format.open_memmap(os.path.join(out_dir, shards[-1]), mode='w+', dtype=np.uint8, shape=(size, im_size, im_size, 3))
+            image, error = next(rendered) if svg is not None else (None, 'augmentation failed')
+            if error is not None:
+                flags[i] = INVALID
+                array = placeholder
+            else:
+                if image.size != (im_size, im_size):
+                    image = image.resize((im_size, im_size), Image.BICUBIC)
+                array = np.asarray(image)
+                if array.mean() == 255.0:
+                    flags[i] = BLANK
+                    array = placeholder
+            shard[offset] = array
+            i += 1
+    if shard is not None:
+        shard.flush()
+    if i != num_rows:
+        raise ValueError(f"Expected {num_rows} SVGs, got {i}")
+    return shards, flags
+
+def _write_index(out_dir, index, flags):
+    np.save(os.path.join(out_dir, FLAGS_FILE), flags)
+    tmp_path = os.path.join(out_dir, INDEX_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=4)
+    os.replace(tmp_path, os.path.join(out_dir, INDEX_FILE))
+
+def materialize(dataset, out_dir, shard_size=4096, batch_size=256):
+    """
+    Rasterize every SVG of `dataset` (an `SVGDatasetBase`, after its filtering, selection and
+    simplification) once at its `im_size`, and write a `RasterStore` to `out_dir`. Blank and
+    unrenderable SVGs are flagged and store the placeholder's raster, as `get_svg_and_image` would
+    substitute it. The index is written last, so an interrupted run leaves no readable store.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    num_samples = len(dataset.data)
+    shards, flags = _write_rasters(_dataset_svgs(dataset, batch_size), num_samples, dataset.im_size, out_dir, shard_size)
+    _write_index(out_dir, {
+        'num_samples': num_samples,
+        'im_size': dataset.im_size,
+        'shard_size': shard_size,
+        'shards': shards,
+        'fingerprint': getattr(dataset.data, '_fingerprint', None),
+    }, flags)
+    return RasterStore(out_dir)
+
+def variant_seed(seed, idx, k, num_variants):
+    """Seed of the k-th augmented variant of sample `idx`"""
+    return (seed * 1000003 + idx * num_variants + k) % 2**32
+
+def materialize_variants(dataset, out_dir, num_variants=4, seed=0, shard_size=4096, batch_size=256):
+    """
+    Pre-generate `num_variants` augmentations of every SVG of `dataset` with its `transforms`, each
+    from a recorded seed (`variant_seed`, see `SVGTransforms.reseed`), and write a `VariantStore`
+    with their SVG text and rasters to `out_dir`. Variants that fail to augment or render are flagged.
+    """
+    if dataset.transforms is None:
+        raise ValueError("The dataset has no transforms to generate variants with")
+    os.makedirs(out_dir, exist_ok=True)
+    num_rows = len(dataset.data) * num_variants
+    seeds = np.zeros(num_rows, dtype=np.uint32)
+    offsets = np.zeros(num_rows + 1, dtype=np.int64)
+
+    def variant_batches(svg_file):
+        row = 0
+        for svgs in _dataset_svgs(dataset, max(1, batch_size // num_variants)):
+            variants = []
+            for svg_str in svgs:
+                for k in range(num_variants):
+                    seeds[row] = variant_seed(seed, row // num_variants, k, num_variants)
+                    dataset.transforms.reseed(int(seeds[row]))
+                    try:
+                        svg, _ = dataset.transforms.augment(svg_str)
+                    except Exception as e:
+                        print(f"Error augmenting row {row} due to {str(e)}")
+                        svg = None
+                    data = svg.encode('utf-8') if svg is not None else b''
+                    svg_file.write(data)
+                    offsets[row + 1] = offsets[row] + len(data)
+                    variants.append(svg)
+                    row += 1
+            yield variants
+
+    with open(os.path.join(out_dir, SVGS_FILE), 'wb') as svg_file:
+        shards, flags = _write_rasters(variant_batches(svg_file), num_rows, dataset.im_size, out_dir, shard_size)
+    np.save(os.path.join(out_dir, SEEDS_FILE), seeds)
+    np.save(os.path.join(out_dir, OFFSETS_FILE), offsets)
+    _write_index(out_dir, {
+        'num_samples': len(dataset.data),
+        'num_variants': num_variants,
+        'seed': seed,
+        'p': dataset.p,
+        'im_size': dataset.im_size,
+        'shard_size': shard_size,
+        'shards': shards,
+        'fingerprint': getattr(dataset.data, '_fingerprint', None),
+    }, flags)
+    return VariantStore(out_dir)
+
+def main(config):
+    from omegaconf import OmegaConf
+    from starvector.util import instantiate_from_config
+
+    data_config = OmegaConf.load(config.config).data[config.get('split', 'train')]
+    num_variants = config.get('variants', 0)
+    data_config.params.materialized = False
+    data_config.params.augmented = False
+    if not num_variants:
+        # Rasters of the unaugmented SVGs
+        data_config.params.transforms = False
+    dataset = instantiate_from_config(data_config)
+    kwargs = {'shard_size': config.get('shard_size', 4096), 'batch_size': config.get('batch_size', 256)}
+    if num_variants:
+        store = materialize_variants(dataset, config.out_dir, num_variants=num_variants, seed=config.get('seed', 0), **kwargs)
+    else:
+        store = materialize(dataset, config.out_dir, **kwargs)
+    print(json.dumps(store.report(), indent=4))
+
+if __name__ == "__main__":
+    from omegaconf import OmegaConf
+
+    cli_conf = OmegaConf.from_cli()
+    if 'config' not in cli_conf or 'out_dir' not in cli_conf:
+        raise ValueError("Usage: python -m starvector.data.materialize config=<model config yaml> out_dir=<dir> [split=train shard_size=4096 batch_size=256 variants=0 seed=0]")
+    main(cli_conf)
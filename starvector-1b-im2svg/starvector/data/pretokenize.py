@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+from types import SimpleNamespace
+import numpy as np
+import torch
+from torch.utils.data import default_collate
+
+INDEX_FILE = 'index.json'
+TOKENS_FILE = 'svg_input_ids.bin'
+OFFSETS_FILE = 'token_offsets.npy'
+HASHES_FILE = 'svg_hashes.npy'
+
+def load_svg_tokenizer(starcoder_model_name):
+    """
+    Tokenizer of a StarVector model built on `starcoder_model_name`, with its special tokens, and the
+    end tokens `_get_svg_text` appends to the target SVGs (`<svg-end>` for StarCoder2, then EOS)
+    """
+    if 'starcoder2' in starcoder_model_name:
+        from starvector.model.llm.starcoder2 import StarCoderModel
+    else:
+        from starvector.model.llm.starcoder import StarCoderModel
+    # init_tokenizer only sets attributes, run it without building the LLM
+    llm = SimpleNamespace()
+    StarCoderModel.init_tokenizer(llm, starcoder_model_name)
+    return SVGTokenizer(llm.tokenizer, getattr(llm, 'svg_end_token', '') + llm.tokenizer.eos_token)
+
+def svg_hash(svg):
+    return int.from_bytes(hashlib.blake2b(svg.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class SVGTokenizer:
+    """Untruncated, unpadded int32 token ids of target SVGs followed by `suffix`, as `embed_im_to_svg` tokenizes them"""
+    def __init__(self, tokenizer, suffix):
+        self.tokenizer = tokenizer
+        self.suffix = suffix
+
+    def __call__(self, svgs):
+        input_ids = self.tokenizer([svg + self.suffix for svg in svgs])['input_ids']
+        return [np.asarray(ids, dtype=np.int32) for ids in input_ids]
+
+def truncate_token_ids(ids, max_length, truncation_side='right'):
+    """Token ids truncated to `max_length` as the tokenizer truncates them"""
+    if max_length is None or len(ids) <= max_length:
+        return ids
+    return ids[:max_length] if truncation_side == 'right' else ids[len(ids) - max_length:]
+
+def pad_token_ids(svg_input_ids, max_length, pad_token_id, padding_side='right', truncation_side='right'):
+    """
+    `input_ids` and `attention_mask` [batch_size, length] of token id sequences truncated to `max_length`
+    and padded to the longest, as the tokenizer returns them with `truncation=True, padding='longest'`
+    """
+    sequences = [truncate_token_ids(torch.as_tensor(ids, dtype=torch.long), max_length, truncation_side) for ids in svg_input_ids]
+    length = max(len(ids) for ids in sequences)
+    input_ids = torch.full((len(sequences), length), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), length), dtype=torch.long)
+    for i, ids in enumerate(sequences):
+        start = 0 if padding_side == 'right' else length - len(ids)
+        input_ids[i, start:start + len(ids)] = ids
+        attention_mask[i, start:start + len(ids)] = 1
+    return input_ids, attention_mask
+
+def collate_svg_batch(samples):
+    """`default_collate`, keeping the variable-length `svg_input_ids` of the samples as a list of tensors"""
+    if 'svg_input_ids' not in samples[0]:
+        return default_collate(samples)
+    svg_input_ids = [torch.from_numpy(sample.pop('svg_input_ids')) for sample in samples]
+    batch = default_collate(samples)
+    batch['svg_input_ids'] = svg_input_ids
+    return batch
+
+class TokenStore:
+    """
+    Token ids written by `pretokenize`: one flat memory-mapped int32 array with per-sample offsets,
+    and a hash of the SVG text each sample was tokenized from. Like `RasterStore`, the mapping is
+    opened lazily in each process.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE))
+        self.hashes = np.load(os.path.join(path, HASHES_FILE))
+        self._tokens = None
+        self._tokenizer = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_tokens'] = None
+        state['_tokenizer'] = None
+        return state
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __getitem__(self, idx):
+        if self._tokens is None:
+            self._tokens = np.memmap(os.path.join(self.path, TOKENS_FILE), dtype=np.int32, mode='r') if self.offsets[-1] else np.zeros(0, dtype=np.int32)
+        return np.array(self._tokens[self.offsets[idx]:self.offsets[idx + 1]])
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._tokenizer = load_svg_tokenizer(self.index['starcoder_model_name'])
+        return self._tokenizer
+
+    def get(self, idx, svg):
+        """Token ids of `svg` for sample `idx`: the stored ones if it is the text they were computed from, else tokenized here"""
+        if svg_hash(svg) == self.hashes[idx]:
+            return self[idx]
+        return self.tokenizer([svg])[0]
+
+    def check(self, num_samples, im_size=None, fingerprint=None):
+        """
+        Raise if the store was not written for a dataset of `num_samples` samples, or from data with
+        another `fingerprint` (compared when both are known). Rows whose SVG text changed since are
+        still caught by `get`, which compares the per-sample hashes.
+        """
+        if len(self) != num_samples:
+            raise ValueError(f"Token ids in {self.path} were computed for {len(self)} samples, "
+                             f"the dataset has {num_samples} samples. Pre-tokenize it again.")
+        stored = self.index.get('fingerprint')
+        if fingerprint is not None and stored is not None and stored != fingerprint:
+            raise ValueError(f"Token ids in {self.path} were computed from data with fingerprint {stored}, "
+                             f"the dataset's is {fingerprint}. Pre-tokenize it again.")
+
+    def report(self):
+        lengths = np.diff(self.offsets)
+        return {
+            'num_samples': len(self),
+            'num_tokens': int(lengths.sum()),
+            'max_tokens': int(lengths.max()) if len(lengths) else 0,
+            'starcoder_model_name': self.index['starcoder_model_name'],
+        }
+
+def pretokenize(dataset, out_dir, tokenizer, starcoder_model_name, batch_size=1024):
+    """
+    Tokenize the target SVG of every sample of `dataset` (an `SVGDatasetBase`, after its filtering,
+    selection and simplification) with `tokenizer` (an `SVGTokenizer`, see `load_svg_tokenizer`)
+    and write a `TokenStore` to `out_dir`. The index is written last.
+    """
+    from starvector.data.materialize import _dataset_svgs
+
+    os.makedirs(out_dir, exist_ok=True)
+    num_samples = len(dataset.data)
+    offsets = np.zeros(num_samples + 1, dtype=np.int64)
+    hashes = np.zeros(num_samples, dtype=np.uint64)
+    i = 0
+    with open(os.path.join(out_dir, TOKENS_FILE), 'wb') as f:
+        for svgs in _dataset_svgs(dataset, batch_size):
+            for svg, ids in zip(svgs, tokenizer(svgs)):
+                f.write(ids.tobytes())
+                offsets[i + 1] = offsets[i] + len(ids)
+                hashes[i] = svg_hash(svg)
+                i += 1
+    np.save(os.path.join(out_dir, OFFSETS_FILE), offsets)
+    np.save(os.path.join(out_dir, HASHES_FILE), hashes)
+    tmp_path = os.path.join(out_dir, INDEX_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'num_samples': num_samples,
+            'starcoder_model_name': starcoder_model_name,
+            'suffix': tokenizer.suffix,
+            'fingerprint': getattr(dataset.data, '_fingerprint', None),
+        }, f, indent=4)
+    os.replace(tmp_path, os.path.join(out_dir, INDEX_FILE))
+    return TokenStore(out_dir)
+
+def verify(store, dataset, tokenizer, max_length, num_samples=None, batch_size=8):
+    """
+    Check that padding the stored ids (`pad_token_ids`, the forward path of pre-tokenized batches)
+    gives exactly the input ids and attention masks, hence the targets, that tokenizing the batch in
+    the forward (`_tokenize`) gives. Returns the number of checked and mismatched batches.
+    """
+    from starvector.data.materialize import _dataset_svgs
+
+    hf_tokenizer = tokenizer.tokenizer
+    num_samples = len(store) if num_samples is None else min(num_samples, len(store))
+    checked = mismatched = 0
+    for k, svgs in enumerate(_dataset_svgs(dataset, batch_size)):
+        start = k * batch_size
+        if start >= num_samples:
+            break
+        svgs = svgs[:num_samples - start]
+        expected = hf_tokenizer([svg + tokenizer.suffix for svg in svgs], truncation=True, padding='longest', max_length=max_length, return_tensors='pt')
+        input_ids, attention_mask = pad_token_ids([store[start + i] for i in range(len(svgs))], max_length, hf_tokenizer.pad_token_id,
+                                                  hf_tokenizer.padding_side, hf_tokenizer.truncation_side)
+        checked += 1
+        if not (torch.equal(input_ids, expected.input_ids) and torch.equal(attention_mask, expected.attention_mask)):
+            mismatched += 1
+    return {'num_batches': checked, 'num_mismatched': mismatched}
+
+def main(config):
+    from omegaconf import OmegaConf
+    from starvector.util import instantiate_from_config
+
+    model_config = OmegaConf.load(config.config)
+    data_config = model_config.data[config.get('split', 'train')]
+    data_config.params.transforms = False
+    data_config.params.materialized = False
+    data_config.params.augmented = False
+    data_config.params.pretokenized = False
+    dataset = instantiate_from_config(data_config)
+    starcoder_model_name = model_config.model.starcoder_model_name
+    tokenizer = load_svg_tokenizer(starcoder_model_name)
+    store = pretokenize(dataset, config.out_dir, tokenizer, starcoder_model_name, batch_size=config.get('batch_size', 1024))
+    report = store.report()
+    num_verify = config.get('verify', 256)
+    if num_verify:
+        # max_length of the training forward is shorter by the visual tokens, any length exercises the truncation
+        report['verify'] = verify(store, dataset, tokenizer, model_config.model.max_length, num_samples=num_verify)
+    print(json.dumps(report, indent=4))
+
+if __name__ == "__main__":
+    from omegaconf import OmegaConf
+
+    cli_conf = OmegaConf.from_cli()
+    if 'config' not in cli_conf or 'out_dir' not in cli_conf:
+        raise ValueError("Usage: python -m starvector.data.pretokenize config=<model config yaml> out_dir=<dir> [split=train batch_size=1024 verify=256]")
+    main(cli_conf)
@@ -0,0 +1,428 @@
+import hashlib
+import io
+import os
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, CancelledError, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from PIL import Image
+
+BACKENDS = ['cairosvg', 'svglib']
+
+class RasterizationError(Exception):
+    pass
+
+class RasterizationTimeout(RasterizationError):
+    pass
+
+class _AlarmTimeout(BaseException):
+    # Not an Exception, so the backend fallbacks in `render_png` do not swallow it
+    pass
+
+def _raise_alarm_timeout(signum, frame):
+    raise _AlarmTimeout()
+
+def render_with_alarm(render_fn, timeout, svg_string, *args):
+    """
+    Call `render_fn`, interrupted with SIGALRM after `timeout` seconds when running on the main thread
+    of its process (pool workers, or the main thread of an inline rasterizer), so that a hung render
+    frees its process. A render stuck in cairo's C code is only interrupted once it returns to Python.
+    Raises `RasterizationTimeout`.
+    """
+    if not timeout or not hasattr(signal, 'setitimer') or threading.current_thread() is not threading.main_thread():
+        return render_fn(svg_string, *args)
+    previous = signal.signal(signal.SIGALRM, _raise_alarm_timeout)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return render_fn(svg_string, *args)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except _AlarmTimeout:
+        raise RasterizationTimeout(f"Rasterization timed out after {timeout}s") from None
+    finally:
+        signal.signal(signal.SIGALRM, previous if previous is not None else signal.SIG_DFL)
+
+def _render_cairosvg(svg_string, resolution, dpi, scale, background):
+    import cairosvg
+    return cairosvg.svg2png(
+        bytestring=svg_string.encode('utf-8'),
+        background_color=background,
+        output_width=resolution,
+        output_height=resolution,
+        dpi=dpi,
+        scale=scale)
+
+def _render_svglib(svg_string, resolution, dpi, scale, background):
+    # Pure-Python fallback (svglib + reportlab), slower and less complete than cairo
+    from svglib.svglib import svg2rlg
+    from reportlab.graphics import renderPM
+    from reportlab.lib import colors
+
+    drawing = svg2rlg(io.BytesIO(svg_string.encode('utf-8')))
+    if drawing is None or not drawing.width or not drawing.height:
+        raise RasterizationError("svglib could not parse the SVG")
+    drawing.scale(resolution / drawing.width, resolution / drawing.height)
+    drawing.width, drawing.height = resolution, resolution
+    return renderPM.drawToString(drawing, fmt='PNG', dpi=72, bg=colors.toColor(background).int_rgb())
+
+_RENDERERS = {'cairosvg': _render_cairosvg, 'svglib': _render_svglib}
+
+def render_png(svg_string, resolution, dpi, scale, background='white', backends=('cairosvg',)):
+    """
+    Render `svg_string` to PNG bytes, trying each backend in order. If every backend fails, the SVG is
+    repaired and rendered once more. Runs inside the pool workers.
+    """
+    errors = []
+    candidates = [svg_string]
+    for attempt, svg in enumerate(candidates):
+        for backend in backends:
+            try:
+                return _RENDERERS[backend](svg, resolution, dpi, scale, background)
+            except Exception as e:
+                errors.append(f"{backend}: {e}")
+        if attempt == 0:
+            from starvector.data.svg_repair import repair_svg, VALID
+            result = repair_svg(svg_string)
+            if result.status != VALID:
+                candidates.append(result.svg)
+    raise RasterizationError("; ".join(errors))
+
+class Rasterizer:
+    """
+    SVG rasterization service.
+
+    Rendering runs in a process pool so that a pathological SVG can be timed out and a crash in cairo
+    only takes down a worker. Every render is interrupted after `timeout` inside its worker (see
+    `render_with_alarm`), which frees the worker for the next job. A render stuck in C code past twice
+    the timeout, or a broken pool, has the pool discarded and recreated, and jobs that did not finish
+    are resubmitted. The pool is created lazily and per process id, so the service can be used from
+    forked DataLoader workers. With `num_workers=0`, or in a daemonic process (DataLoader workers can't
+    have children), rendering runs inline, without crash isolation; renders on the main thread are
+    still bounded by `timeout`.
+
+    Successful renders are stored in `cache` (a `RasterCache`) when one is given, and identical SVGs
+    in a batch are rendered once. Failed renders return a blank image (`on_error='blank'`) or raise `RasterizationError`
+    (`on_error='raise'`). `placeholder=True` restores the old behaviour of returning blank images
+    without rendering at all.
+    """
+    def __init__(self, num_workers=None, timeout=10.0, backends=('cairosvg', 'svglib'), placeholder=False, on_error='blank', max_attempts=2, cache=None):
+        for backend in backends:
+            if backend not in BACKENDS:
+                raise ValueError(f"Rasterization backend {backend} not supported. Available backends: {BACKENDS}")
+        self.num_workers = min(4, os.cpu_count() or 1) if num_workers is None else num_workers
+        self.timeout = timeout
+        self.backends = tuple(backends)
+        self.placeholder = placeholder
+        self.on_error = on_error
+        self.max_attempts = max_attempts
+        self.cache = cache
+        self._pool = None
+        self._pid = None
+        # Guards pool creation and teardown when sessions submit from several threads
+        self._lock = threading.Lock()
+        self.stats = {'rendered': 0, 'failed': 0, 'timeouts': 0, 'crashes': 0}
+
+    # Runs in the pool workers, so it must be a module-level function
+    render_fn = staticmethod(render_png)
+
+    def _inline(self):
+        return self.num_workers == 0 or multiprocessing.current_process().daemon
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                # A pool inherited through fork belongs to the parent, never reuse it
+                self._pool = ProcessPoolExecutor(self.num_workers, mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._pool
+
+    def _discard_pool(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        # Hung workers do not react to shutdown, terminate them
+        for process in list(getattr(pool, '_processes', {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _render_inline(self, svg_string, args, timeout=None):
+        """Render in this process, bounded by `timeout` (the rasterizer's by default) on the main thread"""
+        try:
+            return render_with_alarm(self.render_fn, timeout or self.timeout, svg_string, *args)
+        except RasterizationTimeout:
+            self.stats['timeouts'] += 1
+            raise
+
+    def shutdown(self):
+        """Terminate the pool, including hung workers; it is recreated on the next render"""
+        self._discard_pool()
+
+    def submit(self, svg_string, resolution=224, dpi=128, scale=2, background='white', timeout=None):
+        """
+        Submit a single render without waiting for it. The returned future resolves to PNG bytes or
+        raises `RasterizationError` (`RasterizationTimeout` when the render was interrupted after
+        `timeout`, the rasterizer's by default, in its worker). Not cached.
+        """
+        args = (resolution, dpi, scale, background, self.backends)
+        if not self._inline():
+            return self._get_pool().submit(render_with_alarm, self.render_fn, timeout or self.timeout, svg_string, *args)
+        future = Future()
+        try:
+            future.set_result(self._render_inline(svg_string, args, timeout))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _blank(self, resolution, background):
+        return Image.new('RGB', (resolution, resolution), color=background)
+
+    def rasterize(self, svg_string, resolution=224, dpi=128, scale=2, background='white'):
+        return self.rasterize_batch([svg_string], resolution=resolution, dpi=dpi, scale=scale, background=background)[0]
+
+    def rasterize_batch(self, svg_strings, resolution=224, dpi=128, scale=2, background='white', return_errors=False):
+        """
+        Rasterize a list of SVGs concurrently, returning RGB PIL images in the same order. With
+        `return_errors`, also returns the error message of each failed render (None for the others).
+        """
+        if self.placeholder:
+            images = [self._blank(resolution, background) for _ in svg_strings]
+            return (images, [None] * len(svg_strings)) if return_errors else images
+
+        pngs = [None] * len(svg_strings)
+        failures = [None] * len(svg_strings)
+        keys = [None] * len(svg_strings)
+        to_render = {}
+        for i, svg in enumerate(svg_strings):
+            if self.cache is not None:
+                keys[i] = self.cache.key(svg, resolution, dpi, scale, background, self.backends)
+                pngs[i] = self.cache.get(keys[i])
+            if pngs[i] is None:
+                # Identical SVGs in a batch are rendered once
+                to_render.setdefault(keys[i] or i, []).append(i)
+
+        jobs = [indices[0] for indices in to_render.values()]
+        rendered, errors = self._render_batch([svg_strings[i] for i in jobs], (resolution, dpi, scale, background, self.backends))
+        for indices, png, error in zip(to_render.values(), rendered, errors):
+            if png is None:
+                self.stats['failed'] += 1
+                if self.on_error == 'raise':
+                    raise RasterizationError(error)
+                for i in indices:
+                    failures[i] = error
+                continue
+            self.stats['rendered'] += 1
+            if self.cache is not None:
+                self.cache.put(keys[indices[0]], png)
+            for i in indices:
+                pngs[i] = png
+
+        images = [Image.open(io.BytesIO(png)).convert('RGB') if png is not None else self._blank(resolution, background) for png in pngs]
+        return (images, failures) if return_errors else images
+
+    def _render_batch(self, svg_strings, args):
+        """Render to PNG bytes; returns the PNGs (None on failure) and the error messages"""
+        results = [None] * len(svg_strings)
+        errors = [None] * len(svg_strings)
+
+        if self._inline():
+            for i, svg in enumerate(svg_strings):
+                try:
+                    results[i] = self._render_inline(svg, args)
+                except Exception as e:
+                    errors[i] = str(e)
+            return results, errors
+
+        crashes = [0] * len(svg_strings)
+        pending = list(range(len(svg_strings)))
+        while pending:
+            pool = self._get_pool()
+            # After a crash, jobs are resubmitted one at a time so that only the crashing one fails
+            submitted = pending[:1] if any(crashes[i] for i in pending) else pending
+            futures = {i: pool.submit(render_with_alarm, self.render_fn, self.timeout, svg_strings[i], *args) for i in submitted}
+
+            retry = pending[len(submitted):]
+            for n, i in enumerate(submitted):
+                try:
+                    # Jobs run concurrently, so this is measured from when the previous job was collected. The worker
+                    # interrupts the render after `timeout`, this only catches one stuck in C code
+                    results[i] = futures[i].result(timeout=2 * self.timeout if self.timeout else None)
+                except RasterizationTimeout as e:
+                    self.stats['timeouts'] += 1
+                    errors[i] = str(e)
+                except RasterizationError as e:
+                    errors[i] = str(e)
+                except FutureTimeoutError:
+                    self.stats['timeouts'] += 1
+                    errors[i] = f"Rasterization timed out after {2 * self.timeout}s"
+                    retry += self._recycle(futures, submitted[n + 1:], results, errors)
+                    break
+                except (BrokenProcessPool, CancelledError):
+                    # The pool crashed or was shut down by another thread. The crashing job is unknown: every unfinished job is retried up to `max_attempts` times
+                    self.stats['crashes'] += 1
+                    for j in submitted[n:]:
+                        crashes[j] += 1
+                    recycled = self._recycle(futures, submitted[n:], results, errors)
+                    for j in [j for j in recycled if crashes[j] >= self.max_attempts]:
+                        errors[j] = "Rasterization worker crashed"
+                        recycled.remove(j)
+                    retry += recycled
+                    break
+            pending = sorted(retry)
+        return results, errors
+
+    def _recycle(self, futures, indices, results, errors):
+        """Keep the results that finished before the pool is discarded and return the jobs to resubmit"""
+        finished = [j for j in indices if futures[j].done() and not futures[j].cancelled()]
+        self._discard_pool()
+        retry = [j for j in indices if j not in finished]
+        for j in finished:
+            error = futures[j].exception()
+            if error is None:
+                results[j] = futures[j].result()
+            elif isinstance(error, RasterizationError):
+                errors[j] = str(error)
+            else:
+                retry.append(j)
+        return sorted(retry)
+
+    def report(self):
+        report = dict(self.stats)
+        if self.cache is not None:
+            report.update(self.cache.report())
+        return report
+
+class RasterCache:
+    """
+    Content-addressed cache of rendered PNGs, keyed by (SVG hash, resolution, dpi, scale, background,
+    backends).
+
+    A memory tier keeps the most recently used PNGs up to `max_memory_bytes`. An optional disk tier
+    under `cache_dir` persists them across processes and runs (DataLoader workers, repeated validations).
+    The memory tier is shared by the threads of a process (e.g. streaming preview sessions) under a lock.
+    """
+    def __init__(self, max_memory_bytes=256 * 2**20, cache_dir=None):
+        self.max_memory_bytes = max_memory_bytes
+        self.cache_dir = cache_dir
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(svg_string, resolution, dpi, scale, background, backends=('cairosvg',)):
+        svg_hash = hashlib.sha1(svg_string.encode('utf-8')).hexdigest()
+        # Backends render differently, and a fallback backend may only succeed on the repaired SVG
+        return f"{svg_hash}_{resolution}_{dpi}_{scale}_{background}_{'-'.join(backends)}".replace('#', '')
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.png')
+
+    def get(self, key):
+        with self._lock:
+            png = self.memory.get(key)
+            if png is not None:
+                self.memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return png
+        if self.cache_dir:
+            path = self._path(key)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    png = f.read()
+                self._put_memory(key, png)
+                with self._lock:
+                    self.stats['disk_hits'] += 1
+                return png
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, key, png):
+        self._put_memory(key, png)
+        if self.cache_dir:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so concurrent readers never see a partial file (per thread, sessions share the cache)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+
+    def _put_memory(self, key, png):
+        with self._lock:
+            if key in self.memory:
+                return
+            self.memory[key] = png
+            self.memory_bytes += len(png)
+            while self.memory_bytes > self.max_memory_bytes and self.memory:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+            memory_entries, memory_bytes = len(self.memory), self.memory_bytes
+        lookups = sum(stats.values())
+        hits = stats['memory_hits'] + stats['disk_hits']
+        return {
+            **stats,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+            'memory_entries': memory_entries,
+            'memory_bytes': memory_bytes,
+        }
+
+_rasterizer = None
+# Process that built `_rasterizer` from the environment, None when it was set explicitly
+_rasterizer_pid = None
+
+def _in_dataloader_worker():
+    from torch.utils.data import get_worker_info
+    return get_worker_info() is not None
+
+def cache_from_env():
+    """
+    The `RasterCache` of this process from the environment. The memory tier is private to each process,
+    so it holds STARVECTOR_RASTER_CACHE_MB (256 by default, 0 disables it) in the main processes and
+    STARVECTOR_RASTER_WORKER_CACHE_MB (0 by default) in DataLoader workers, where it would otherwise be
+    multiplied by the number of workers and ranks. The disk tier (STARVECTOR_RASTER_CACHE_DIR) is shared
+    by all of them. None when both tiers are off.
+    """
+    if _in_dataloader_worker():
+        cache_mb = float(os.environ.get('STARVECTOR_RASTER_WORKER_CACHE_MB', 0))
+    else:
+        cache_mb = float(os.environ.get('STARVECTOR_RASTER_CACHE_MB', 256))
+    cache_dir = os.environ.get('STARVECTOR_RASTER_CACHE_DIR')
+    if cache_mb <= 0 and not cache_dir:
+        return None
+    return RasterCache(int(max(cache_mb, 0) * 2**20), cache_dir)
+
+def get_rasterizer():
+    """
+    Process-wide rasterizer, configured with STARVECTOR_RASTER_WORKERS, STARVECTOR_RASTER_TIMEOUT,
+    STARVECTOR_RASTER_BACKENDS (comma separated) and STARVECTOR_RASTER_PLACEHOLDER=1 (blank images,
+    no rendering), with the cache of `cache_from_env`. A process forked from the one that built it (a
+    DataLoader worker) builds its own instead of growing a copy of the parent's cache.
+    """
+    global _rasterizer, _rasterizer_pid
+    if _rasterizer is None or (_rasterizer_pid is not None and _rasterizer_pid != os.getpid()):
+        num_workers = os.environ.get('STARVECTOR_RASTER_WORKERS')
+        _rasterizer = Rasterizer(
+            num_workers=int(num_workers) if num_workers is not None else None,
+            timeout=float(os.environ.get('STARVECTOR_RASTER_TIMEOUT', 10.0)),
+            backends=tuple(os.environ.get('STARVECTOR_RASTER_BACKENDS', 'cairosvg,svglib').split(',')),
+            placeholder=os.environ.get('STARVECTOR_RASTER_PLACEHOLDER', '0') == '1',
+            cache=cache_from_env(),
+        )
+        _rasterizer_pid = os.getpid()
+    return _rasterizer
+
+def set_rasterizer(rasterizer):
+    global _rasterizer, _rasterizer_pid
+    _rasterizer = rasterizer
+    _rasterizer_pid = None
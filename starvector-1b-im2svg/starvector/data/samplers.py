@@ -0,0 +1,220 @@
+import math
+import numpy as np
+from torch.utils.data import Sampler
+
+def token_lengths(data, tokenizer=None, column='Svg', chars_per_token=3.0, num_proc=None):
+    """
+    Token length of every sample of a HF dataset. A `num_tokens` column is used when the dataset has
+    one; otherwise the `column` texts are tokenized with `datasets.map`, which caches the result next
+    to the dataset, so the lengths are computed once. Without a tokenizer, lengths are estimated from
+    the text length (`chars_per_token`).
+    """
+    if 'num_tokens' in data.column_names:
+        return np.asarray(data['num_tokens'], dtype=np.int64)
+    if tokenizer is None:
+        counted = data.map(lambda batch: {'num_tokens': [math.ceil(len(text) / chars_per_token) for text in batch[column]]},
+                           batched=True, num_proc=num_proc, desc="Estimating token lengths")
+    else:
+        counted = data.map(lambda batch: {'num_tokens': [len(ids) for ids in tokenizer(batch[column])['input_ids']]},
+                           batched=True, num_proc=num_proc, desc="Counting tokens")
+    return np.asarray(counted['num_tokens'], dtype=np.int64)
+
+def padding_efficiency(lengths, batches, max_length=None):
+    """Real tokens / padded tokens of `batches` (lists of indices) padded to their longest sample"""
+    lengths = np.asarray(lengths)
+    if max_length is not None:
+        lengths = np.minimum(lengths, max_length)
+    real = padded = 0
+    for batch in batches:
+        batch_lengths = lengths[batch]
+        real += int(batch_lengths.sum())
+        padded += int(batch_lengths.max()) * len(batch)
+    return real / padded if padded else 1.0
+
+def _check_state(state, seed, num_samples):
+    if state['seed'] != seed or state['num_samples'] != num_samples:
+        raise ValueError(f"Sampler state of seed {state['seed']} over {state['num_samples']} samples, "
+                         f"resuming with seed {seed} over {num_samples}")
+
+def resume_epoch(data_state, global_step, num_update_steps_per_epoch):
+    """
+    Epoch to resume training in. It is recorded in the data state (of a sampler or a streamed dataset):
+    counting it from `global_step` is only a fallback for checkpoints without one, since
+    `num_update_steps_per_epoch` is measured on the dataloader before it is sharded over the processes.
+    """
+    if data_state is not None:
+        return data_state['epoch']
+    return global_step // num_update_steps_per_epoch
+
+def set_train_epoch(epoch, dataloader, sampler=None, dataset=None, resumed=False):
+    """
+    Start `epoch` of the training loop. A streamed `dataset` is set directly, since its dataloader is not
+    prepared by accelerate, except in the epoch a `resumed` stream restored (`load_state_dict` set it).
+    A `sampler` is set directly as well: accelerate does not reach a batch sampler it wraps in a
+    `BatchSamplerShard`. The prepared `dataloader` gets the epoch too, since it sets it again from its
+    own counter whenever it is iterated; a resumed process would otherwise restart the sampler in epoch 0.
+    """
+    if dataset is not None:
+        if not resumed:
+            dataset.set_epoch(epoch)
+        return
+    sampler.set_epoch(epoch)
+    dataloader.set_epoch(epoch)
+
+class ResumableSampler(Sampler):
+    """
+    Indices of a map-style dataset in a random order seeded with `seed` and the epoch (see `set_epoch`),
+    so that every process draws the same order and accelerate splits its batches between them.
+
+    Pass the number of batches consumed by the training loop (over all processes) to `update_state`:
+    `state_dict` / `load_state_dict` restart the epoch at the first unconsumed index, without loading
+    the consumed samples. The length stays that of a full epoch, for the schedules computed from it.
+    """
+    def __init__(self, num_samples, batch_size, shuffle=True, seed=0):
+        self.num_samples = num_samples
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.offset = 0
+
+    def set_epoch(self, epoch):
+        if epoch != self.epoch:
+            self.offset = 0
+        self.epoch = epoch
+
+    def update_state(self, num_batches):
+        """Record `num_batches` batches consumed by the training loop"""
+        self.offset = min(self.offset + num_batches * self.batch_size, self.num_samples)
+
+    def state_dict(self):
+        return {'epoch': self.epoch, 'seed': self.seed, 'offset': self.offset, 'num_samples': self.num_samples}
+
+    def load_state_dict(self, state):
+        _check_state(state, self.seed, self.num_samples)
+        self.epoch = state['epoch']
+        self.offset = state['offset']
+
+    def indices(self):
+        """The indices of the current epoch, consumed ones included"""
+        if not self.shuffle:
+            return np.arange(self.num_samples)
+        return np.random.default_rng(self.seed + self.epoch).permutation(self.num_samples)
+
+    def __iter__(self):
+        yield from self.indices()[self.offset:].tolist()
+
+    def __len__(self):
+        return self.num_samples
+
+class BucketBatchSampler(Sampler):
+    """
+    Batches of similar token length, so that padding to the longest sample of a batch wastes little.
+
+    Every epoch the indices are shuffled and cut into buckets of `batch_size * bucket_size_multiplier`
+    samples; each bucket is sorted by length and cut into batches, and the batches of all buckets are
+    shuffled, so batches stay random in composition and order. Without `shuffle`, samples are sorted
+    by length globally (for validation). With `num_replicas` > 1 every replica builds the same batches
+    (seeded with `seed` and the epoch, see `set_epoch`) and takes every `num_replicas`-th one, padded
+    by repetition to the same count, as `DistributedSampler` does. Leave `num_replicas` at 1 when the
+    dataloader is sharded by accelerate, which splits the batches itself.
+
+    Like `ResumableSampler`, `update_state` / `state_dict` / `load_state_dict` resume an epoch at the
+    first unconsumed batch.
+    """
+    def __init__(self, lengths, batch_size, shuffle=True, drop_last=False, bucket_size_multiplier=100, num_replicas=1, rank=0, seed=0, max_length=None):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.bucket_size = batch_size * bucket_size_multiplier
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.max_length = max_length
+        self.epoch = 0
+        self.offset = 0
+
+    def set_epoch(self, epoch):
+        if epoch != self.epoch:
+            self.offset = 0
+        self.epoch = epoch
+
+    def update_state(self, num_batches):
+        """Record `num_batches` batches consumed by the training loop (over all replicas)"""
+        self.offset += num_batches
+
+    def state_dict(self):
+        return {'epoch': self.epoch, 'seed': self.seed, 'offset': self.offset, 'num_samples': len(self.lengths)}
+
+    def load_state_dict(self, state):
+        _check_state(state, self.seed, len(self.lengths))
+        self.epoch = state['epoch']
+        self.offset = state['offset']
+
+    def _split(self, indices):
+        batches = [indices[i:i + self.batch_size] for i in range(0, len(indices), self.batch_size)]
+        if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+            batches = batches[:-1]
+        return batches
+
+    def _random_batches(self, rng):
+        return self._split(rng.permutation(len(self.lengths)))
+
+    def batches(self):
+        """The batches of the current epoch, for all replicas"""
+        if not self.shuffle:
+            return self._split(np.argsort(self.lengths, kind='stable'))
+        rng = np.random.default_rng(self.seed + self.epoch)
+        indices = rng.permutation(len(self.lengths))
+        batches = []
+        for start in range(0, len(indices), self.bucket_size):
+            bucket = indices[start:start + self.bucket_size]
+            batches.extend(self._split(bucket[np.argsort(self.lengths[bucket], kind='stable')]))
+        return [batches[i] for i in rng.permutation(len(batches))]
+
+    def __iter__(self):
+        batches = self.batches()
+        if self.num_replicas > 1:
+            total = math.ceil(len(batches) / self.num_replicas) * self.num_replicas
+            batches = (batches * math.ceil(total / max(len(batches), 1)))[:total]
+            batches = batches[self.rank::self.num_replicas]
+        for batch in batches[self.offset // self.num_replicas:]:
+            yield batch.tolist()
+
+    def __len__(self):
+        num_samples = len(self.lengths)
+        if self.shuffle:
+            # Every bucket ends with its own partial batch
+            num_batches = 0
+            for start in range(0, num_samples, self.bucket_size):
+                size = min(self.bucket_size, num_samples - start)
+                num_batches += size // self.batch_size if self.drop_last else math.ceil(size / self.batch_size)
+        else:
+            num_batches = num_samples // self.batch_size if self.drop_last else math.ceil(num_samples / self.batch_size)
+        return math.ceil(num_batches / self.num_replicas)
+
+    def report(self):
+        """Padding efficiency (real / padded tokens) of random batches of the same size, and of these batches"""
+        rng = np.random.default_rng(self.seed + self.epoch)
+        return {
+            'padding_efficiency_random': padding_efficiency(self.lengths, self._random_batches(rng), self.max_length),
+            'padding_efficiency_bucketed': padding_efficiency(self.lengths, self.batches(), self.max_length),
+        }
+
+def get_batch_sampler(data, batch_size, bucketing, shuffle, tokenizer=None, max_length=None, column='Svg', lengths=None):
+    """
+    `BucketBatchSampler` over a HF dataset configured by a `bucketing` config (False to disable, or
+    {bucket_size_multiplier, seed, drop_last, num_proc}), None when bucketing is disabled. Token
+    `lengths` read from a dataset index are used instead of counting them.
+    """
+    if not bucketing:
+        return None
+    bucketing = dict(bucketing) if not isinstance(bucketing, bool) else {}
+    if lengths is None:
+        lengths = token_lengths(data, tokenizer, column=column, num_proc=bucketing.get('num_proc'))
+    return BucketBatchSampler(lengths, batch_size, shuffle=shuffle,
+                              drop_last=bucketing.get('drop_last', False),
+                              bucket_size_multiplier=bucketing.get('bucket_size_multiplier', 100),
+                              seed=bucketing.get('seed', 0),
+                              max_length=max_length)
@@ -0,0 +1,426 @@
+import re
+import numpy as np
+from lxml import etree
+from svgpathtools import Path, Line, CubicBezier, QuadraticBezier, Arc
+from starvector.data import svg_path
+from starvector.data.svg_path import serialize_path, format_number
+from starvector.data.svg_minify import coordinate_decimals, viewbox_extent
+
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+# Bernstein basis of a cubic at parameter values t, shape [len(t), 4]
+def _bernstein(t):
+    t = np.asarray(t, dtype=np.float64)[:, None]
+    return np.hstack([(1 - t) ** 3, 3 * t * (1 - t) ** 2, 3 * t ** 2 * (1 - t), t ** 3])
+
+def _dot(a, b):
+    return (np.conj(a) * b).real
+
+def _normalize(v):
+    norm = np.abs(v)
+    return v / norm if norm > 0 else v
+
+def cubic_control_points(segments):
+    """Control points of Line/QuadraticBezier/CubicBezier segments, degree-elevated to cubics: [S, 4] complex"""
+    points = np.empty((len(segments), 4), dtype=np.complex128)
+    for i, segment in enumerate(segments):
+        b = segment.bpoints()
+        if len(b) == 2:
+            points[i] = [b[0], b[0] + (b[1] - b[0]) / 3, b[0] + 2 * (b[1] - b[0]) / 3, b[1]]
+        elif len(b) == 3:
+            points[i] = [b[0], b[0] + 2 * (b[1] - b[0]) / 3, b[2] + 2 * (b[1] - b[2]) / 3, b[2]]
+        else:
+            points[i] = b
+    return points
+
+def _end_tangents(control_points):
+    """Unit tangents at the start and at the end of each cubic, skipping coincident control points"""
+    p = control_points
+    start = np.where(p[:, 1] != p[:, 0], p[:, 1] - p[:, 0], np.where(p[:, 2] != p[:, 0], p[:, 2] - p[:, 0], p[:, 3] - p[:, 0]))
+    end = np.where(p[:, 3] != p[:, 2], p[:, 3] - p[:, 2], np.where(p[:, 3] != p[:, 1], p[:, 3] - p[:, 1], p[:, 3] - p[:, 0]))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        start = np.nan_to_num(start / np.abs(start))
+        end = np.nan_to_num(end / np.abs(end))
+    return start, end
+
+def rdp(points, tolerance):
+    """
+    Ramer-Douglas-Peucker reduction of a polyline ([N] complex). Returns the indices of the kept points.
+    Iterative, with the point-to-chord distances of each span computed in one vectorized step.
+    """
+    n = len(points)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        chord = points[last] - points[first]
+        offsets = points[first + 1:last] - points[first]
+        if abs(chord) > 0:
+            distances = np.abs((np.conj(chord) * offsets).imag) / abs(chord)
+        else:
+            distances = np.abs(offsets)
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            split = first + 1 + i
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+def fit_cubic(points, tangent_start, tangent_end, tolerance, depth=0):
+    """Least-squares cubic fit with fixed end tangents, split at the point of maximum error (Schneider)"""
+    p0, p3 = points[0], points[-1]
+    if len(points) == 2 or depth > 12:
+        alpha = abs(p3 - p0) / 3
+        return [np.array([p0, p0 + alpha * tangent_start, p3 + alpha * tangent_end, p3])]
+
+    # Chord-length parameterization
+    u = np.concatenate([[0.0], np.cumsum(np.abs(np.diff(points)))])
+    u = u / u[-1] if u[-1] > 0 else np.linspace(0, 1, len(points))
+    basis = _bernstein(u)
+    a1 = basis[:, 1] * tangent_start
+    a2 = basis[:, 2] * tangent_end
+    rest = points - (basis[:, 0] + basis[:, 1]) * p0 - (basis[:, 2] + basis[:, 3]) * p3
+    c = np.array([[_dot(a1, a1).sum(), _dot(a1, a2).sum()], [_dot(a1, a2).sum(), _dot(a2, a2).sum()]])
+    x = np.array([_dot(a1, rest).sum(), _dot(a2, rest).sum()])
+    det = np.linalg.det(c)
+    chord = abs(p3 - p0)
+    alpha1 = alpha2 = chord / 3
+    if abs(det) > 1e-12:
+        alpha1, alpha2 = np.linalg.solve(c, x)
+        if alpha1 < 1e-6 * chord or alpha2 < 1e-6 * chord:
+            alpha1 = alpha2 = chord / 3
+    control = np.array([p0, p0 + alpha1 * tangent_start, p3 + alpha2 * tangent_end, p3])
+
+    errors = np.abs(basis @ control - points)
+    split = int(np.argmax(errors))
+    if errors[split] <= tolerance:
+        return [control]
+    split = min(max(split, 1), len(points) - 2)
+    tangent_center = _normalize(points[split - 1] - points[split + 1])
+    return (fit_cubic(points[:split + 1], tangent_start, tangent_center, tolerance, depth + 1)
+            + fit_cubic(points[split:], -tangent_center, tangent_end, tolerance, depth + 1))
+
+class PathSimplifier:
+    """
+    Tolerance-driven simplification of svgpathtools `Path` objects.
+
+    Each continuous subpath is split into runs of lines, runs of Bezier curves and arcs (kept as is).
+    Line runs are reduced with Ramer-Douglas-Peucker. Curve runs are split at corners (tangent angle
+    above `corner_angle` degrees); each smooth piece is sampled (all control points evaluated in one
+    matrix product) and refit with as few cubics as stay within `tolerance`, keeping the original
+    segments when the refit is not shorter. `tolerance` is in user units.
+    """
+    def __init__(self, tolerance, refit=True, corner_angle=30.0, samples_per_segment=8):
+        self.tolerance = tolerance
+        self.refit = refit
+        self.corner_cos = np.cos(np.radians(corner_angle))
+        self.samples = samples_per_segment
+
+    def __call__(self, path):
+        return self.simplify(path)
+
+    def simplify(self, path):
+        segments = []
+        for subpath in self._subpaths(path):
+            for kind, run in self._runs(subpath):
+                if kind == 'line':
+                    segments.extend(self._simplify_lines(run))
+                elif kind == 'curve' and self.refit:
+                    segments.extend(self._simplify_curves(run))
+                else:
+                    segments.extend(run)
+        return Path(*segments)
+
+    @staticmethod
+    def _subpaths(path):
+        subpath = []
+        for segment in path:
+            if subpath and segment.start != subpath[-1].end:
+                yield subpath
+                subpath = []
+            subpath.append(segment)
+        if subpath:
+            yield subpath
+
+    @staticmethod
+    def _runs(subpath):
+        run, kind = [], None
+        for segment in subpath:
+            segment_kind = 'line' if isinstance(segment, Line) else 'curve' if isinstance(segment, (QuadraticBezier, CubicBezier)) else 'other'
+            if run and (segment_kind != kind or kind == 'other'):
+                yield kind, run
+                run = []
+            run.append(segment)
+            kind = segment_kind
+        if run:
+            yield kind, run
+
+    def _simplify_lines(self, run):
+        vertices = np.array([run[0].start] + [segment.end for segment in run])
+        kept = vertices[rdp(vertices, self.tolerance)]
+        return [Line(a, b) for a, b in zip(kept[:-1], kept[1:])]
+
+    def _simplify_curves(self, run):
+        control_points = cubic_control_points(run)
+        tangent_start, tangent_end = _end_tangents(control_points)
+        # Corners between consecutive segments split the run into smooth pieces
+        corners = np.flatnonzero(_dot(tangent_end[:-1], tangent_start[1:]) < self.corner_cos) + 1
+        bounds = np.concatenate([[0], corners, [len(run)]])
+
+        # Samples of every segment in one product: [S, samples + 1]
+        t = np.linspace(0, 1, self.samples + 1)
+        samples = control_points @ _bernstein(t).T
+
+        out = []
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            if last - first < 2:
+                out.extend(run[first:last])
+                continue
+            # Junction points are shared between consecutive segments
+            points = np.concatenate([samples[first, :1], samples[first:last, 1:].ravel()])
+            fitted = fit_cubic(points, tangent_start[first], -tangent_end[last - 1], self.tolerance)
+            if len(fitted) < last - first:
+                out.extend(CubicBezier(*control) for control in fitted)
+            else:
+                out.extend(run[first:last])
+        return out
+
+def parse_subpaths(d):
+    """
+    Subpaths of path data as `(Path, closed)`, `closed` telling whether the subpath ends with `Z`. The
+    segments are the ones `svgpathtools.parse_path` builds (see `augmentation.pack_path`), but from
+    `svg_path.parse_path`, which keeps where each subpath is closed. Subpaths without segments (a lone
+    moveto) are dropped. Returns None if the path data is malformed or truncated.
+    """
+    segments = svg_path.parse_path(d)
+    if segments is None:
+        return None
+    subpaths = []
+    run = []
+    current = start = 0j
+    previous = None
+    last_control = None
+    for command, args in segments:
+        if command in ('M', 'Z'):
+            if command == 'Z' and current != start:
+                run.append(Line(current, start))
+            if run:
+                subpaths.append((Path(*run), command == 'Z'))
+            run = []
+            current = start = complex(args[0], args[1]) if command == 'M' else start
+        elif command in ('L', 'H', 'V'):
+            end = (complex(args[0], current.imag) if command == 'H'
+                   else complex(current.real, args[0]) if command == 'V'
+                   else complex(args[0], args[1]))
+            run.append(Line(current, end))
+            current = end
+        elif command in ('C', 'S'):
+            if command == 'C':
+                control1 = complex(args[0], args[1])
+                args = args[2:]
+            else:
+                control1 = 2 * current - last_control if previous in ('C', 'S') else current
+            control2, end = complex(args[0], args[1]), complex(args[2], args[3])
+            run.append(CubicBezier(current, control1, control2, end))
+            last_control = control2
+            current = end
+        elif command in ('Q', 'T'):
+            if command == 'Q':
+                control = complex(args[0], args[1])
+                args = args[2:]
+            else:
+                control = 2 * current - last_control if previous in ('Q', 'T') else current
+            end = complex(args[0], args[1])
+            run.append(QuadraticBezier(current, control, end))
+            last_control = control
+            current = end
+        else:
+            radius, end = complex(args[0], args[1]), complex(args[5], args[6])
+            if radius.real == 0 or radius.imag == 0:
+                run.append(Line(current, end))
+            elif end != current:
+                # An arc ending where it starts is not drawn
+                run.append(Arc(current, complex(abs(radius.real), abs(radius.imag)), args[2], bool(args[3]), bool(args[4]), end))
+            current = end
+        previous = command
+    if run:
+        subpaths.append((Path(*run), False))
+    return subpaths
+
+def path_to_segments(path, closed=False):
+    """
+    Absolute `(command, args)` segments of an svgpathtools `Path`, for `serialize_path`. A `closed`
+    path is one subpath ending with `Z`, which replaces its closing line.
+    """
+    if closed and len(path) > 1 and isinstance(path[-1], Line) and path[-1].end == path[0].start:
+        path = Path(*path[:-1])
+    segments = []
+    current = None
+    for segment in path:
+        if current is None or segment.start != current:
+            segments.append(('M', [segment.start.real, segment.start.imag]))
+        if isinstance(segment, Line):
+            segments.append(('L', [segment.end.real, segment.end.imag]))
+        elif isinstance(segment, QuadraticBezier):
+            segments.append(('Q', [segment.control.real, segment.control.imag, segment.end.real, segment.end.imag]))
+        elif isinstance(segment, CubicBezier):
+            segments.append(('C', [c for point in segment.bpoints()[1:] for c in (point.real, point.imag)]))
+        elif isinstance(segment, Arc):
+            segments.append(('A', [segment.radius.real, segment.radius.imag, segment.rotation,
+                                   int(segment.large_arc), int(segment.sweep), segment.end.real, segment.end.imag]))
+        current = segment.end
+    if closed:
+        segments.append(('Z', []))
+    return segments
+
+class SVGSimplifier:
+    """
+    Geometry simplification of whole SVG documents: `<path>` data goes through a `PathSimplifier`, one
+    subpath at a time so closed subpaths keep their `Z`, and `<polyline>`/`<polygon>` points through
+    Ramer-Douglas-Peucker. `tolerance` is a fraction of the viewBox extent, and the simplified path data
+    is written with `precision` significant digits of it. A path is only rewritten when the result is
+    shorter and not empty.
+
+    Simplification is lossy by design. With `verify`, calling the simplifier checks the result with a
+    raster diff against the input, as `SVGMinifier` does, and keeps the input when the diff exceeds
+    `max_raster_diff` or either side fails to render. Counts are kept in `stats`.
+    """
+    def __init__(self, tolerance=0.002, refit=True, corner_angle=30.0, precision=4, verify=False, max_raster_diff=0.005,
+                 verify_resolution=512, verify_dpi=100, verify_scale=1):
+        self.tolerance = tolerance
+        self.refit = refit
+        self.corner_angle = corner_angle
+        self.precision = precision
+        self.verify = verify
+        self.max_raster_diff = max_raster_diff
+        self.verify_args = dict(resolution=verify_resolution, dpi=verify_dpi, scale=verify_scale)
+        self.parser = etree.XMLParser(huge_tree=True, resolve_entities=False, no_network=True)
+        self.stats = {'num_svgs': 0, 'rejected': 0, 'unverified': 0}
+
+    def __call__(self, svg_text):
+        simplified = self.simplify(svg_text)
+        self.stats['num_svgs'] += 1
+        if self.verify and simplified != svg_text:
+            from starvector.data.util import raster_diff
+            from starvector.data.rasterizer import RasterizationError
+            try:
+                if raster_diff(svg_text, simplified, **self.verify_args) > self.max_raster_diff:
+                    self.stats['rejected'] += 1
+                    return svg_text
+            except RasterizationError:
+                # A render failure is not evidence that the two SVGs look the same
+                self.stats['unverified'] += 1
+                return svg_text
+        return simplified
+
+    def simplify(self, svg_text):
+        """Simplified SVG text, without verification; unparseable input is returned unchanged"""
+        try:
+            root = etree.fromstring(svg_text.encode('utf-8'), self.parser)
+        except (etree.XMLSyntaxError, ValueError):
+            return svg_text
+        decimals = coordinate_decimals(root, self.precision)
+        simplifier = PathSimplifier(self.tolerance * viewbox_extent(root), refit=self.refit, corner_angle=self.corner_angle)
+
+        for element in root.iter('{*}path', '{*}polyline', '{*}polygon'):
+            name = etree.QName(element).localname
+            if name == 'path':
+                d = element.get('d')
+                if not d:
+                    continue
+                try:
+                    subpaths = parse_subpaths(d)
+                    if not subpaths:
+                        continue
+                    segments = [segment for subpath, closed in subpaths for segment in path_to_segments(simplifier(subpath), closed)]
+                except Exception:
+                    continue
+                simplified = serialize_path(segments, decimals)
+                if simplified and len(simplified) < len(d):
+                    element.set('d', simplified)
+            else:
+                numbers = [float(n) for n in _NUMBER_RE.findall(element.get('points', ''))]
+                if len(numbers) < 6 or len(numbers) % 2:
+                    continue
+                points = np.array(numbers[0::2]) + 1j * np.array(numbers[1::2])
+                if name == 'polygon':
+                    # Close the ring so the last edge is simplified too
+                    kept = points[rdp(np.append(points, points[0]), simplifier.tolerance)][:-1]
+                    kept = kept if len(kept) >= 3 else points
+                else:
+                    kept = points[rdp(points, simplifier.tolerance)]
+                if len(kept) < len(points):
+                    element.set('points', ' '.join(f"{format_number(p.real, decimals)},{format_number(p.imag, decimals)}" for p in kept))
+        return etree.tostring(root, encoding='unicode')
+
+    def report(self):
+        return {f'simplify_{key}': value for key, value in self.stats.items()}
+
+def tradeoff_report(svgs, tolerances, tokenizer=None, refit=True, resolution=512):
+    """
+    Token count (or byte count without a tokenizer) and raster error of a corpus simplified at each
+    tolerance, to pick the operating point.
+    """
+    from starvector.data.util import raster_diff
+    from starvector.data.rasterizer import RasterizationError
+
+    def diff(a, b):
+        try:
+            return raster_diff(a, b, resolution=resolution)
+        except RasterizationError:
+            return None
+
+    def count(svg):
+        return len(tokenizer.encode(svg)) if tokenizer is not None else len(svg.encode('utf-8'))
+
+    unit = 'tokens' if tokenizer is not None else 'bytes'
+    original = sum(count(svg) for svg in svgs)
+    report = {'num_svgs': len(svgs), f'original_{unit}': original, 'tolerances': {}}
+    for tolerance in tolerances:
+        simplifier = SVGSimplifier(tolerance=tolerance, refit=refit)
+        simplified = [simplifier(svg) for svg in svgs]
+        diffs = [diff(a, b) for a, b in zip(svgs, simplified) if a != b]
+        failed = sum(d is None for d in diffs)
+        diffs = [d for d in diffs if d is not None]
+        total = sum(count(svg) for svg in simplified)
+        report['tolerances'][str(tolerance)] = {
+            unit: total,
+            f'{unit}_ratio': total / original if original else 1.0,
+            'mean_raster_diff': float(np.mean(diffs)) if diffs else 0.0,
+            'max_raster_diff': float(np.max(diffs)) if diffs else 0.0,
+            'render_failures': failed,
+        }
+    return report
+
+def main(config):
+    import glob
+    import json
+    import os
+
+    files = sorted(glob.glob(os.path.join(config.corpus_dir, '**', config.get('pattern', '*.svg')), recursive=True))
+    if not files:
+        raise ValueError(f"No SVG files matching {config.get('pattern', '*.svg')} in {config.corpus_dir}")
+    svgs = []
+    for f in files:
+        with open(f, encoding='utf-8') as fp:
+            svgs.append(fp.read())
+    tokenizer = None
+    if config.get('tokenizer'):
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(config.tokenizer)
+    tolerances = config.get('tolerances', [0.0005, 0.001, 0.002, 0.005])
+    print(json.dumps(tradeoff_report(svgs, tolerances, tokenizer, refit=config.get('refit', True)), indent=4))
+
+if __name__ == "__main__":
+    from omegaconf import OmegaConf
+
+    cli_conf = OmegaConf.from_cli()
+    if 'corpus_dir' not in cli_conf:
+        raise ValueError("Usage: python -m starvector.data.simplify corpus_dir=<dir with SVGs> [tolerances=[0.001,0.002] tokenizer=bigcode/starcoderbase-1b refit=true]")
+    main(cli_conf)
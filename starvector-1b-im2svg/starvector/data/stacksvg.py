@@ -24,11 +24,11 @@ class SVGStackDataset(SVGDatasetBase):
         self.random_caption = kwargs.get('random_caption', True)
         select_dataset_name = kwargs.get('select_dataset_name', False)
         if select_dataset_name:
-            self.data = self.data.filter(lambda example: example["model_name"]==select_dataset_name)
+            self.select_model_name(select_dataset_name)
         
         self.num_samples = num_samples
         if self.num_samples != -1:
-            self.data = self.data.select(range(self.num_samples))
+            self.select_rows(range(self.num_samples))
 
         self.image_processor = kwargs.get('image_processor', None)
         if self.image_processor and 'siglip' in self.image_processor:
@@ -46,14 +46,14 @@ class SVGStackDataset(SVGDatasetBase):
     def __getitem__(self, idx):
         svg_str = self.data[idx]['Svg']
         sample_id = self.data[idx]['Filename']
-        svg, image = self.get_svg_and_image(svg_str, sample_id)
+        svg, image = self.get_svg_and_image(svg_str, sample_id, idx)
         
         # Randomly choose between 'caption_blip' and 'caption_llava'
         caption_column = random.choice(['caption_blip2', 'caption_llava'])
         caption = random.choice(text2svg_captions) + self.data[idx].get(caption_column, "")
-        return {
+        return self.add_svg_input_ids({
             'svg': svg,
             'image': image,
             'id': sample_id,
             'caption': caption,
-            }
+            }, idx)
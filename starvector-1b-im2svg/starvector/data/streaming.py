@@ -0,0 +1,171 @@
+import os
+import random
+import numpy as np
+import pyarrow.dataset as ds
+from torch.utils.data import IterableDataset, get_worker_info
+from transformers import AutoProcessor
+from starvector.data.base import SVGDatasetBase
+from starvector.data.stacksvg import text2svg_captions
+from starvector.data.util import ImageTrainProcessor
+
+class StreamingSVGDataset(IterableDataset, SVGDatasetBase):
+    """
+    SVG dataset streamed from local sharded Parquet (or Arrow IPC) files, without loading the split.
+
+    Shards are the row groups of the Parquet files (the files for Arrow). Only their row counts are read
+    at startup; `select_dataset_name` is pushed down to the scan and `num_samples` keeps the first rows
+    in file order. Every epoch the shards are shuffled and each shard's rows are shuffled (seeded with
+    `seed` and the epoch, see `set_epoch`), and the resulting stream is cut into one contiguous range
+    per process (`rank` / `world_size`, from the launcher's environment by default) and dataloader
+    worker, of equal size across processes. A worker only reads the shards overlapping its range.
+
+    Samples carry their worker and position in its range: pass every consumed batch to `update_state`,
+    and `state_dict` / `load_state_dict` resume every worker exactly after its last consumed sample,
+    skipping the consumed rows without reading them (with the same number of processes and workers).
+    The rest of the epoch is every unconsumed sample once; only the interleaving of the workers'
+    batches restarts at the first worker.
+    """
+    def __init__(self, path, split, im_size, num_samples=-1, format='parquet', shuffle=True, seed=0,
+                 select_dataset_name=False, rank=None, world_size=None, **kwargs):
+        if kwargs.get('materialized', False) or kwargs.get('augmented', False) or kwargs.get('pretokenized', False) \
+                or kwargs.get('index', False):
+            raise ValueError("Materialized rasters, variants, token ids and dataset indexes are indexed by dataset row, they can't be streamed")
+        self.init_processing(split, im_size, **kwargs)
+        self.path = os.path.join(path, split) if os.path.isdir(os.path.join(path, split)) else path
+        self.shuffle = shuffle
+        self.seed = seed
+        self.filter = ds.field('model_name') == select_dataset_name if select_dataset_name else None
+        self.rank = int(os.environ.get('RANK', 0)) if rank is None else rank
+        self.world_size = int(os.environ.get('WORLD_SIZE', 1)) if world_size is None else world_size
+
+        self.shards, self.shard_rows = self._list_shards(ds.dataset(self.path, format=format), num_samples)
+        self.num_rows = int(self.shard_rows.sum())
+        self.epoch = 0
+        self._consumed = {}
+        self._resume = {}
+        self._resume_epoch = None
+        self._num_workers = None
+
+        self.image_processor = kwargs.get('image_processor', None)
+        if self.image_processor and 'siglip' in self.image_processor:
+            model_name = {'siglip_512': 'google/siglip-base-patch16-512',
+                        'siglip_384': 'google/siglip-large-patch16-384',
+                        'siglip_256': 'google/siglip-base-patch16-256'}[self.image_processor]
+            self.processor = AutoProcessor.from_pretrained(model_name).image_processor
+        else:
+            self.processor = ImageTrainProcessor(size=self.im_size)
+
+        print(f"Streaming {self.num_rows} samples in {len(self.shards)} shards from {self.path}")
+
+    def _list_shards(self, dataset, num_samples):
+        shards, rows = [], []
+        for fragment in dataset.get_fragments(filter=self.filter):
+            if hasattr(fragment, 'split_by_row_group'):
+                parts = fragment.split_by_row_group(filter=self.filter)
+            else:
+                parts = [fragment]
+            for part in parts:
+                count = self._count_rows(part)
+                if num_samples != -1:
+                    count = min(count, num_samples - sum(rows))
+                if count > 0:
+                    shards.append(part)
+                    rows.append(count)
+                if num_samples != -1 and sum(rows) == num_samples:
+                    return shards, np.array(rows, dtype=np.int64)
+        return shards, np.array(rows, dtype=np.int64)
+
+    def _count_rows(self, part):
+        if self.filter is None and getattr(part, 'row_groups', None):
+            return sum(row_group.num_rows for row_group in part.row_groups)
+        # A row group fragment counts the rows of its whole file, scan the filter columns instead
+        return part.to_table(columns=[], filter=self.filter).num_rows
+
+    def __len__(self):
+        # Samples of this process, the remainder of the split is dropped so processes step together
+        return self.num_rows // self.world_size
+
+    def set_epoch(self, epoch):
+        self._consumed = dict(self._resume) if epoch == self._resume_epoch else {}
+        self.epoch = epoch
+
+    def update_state(self, batch):
+        """Record the samples of a batch consumed by the training loop"""
+        self._num_workers = int(batch['stream_workers'][0])
+        for worker, position in zip(batch['stream_worker'].tolist(), batch['stream_position'].tolist()):
+            self._consumed[worker] = max(self._consumed.get(worker, 0), position + 1)
+
+    def state_dict(self):
+        return {
+            'epoch': self.epoch,
+            'seed': self.seed,
+            'world_size': self.world_size,
+            'num_workers': self._num_workers,
+            'consumed': {str(worker): count for worker, count in self._consumed.items()},
+        }
+
+    def load_state_dict(self, state):
+        if state['seed'] != self.seed or state['world_size'] != self.world_size:
+            raise ValueError(f"Stream state of seed {state['seed']} on {state['world_size']} processes, "
+                             f"resuming with seed {self.seed} on {self.world_size}")
+        self._num_workers = state['num_workers']
+        self._resume = {int(worker): count for worker, count in state['consumed'].items()}
+        self._resume_epoch = state['epoch']
+        self.set_epoch(state['epoch'])
+
+    def _epoch_order(self):
+        if not self.shuffle:
+            return np.arange(len(self.shards))
+        return np.random.default_rng([self.seed, self.epoch]).permutation(len(self.shards))
+
+    def _read_shard(self, k):
+        """Rows of shard k in their epoch order"""
+        table = self.shards[k].to_table(filter=self.filter).slice(0, int(self.shard_rows[k]))
+        if self.shuffle:
+            table = table.take(np.random.default_rng([self.seed, self.epoch, k]).permutation(len(table)))
+        return table
+
+    def _worker_range(self):
+        """Global worker index, number of workers over all processes, and this worker's range of the epoch stream"""
+        info = get_worker_info()
+        worker_id, num_workers = (info.id, info.num_workers) if info is not None else (0, 1)
+        if self._resume and self._num_workers not in (None, self.world_size * num_workers):
+            raise ValueError(f"Stream state of {self._num_workers} workers, resuming with {self.world_size * num_workers}")
+        per_rank = len(self)
+        start = self.rank * per_rank + per_rank * worker_id // num_workers
+        end = self.rank * per_rank + per_rank * (worker_id + 1) // num_workers
+        return self.rank * num_workers + worker_id, self.world_size * num_workers, start, end
+
+    def _sample(self, row):
+        svg, image = self.get_svg_and_image(row['Svg'], row['Filename'])
+        if 'caption_blip2' in row:
+            caption_column = random.choice(['caption_blip2', 'caption_llava'])
+            caption = random.choice(text2svg_captions) + (row.get(caption_column) or "")
+        else:
+            caption = row.get('Caption') or ""
+        return {
+            'svg': svg,
+            'image': image,
+            'id': row['Filename'],
+            'caption': caption,
+        }
+
+    def __iter__(self):
+        worker, num_workers, start, end = self._worker_range()
+        skip = self._resume.get(worker, 0) if self.epoch == self._resume_epoch else 0
+        position = skip
+        order = self._epoch_order()
+        offsets = np.concatenate([[0], np.cumsum(self.shard_rows[order])])
+        for i, k in enumerate(order):
+            # Rows [first, last) of the shard are in the unconsumed part of this worker's range
+            first = max(start + skip, offsets[i]) - offsets[i]
+            last = min(end, offsets[i + 1]) - offsets[i]
+            if first >= last:
+                continue
+            table = self._read_shard(k).slice(first, last - first)
+            for batch in table.to_batches(max_chunksize=256):
+                for row in batch.to_pylist():
+                    sample = self._sample(row)
+                    sample.update({'stream_worker': worker, 'stream_workers': num_workers, 'stream_position': position})
+                    position += 1
+                    yield sample
@@ -0,0 +1,278 @@
+import math
+import re
+from collections import namedtuple
+from lxml import etree
+from starvector.data.svg_path import parse_path, serialize_path, format_number
+from starvector.data.rasterizer import RasterizationError
+
+MinifyResult = namedtuple('MinifyResult', ['svg', 'original_bytes', 'minified_bytes', 'raster_diff', 'accepted'])
+
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+NUMERIC_ATTRIBUTES = ('x', 'y', 'width', 'height', 'cx', 'cy', 'r', 'rx', 'ry', 'x1', 'y1', 'x2', 'y2', 'stroke-width')
+
+# Inherited presentation attributes and their initial values
+INHERITED_DEFAULTS = {
+    'fill': '#000000',
+    'fill-opacity': '1',
+    'fill-rule': 'nonzero',
+    'clip-rule': 'nonzero',
+    'stroke': 'none',
+    'stroke-width': '1',
+    'stroke-opacity': '1',
+    'stroke-linecap': 'butt',
+    'stroke-linejoin': 'miter',
+    'stroke-miterlimit': '4',
+    'stroke-dasharray': 'none',
+    'stroke-dashoffset': '0',
+    'visibility': 'visible',
+}
+NON_INHERITED_DEFAULTS = {'opacity': '1'}
+
+_COLOR_ALIASES = {'black': '#000000', '#000': '#000000', 'white': '#ffffff', '#fff': '#ffffff'}
+
+# Content of these elements is rendered where it is referenced, inheriting from the referencing element
+_REFERENCED_CONTAINERS = {'defs', 'symbol', 'marker', 'pattern', 'clipPath', 'mask', 'linearGradient', 'radialGradient'}
+_TEXT_ELEMENTS = {'text', 'tspan', 'textPath', 'title', 'desc', 'style', 'script'}
+# Attributes under which overlapping subpaths no longer render like separate paths
+_NO_MERGE_ATTRIBUTES = {'id', 'opacity', 'fill-opacity', 'stroke-opacity', 'mask', 'clip-path', 'filter', 'marker-start', 'marker-mid', 'marker-end', 'style'}
+
+def _normalize(value):
+    value = value.strip().lower()
+    if _NUMBER_RE.fullmatch(value):
+        return format_number(float(value), 6)
+    return _COLOR_ALIASES.get(value, value)
+
+def _localname(element):
+    return etree.QName(element).localname
+
+def _valid_extent(size):
+    return size is not None and math.isfinite(size) and size > 0
+
+def viewbox_extent(root):
+    """Largest side of the viewBox (or of width/height), 100 when unknown, non-finite or not positive"""
+    size = None
+    view_box = root.get('viewBox')
+    if view_box:
+        values = [float(v) for v in _NUMBER_RE.findall(view_box)]
+        if len(values) == 4:
+            size = max(values[2], values[3])
+    if not _valid_extent(size):
+        try:
+            size = max(float(_NUMBER_RE.match(root.get(a, '')).group()) for a in ('width', 'height'))
+        except (AttributeError, ValueError):
+            size = None
+    if not _valid_extent(size):
+        # Generated SVGs are mostly in the hundreds
+        size = 100
+    return size
+
+def coordinate_decimals(root, precision):
+    """Decimals that keep `precision` significant digits of the viewBox (or width/height) extent"""
+    return max(0, precision - (math.floor(math.log10(viewbox_extent(root))) + 1))
+
+class SVGMinifier:
+    """
+    Lossy size reduction of (repaired) SVG code.
+
+    Coordinates are rounded to `precision` significant digits of the viewBox extent, path data is
+    rewritten in its shortest absolute/relative form, consecutive sibling paths with identical
+    attributes are merged into one, presentation attributes equal to the inherited or initial value
+    are dropped, and comments and whitespace between elements are removed.
+
+    Calling the minifier verifies the result with a raster diff (mean absolute pixel difference in
+    [0, 1]) against the input: if it exceeds `max_raster_diff` the result is recomputed without merging
+    paths (merged subpaths can change the fill of overlaps), and the input is kept if it still differs.
+    The input is also kept, and counted as unverified, when either side fails to render.
+    Rasterization goes through the shared cache with the validation parameters, so the accepted SVG
+    is not rendered twice. Byte savings are accumulated in `stats`.
+    """
+    def __init__(self, precision=4, merge_paths=True, strip_defaults=True, verify=True, max_raster_diff=0.005,
+                 verify_resolution=512, verify_dpi=100, verify_scale=1):
+        self.precision = precision
+        self.merge_paths = merge_paths
+        self.strip_defaults = strip_defaults
+        self.verify = verify
+        self.max_raster_diff = max_raster_diff
+        self.verify_args = dict(resolution=verify_resolution, dpi=verify_dpi, scale=verify_scale)
+        self.parser = etree.XMLParser(remove_comments=True, huge_tree=True, resolve_entities=False, no_network=True)
+        self.stats = {'num_svgs': 0, 'original_bytes': 0, 'minified_bytes': 0, 'rejected': 0, 'unverified': 0, 'merge_fallbacks': 0}
+
+    def __call__(self, svg_text):
+        return self.minify_and_verify(svg_text)
+
+    def minify(self, svg_text, merge_paths=None):
+        """Minified SVG text, without verification. Unparseable input is returned unchanged"""
+        merge_paths = self.merge_paths if merge_paths is None else merge_paths
+        try:
+            root = etree.fromstring(svg_text.encode('utf-8'), self.parser)
+        except (etree.XMLSyntaxError, ValueError):
+            return svg_text
+        decimals = coordinate_decimals(root, self.precision)
+        # Without CSS rules, presentation attributes are the only source of inherited values
+        strip_defaults = self.strip_defaults and not any(True for _ in root.iter('{*}style'))
+        paths = {}
+        self._walk(root, decimals, strip_defaults, merge_paths, paths)
+        for element, segments in paths.items():
+            element.set('d', serialize_path(segments, decimals))
+        return etree.tostring(root, encoding='unicode')
+
+    def _walk(self, root, decimals, strip_defaults, merge_paths, paths):
+        """
+        Visit the tree in document order with an explicit stack, so deeply nested groups do not hit the
+        recursion limit. Paths are merged when an element is left, after all of its children
+        """
+        # (element, inherited values, in_text, in_reference, leaving): `leaving` entries come back after the children
+        stack = [(root, dict(INHERITED_DEFAULTS), False, False, False)]
+        while stack:
+            element, inherited, in_text, in_reference, leaving = stack.pop()
+            if leaving:
+                # `inherited` holds the values the element passed to its children
+                if merge_paths and not in_text:
+                    self._merge_paths(element, inherited, paths)
+                continue
+            name = _localname(element)
+            in_text = in_text or name in _TEXT_ELEMENTS
+            own = self._visit(element, name, inherited, decimals, strip_defaults, paths, in_text, in_reference)
+            in_reference = in_reference or name in _REFERENCED_CONTAINERS
+            stack.append((element, own, in_text, in_reference, True))
+            stack.extend((child, own, in_text, in_reference, False) for child in reversed(element) if isinstance(child.tag, str))
+
+    def _visit(self, element, name, inherited, decimals, strip_defaults, paths, in_text, in_reference):
+        """Rewrite the attributes of one element; returns the presentation values its children inherit"""
+        if not in_text:
+            if element.text is not None and not element.text.strip():
+                element.text = None
+            if element.tail is not None and not element.tail.strip():
+                element.tail = None
+
+        for attribute in NUMERIC_ATTRIBUTES:
+            value = element.get(attribute)
+            if value is not None and _NUMBER_RE.fullmatch(value.strip()) and math.isfinite(float(value)):
+                element.set(attribute, format_number(float(value), decimals))
+        points = element.get('points')
+        if points is not None:
+            numbers = _NUMBER_RE.findall(points)
+            if numbers and len(numbers) % 2 == 0 and all(math.isfinite(float(n)) for n in numbers):
+                element.set('points', ' '.join(format_number(float(n), decimals) for n in numbers))
+        if name == 'path' and element.get('d') is not None:
+            segments = parse_path(element.get('d'))
+            if segments:
+                paths[element] = segments
+
+        own = dict(inherited)
+        for attribute in INHERITED_DEFAULTS:
+            value = element.get(attribute)
+            if value is None:
+                continue
+            if strip_defaults and not in_reference and _normalize(value) == _normalize(inherited[attribute]):
+                del element.attrib[attribute]
+            else:
+                own[attribute] = value
+        for attribute, initial in NON_INHERITED_DEFAULTS.items():
+            value = element.get(attribute)
+            if strip_defaults and value is not None and _normalize(value) == initial:
+                del element.attrib[attribute]
+        if element.get('style'):
+            # Inline declarations win over attributes, the inherited values are no longer known
+            for declaration in element.get('style').split(';'):
+                if ':' in declaration:
+                    prop, value = declaration.split(':', 1)
+                    if prop.strip() in own:
+                        own[prop.strip()] = '\0'
+        return own
+
+    def _merge_paths(self, element, inherited, paths):
+        if _normalize(inherited['fill-opacity']) != '1' or _normalize(inherited['stroke-opacity']) != '1':
+            return
+        previous = None
+        for child in list(element):
+            mergeable = (
+                child in paths
+                and paths[child][0][0] == 'M'
+                and not child.tail
+                and not _NO_MERGE_ATTRIBUTES.intersection(child.attrib)
+            )
+            if not mergeable:
+                previous = None
+                continue
+            attributes = {k: v for k, v in child.attrib.items() if k != 'd'}
+            if previous is not None and previous[1] == attributes:
+                paths[previous[0]].extend(paths.pop(child))
+                element.remove(child)
+            else:
+                previous = (child, attributes)
+
+    def minify_and_verify(self, svg_text):
+        """Minify, verify with a raster diff and fall back as described above; returns a `MinifyResult`"""
+        original_bytes = len(svg_text.encode('utf-8'))
+        minified = self.minify(svg_text)
+        raster_diff = None
+        accepted = True
+        if self.verify and minified != svg_text:
+            try:
+                raster_diff = self.raster_diff(svg_text, minified)
+                if raster_diff > self.max_raster_diff and self.merge_paths:
+                    self.stats['merge_fallbacks'] += 1
+                    minified = self.minify(svg_text, merge_paths=False)
+                    raster_diff = self.raster_diff(svg_text, minified)
+            except RasterizationError:
+                # A render failure is not evidence that the two SVGs look the same
+                self.stats['unverified'] += 1
+                minified, raster_diff, accepted = svg_text, None, False
+            else:
+                if raster_diff > self.max_raster_diff:
+                    self.stats['rejected'] += 1
+                    minified, accepted = svg_text, False
+
+        minified_bytes = len(minified.encode('utf-8'))
+        self.stats['num_svgs'] += 1
+        self.stats['original_bytes'] += original_bytes
+        self.stats['minified_bytes'] += minified_bytes
+        return MinifyResult(minified, original_bytes, minified_bytes, raster_diff, accepted)
+
+    def raster_diff(self, svg_a, svg_b):
+        from starvector.data.util import raster_diff
+        return raster_diff(svg_a, svg_b, **self.verify_args)
+
+    def report(self):
+        stats = self.stats
+        return {
+            'minify_num_svgs': stats['num_svgs'],
+            'minify_bytes_saved': stats['original_bytes'] - stats['minified_bytes'],
+            'minify_size_ratio': stats['minified_bytes'] / stats['original_bytes'] if stats['original_bytes'] else 1.0,
+            'minify_rejected': stats['rejected'],
+            'minify_unverified': stats['unverified'],
+            'minify_merge_fallbacks': stats['merge_fallbacks'],
+        }
+
+def main(config):
+    import glob
+    import json
+    import os
+
+    files = sorted(glob.glob(os.path.join(config.corpus_dir, '**', config.get('pattern', '*.svg')), recursive=True))
+    if not files:
+        raise ValueError(f"No SVG files matching {config.get('pattern', '*.svg')} in {config.corpus_dir}")
+    minifier = SVGMinifier(
+        precision=config.get('precision', 4),
+        merge_paths=config.get('merge_paths', True),
+        max_raster_diff=config.get('max_raster_diff', 0.005))
+    diffs = []
+    for f in files:
+        with open(f, encoding='utf-8') as fp:
+            result = minifier(fp.read())
+        if result.raster_diff is not None:
+            diffs.append(result.raster_diff)
+    report = minifier.report()
+    report['max_raster_diff'] = max(diffs, default=0.0)
+    report['mean_raster_diff'] = sum(diffs) / len(diffs) if diffs else 0.0
+    print(json.dumps(report, indent=4))
+
+if __name__ == "__main__":
+    from omegaconf import OmegaConf
+
+    cli_conf = OmegaConf.from_cli()
+    if 'corpus_dir' not in cli_conf:
+        raise ValueError("Usage: python -m starvector.data.svg_minify corpus_dir=<dir with SVGs> [pattern=*.svg precision=4 merge_paths=true max_raster_diff=0.005]")
+    main(cli_conf)
@@ -0,0 +1,179 @@
+import re
+
+# Number of arguments per path command
+PATH_COMMAND_ARITY = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'A': 7, 'Z': 0}
+
+PATH_TOKEN_RE = re.compile(
+    r"(?P<command>[MmZzLlHhVvCcSsQqTtAa])"
+    r"|(?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)"
+    r"|(?P<separator>[\s,]+)"
+    r"|(?P<invalid>.)",
+    re.DOTALL,
+)
+
+# The large-arc and sweep flags of an arc are one character each, and may be written without separators
+ARC_FLAG_RE = re.compile(r"(?P<number>[01])")
+ARC_FLAG_POSITIONS = (3, 4)
+
+def tokenize_path(d):
+    """
+    Tokens of path data as `(kind, text, end)`, kind being 'command', 'number' or 'invalid' (separators
+    are skipped). Arc flags are read as single characters, so `A5 5 0 1010 10` has flags 1 and 0 and end
+    point (10, 10); a number other than 0 or 1 where a flag is expected is invalid.
+    """
+    command = None
+    num_args = 0
+    pos = 0
+    while pos < len(d):
+        at_flag = command == 'A' and num_args % PATH_COMMAND_ARITY['A'] in ARC_FLAG_POSITIONS
+        match = ARC_FLAG_RE.match(d, pos) if at_flag else None
+        if match is None:
+            match = PATH_TOKEN_RE.match(d, pos)
+        kind = match.lastgroup
+        pos = match.end()
+        if kind == 'separator':
+            continue
+        if kind == 'command':
+            command = match.group().upper()
+            num_args = 0
+        elif kind == 'number':
+            if at_flag and match.re is PATH_TOKEN_RE:
+                kind = 'invalid'
+            num_args += 1
+        yield kind, match.group(), pos
+
+def parse_path(d):
+    """
+    Parse path data into absolute segments `[(command, args)]`, with upper case commands and implicit
+    repeats expanded (extra pairs after a moveto become linetos). Returns None if the path data is
+    malformed or truncated.
+    """
+    groups = []
+    for kind, text, _ in tokenize_path(d):
+        if kind == 'invalid':
+            return None
+        if kind == 'command':
+            groups.append((text, []))
+        elif not groups:
+            return None
+        else:
+            groups[-1][1].append(float(text))
+
+    segments = []
+    x = y = start_x = start_y = 0.0
+    for command, numbers in groups:
+        upper = command.upper()
+        relative = command != upper
+        arity = PATH_COMMAND_ARITY[upper]
+        if upper == 'Z':
+            if numbers:
+                return None
+            segments.append(('Z', []))
+            x, y = start_x, start_y
+            continue
+        if not numbers or len(numbers) % arity:
+            return None
+        for i in range(0, len(numbers), arity):
+            args = numbers[i:i + arity]
+            if upper == 'H':
+                x = args[0] + (x if relative else 0)
+                segments.append(('H', [x]))
+                continue
+            if upper == 'V':
+                y = args[0] + (y if relative else 0)
+                segments.append(('V', [y]))
+                continue
+            if relative:
+                # Arcs: only the end point is relative, radii, rotation and flags are not
+                points = range(5, 7) if upper == 'A' else range(arity)
+                for j in points:
+                    args[j] += x if j % 2 == (1 if upper == 'A' else 0) else y
+            if upper == 'M' and i > 0:
+                segments.append(('L', args))
+            else:
+                segments.append((upper, args))
+            x, y = args[-2], args[-1]
+            if upper == 'M' and i == 0:
+                start_x, start_y = x, y
+    return segments
+
+def format_number(value, decimals):
+    """Shortest decimal form: no trailing zeros, no leading zero, no negative zero"""
+    text = f"{value:.{decimals}f}"
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    if text in ('-0', ''):
+        return '0'
+    if text.startswith('0.'):
+        return text[1:]
+    if text.startswith('-0.'):
+        return '-' + text[2:]
+    return text
+
+def _join_numbers(numbers):
+    # A minus sign already separates two numbers
+    out = ''
+    for number in numbers:
+        if out and not number.startswith('-'):
+            out += ' '
+        out += number
+    return out
+
+def serialize_path(segments, decimals):
+    """
+    Write absolute segments as compact path data. Coordinates are rounded to `decimals`, and each segment
+    uses whichever of the absolute and relative forms is shorter. Relative offsets are computed between
+    rounded absolute points, so rounding errors do not accumulate along the path. Straight lines become
+    `H`/`V` when possible and repeated (or implicit) command letters are omitted.
+    """
+    out = []
+    previous = None
+    x = y = start_x = start_y = 0.0
+    for command, args in segments:
+        if command == 'Z':
+            out.append('z')
+            previous = 'z'
+            x, y = start_x, start_y
+            continue
+
+        args = [round(a, decimals) for a in args]
+        if command == 'A':
+            args[3], args[4] = int(args[3] != 0), int(args[4] != 0)
+        if command == 'L' and args[1] == y:
+            command, args = 'H', [args[0]]
+        elif command == 'L' and args[0] == x:
+            command, args = 'V', [args[1]]
+
+        if command == 'H':
+            relative_args = [args[0] - x]
+        elif command == 'V':
+            relative_args = [args[0] - y]
+        elif command == 'A':
+            relative_args = args[:5] + [args[5] - x, args[6] - y]
+        else:
+            relative_args = [a - (x if j % 2 == 0 else y) for j, a in enumerate(args)]
+
+        candidates = []
+        for letter, values in ((command, args), (command.lower(), relative_args)):
+            numbers = [str(v) if (command == 'A' and j in (3, 4)) else format_number(v, decimals) for j, v in enumerate(values)]
+            implicit = {'M': 'L', 'm': 'l'}.get(previous, previous)
+            if letter == implicit:
+                text = _join_numbers(numbers)
+                if not text.startswith('-'):
+                    text = ' ' + text
+            else:
+                text = letter + _join_numbers(numbers)
+            candidates.append((len(text), letter, text))
+        _, letter, text = min(candidates)
+        out.append(text)
+        previous = letter
+
+        if command == 'H':
+            x = args[0]
+        elif command == 'V':
+            y = args[0]
+        else:
+            x, y = args[-2], args[-1]
+        if command == 'M':
+            start_x, start_y = x, y
+    return ''.join(out)
@@ -0,0 +1,193 @@
+import re
+import threading
+from collections import namedtuple
+from lxml import etree
+from starvector.data.tag_balancer import TagBalancer
+from starvector.data.svg_path import PATH_COMMAND_ARITY, tokenize_path
+
+VALID = 'valid'
+REPAIRED = 'repaired'
+PLACEHOLDER = 'placeholder'
+
+PLACEHOLDER_SVG = "<svg></svg>"
+
+RepairResult = namedtuple('RepairResult', ['svg', 'status', 'issues'])
+
+def check_path_data(d):
+    """
+    Validate path data in one linear scan over its tokens.
+
+    Returns the path data if it is well formed, the prefix ending at the last complete segment if it
+    is truncated (e.g. cut in the middle of a curve), or None if it cannot be parsed.
+    """
+    command = None
+    num_args = 0
+    last_complete = 0
+    for kind, text, end in tokenize_path(d):
+        if kind == 'invalid':
+            return None
+        if kind == 'command':
+            if num_args:
+                # Previous command left with a partial set of arguments
+                return None
+            command = text.upper()
+            if command == 'Z':
+                last_complete = end
+            num_args = 0
+            continue
+        if command is None or command == 'Z':
+            # Numbers before the first command or after a close path
+            return None
+        num_args += 1
+        if num_args == PATH_COMMAND_ARITY[command]:
+            num_args = 0
+            last_complete = end
+            if command == 'M':
+                # Extra coordinate pairs after a moveto are implicit linetos
+                command = 'L'
+
+    if last_complete == 0:
+        return None
+    if num_args or d[last_complete:].strip():
+        return d[:last_complete]
+    return d
+
+class SVGRepairEngine:
+    """
+    Validates and repairs generated SVG code with a recovering XML parser.
+
+    A `TagBalancer` pass computes the suffix completing a truncated document, then a single parse
+    recovers from the remaining malformed markup. A linear walk over the recovered tree then checks the
+    geometry attributes, trimming truncated path data and dropping attributes that cannot be parsed.
+    Each input is classified as `valid` (returned unchanged), `repaired` or `placeholder`. The parser
+    and its error log are reused across calls, so an engine must not be used by several threads at once.
+    """
+    geometry_attributes = ('d', 'points')
+
+    def __init__(self, placeholder=PLACEHOLDER_SVG):
+        self.placeholder = placeholder
+        self.parser = etree.XMLParser(recover=True, huge_tree=True, resolve_entities=False, no_network=True)
+
+    def __call__(self, svg_text):
+        return self.repair(svg_text)
+
+    def repair(self, svg_text):
+        issues = []
+        start = svg_text.find('<svg') if svg_text else -1
+        if start == -1:
+            return RepairResult(self.placeholder, PLACEHOLDER, ['no <svg> element'])
+        if start > 0:
+            issues.append('leading content before <svg>')
+
+        # Complete a token cut by truncation and close open elements explicitly, so that recovery
+        # does not have to drop the last element
+        closing_suffix = TagBalancer().feed(svg_text[start:]).closing_suffix()
+        if closing_suffix:
+            issues.append(f'closed truncated tags with {closing_suffix!r}')
+
+        try:
+            root = etree.fromstring((svg_text[start:] + closing_suffix).encode('utf-8'), self.parser)
+        except (etree.XMLSyntaxError, ValueError) as e:
+            return RepairResult(self.placeholder, PLACEHOLDER, [f'unrecoverable: {e}'])
+        if root is None or etree.QName(root).localname != 'svg':
+            return RepairResult(self.placeholder, PLACEHOLDER, ['no <svg> root after recovery'])
+
+        for error in self.parser.error_log:
+            issues.append(f'xml: {error.message.strip()}')
+
+        for element in root.iter():
+            if not isinstance(element.tag, str):
+                continue
+            for attribute in self.geometry_attributes:
+                value = element.get(attribute)
+                if value is None:
+                    continue
+                if attribute == 'd':
+                    checked = check_path_data(value)
+                else:
+                    checked = value if _is_number_list(value) else None
+                if checked is None:
+                    del element.attrib[attribute]
+                    issues.append(f'dropped invalid {attribute} on <{etree.QName(element).localname}>')
+                elif checked != value:
+                    element.set(attribute, checked)
+                    issues.append(f'trimmed truncated {attribute} on <{etree.QName(element).localname}>')
+
+        if not issues:
+            return RepairResult(svg_text, VALID, issues)
+        return RepairResult(etree.tostring(root, encoding='unicode'), REPAIRED, issues)
+
+# Character class check only, so it stays linear on adversarial input
+_NUMBER_LIST_RE = re.compile(r"[-+\d.eE\s,]*")
+
+def _is_number_list(value):
+    return _NUMBER_LIST_RE.fullmatch(value) is not None
+
+# One engine per thread: an lxml parser and its error log must not be shared by concurrent parses
+_local = threading.local()
+
+def repair_svg(svg_text):
+    """Repair with this thread's engine; returns a `RepairResult`"""
+    engine = getattr(_local, 'engine', None)
+    if engine is None:
+        engine = _local.engine = SVGRepairEngine()
+    return engine.repair(svg_text)
+
+def legacy_post_process(svg_text):
+    """The previous pipeline (svgpathtools parse, BeautifulSoup cleanup, parse again), for comparison"""
+    from svgpathtools import svgstr2paths
+    from starvector.data.util import clean_svg
+    try:
+        svgstr2paths(svg_text)
+        return RepairResult(svg_text, VALID, [])
+    except Exception:
+        try:
+            cleaned_svg = clean_svg(svg_text)
+            svgstr2paths(cleaned_svg)
+            return RepairResult(cleaned_svg, REPAIRED, [])
+        except Exception:
+            return RepairResult(PLACEHOLDER_SVG, PLACEHOLDER, [])
+
+def benchmark(svgs, num_repeats=1):
+    """Time and classify a corpus with the repair engine and with the legacy pipeline"""
+    import time
+    from collections import Counter
+
+    report = {}
+    for name, fn in [('repair_engine', repair_svg), ('legacy', legacy_post_process)]:
+        statuses = Counter()
+        start = time.time()
+        for _ in range(num_repeats):
+            statuses = Counter(fn(svg).status for svg in svgs)
+        elapsed = (time.time() - start) / num_repeats
+        report[name] = {
+            'seconds': elapsed,
+            'ms_per_svg': 1000 * elapsed / max(len(svgs), 1),
+            **{status: statuses.get(status, 0) for status in (VALID, REPAIRED, PLACEHOLDER)},
+        }
+    report['speedup'] = report['legacy']['seconds'] / max(report['repair_engine']['seconds'], 1e-9)
+    report['num_svgs'] = len(svgs)
+    return report
+
+def main(config):
+    import glob
+    import json
+    import os
+
+    # Raw model outputs are saved by the validators as <sample>/<sample>_raw.svg
+    files = sorted(glob.glob(os.path.join(config.corpus_dir, '**', config.get('pattern', '*_raw.svg')), recursive=True))
+    if not files:
+        raise ValueError(f"No SVG files matching {config.get('pattern', '*_raw.svg')} in {config.corpus_dir}")
+    svgs = []
+    for f in files:
+        with open(f, encoding='utf-8') as fp:
+            svgs.append(fp.read())
+    print(json.dumps(benchmark(svgs, num_repeats=config.get('num_repeats', 1)), indent=4))
+
+if __name__ == "__main__":
+    from omegaconf import OmegaConf
+
+    cli_conf = OmegaConf.from_cli()
+    if 'corpus_dir' not in cli_conf:
+        raise ValueError("Usage: python -m starvector.data.svg_repair corpus_dir=<validation output dir> [pattern=*_raw.svg num_repeats=1]")
+    main(cli_conf)
@@ -0,0 +1,184 @@
+import re
+
+# Quote or end of tag, searched for while scanning the inside of a tag
+_TAG_SCAN_RE = re.compile(r"[\"'>]")
+_TAG_NAME_RE = re.compile(r"</?\s*([^\s/>\"']+)")
+# Special tokens: opening sequence -> terminator
+_SPECIAL_TOKENS = (('<!--', '-->'), ('<![CDATA[', ']]>'), ('<?', '?>'))
+# Kind of a token that is not special: start tag, end tag or declaration
+_TAG = 'tag'
+
+class TagBalancer:
+    """
+    Single-pass, stack-based tag tokenizer for (possibly truncated) SVG/XML text.
+
+    `feed` can be called repeatedly with consecutive chunks of a growing document: an incomplete
+    token at the end of a chunk is kept as a list of chunks, together with its quote state, and only the
+    next chunk is scanned to resume it, so the total work is linear in the length of the document, also
+    for a long attribute value streamed in small chunks. Comments, CDATA sections, processing
+    instructions and `>` inside quoted attribute values are handled.
+
+    `unclosed_tags` lists the open elements in document order, `closing_suffix()` returns the text
+    that completes a pending partial token and closes every open element, and `num_closed` counts
+    completed elements (end tags and self-closing tags) for callers that react to new elements.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.stack = []
+        self.num_closed = 0
+        # Chunks of the incomplete token at the end of the text fed so far, and its scan state: its kind
+        # (None while it could still become a special token, _TAG or an index into _SPECIAL_TOKENS),
+        # the open quote of a tag and the last characters of a special token that may start its terminator
+        self._pending = []
+        self._kind = None
+        self._quote = None
+        self._tail = ''
+
+    def feed(self, chunk):
+        text, pos = chunk, 0
+        if self._pending and self._kind is None:
+            # A few characters of a possible opening sequence: scan the token again with the chunk
+            text = self._pending.pop() + chunk
+        elif self._pending:
+            # Only the new chunk is scanned, the token is joined once when it ends
+            end = self._scan(chunk, 0)
+            if end == -1:
+                self._pending.append(chunk)
+                return self
+            self._pending.append(chunk[:end])
+            token = ''.join(self._pending)
+            self._pending = []
+            self._handle_token(token, 0, len(token))
+            pos = end
+        while True:
+            pos = text.find('<', pos)
+            if pos == -1:
+                return self
+            end = self._start_token(text, pos)
+            if end == -1:
+                self._pending = [text[pos:]]
+                return self
+            self._handle_token(text, pos, end)
+            pos = end
+
+    def _start_token(self, text, start):
+        """End of the token starting at `start`, or -1 if it is incomplete (its scan state is kept)"""
+        self._kind, self._quote, self._tail = None, None, ''
+        for kind, (opening, _) in enumerate(_SPECIAL_TOKENS):
+            if text.startswith(opening, start):
+                self._kind = kind
+                return self._scan(text, start + len(opening))
+            if len(text) - start < len(opening) and opening.startswith(text[start:]):
+                # Could still become a comment / CDATA section, wait for more text
+                return -1
+        self._kind = _TAG
+        return self._scan(text, start + 1)
+
+    def _scan(self, text, i):
+        """Scan `text` from `i` for the end of the current token, resuming from and updating its state"""
+        if self._kind != _TAG:
+            terminator = _SPECIAL_TOKENS[self._kind][1]
+            if self._tail:
+                # Terminator split across chunks
+                j = (self._tail + text[i:i + len(terminator) - 1]).find(terminator)
+                if j != -1:
+                    return i + j + len(terminator) - len(self._tail)
+            j = text.find(terminator, i)
+            if j == -1:
+                self._tail = (self._tail + text[i:])[-(len(terminator) - 1):]
+                return -1
+            return j + len(terminator)
+
+        # Start tag, end tag or declaration: first `>` outside quotes
+        quote = self._quote
+        while True:
+            if quote:
+                j = text.find(quote, i)
+                if j == -1:
+                    self._quote = quote
+                    return -1
+                i, quote = j + 1, None
+                continue
+            match = _TAG_SCAN_RE.search(text, i)
+            if match is None:
+                self._quote = None
+                return -1
+            if match.group() == '>':
+                return match.end()
+            i, quote = match.end(), match.group()
+
+    def _handle_token(self, text, start, end):
+        if text.startswith(('<!', '<?'), start):
+            return
+        match = _TAG_NAME_RE.match(text, start, end)
+        if match is None:
+            return
+        name = match.group(1)
+        if text[start + 1] == '/':
+            if name in self.stack:
+                # Also pops elements left open inside it, as a recovering parser would
+                while self.stack.pop() != name:
+                    pass
+                self.num_closed += 1
+        elif text[end - 2] == '/':
+            self.num_closed += 1
+        else:
+            self.stack.append(name)
+
+    @property
+    def unclosed_tags(self):
+        return list(self.stack)
+
+    @property
+    def pending(self):
+        """Incomplete token at the end of the text fed so far"""
+        return ''.join(self._pending)
+
+    def closing_suffix(self):
+        """Text to append to the document fed so far to complete any partial token and close all open elements"""
+        stack = list(self.stack)
+        suffix = self._complete_pending(stack)
+        return suffix + ''.join(f'</{name}>' for name in reversed(stack))
+
+    def _complete_pending(self, stack):
+        pending = self.pending
+        if not pending:
+            return ''
+        for opening, terminator in _SPECIAL_TOKENS:
+            if pending.startswith(opening):
+                # A processing instruction needs a target name
+                return ('x' if pending == '<?' else '') + terminator
+            if opening.startswith(pending) and pending != '<':
+                # Cut inside the opening sequence, e.g. '<!-' or '<![CD'
+                return opening[len(pending):] + ('x' if opening == '<?' else '') + terminator
+        if pending == '<':
+            # An empty comment is the only complete token starting here
+            return '!---->'
+        if pending.startswith('</'):
+            name = pending[2:].strip()
+            if stack and stack[-1].startswith(name):
+                # Possibly cut inside the element name, e.g. '</sv'
+                return stack.pop()[len(name):] + '>'
+            return '>'
+        if pending.startswith('<!'):
+            return (self._quote or '') + '>'
+
+        # Partial start tag: close an open attribute value or complete a dangling attribute, then self-close
+        suffix = ''
+        if self._quote:
+            suffix = self._quote
+        else:
+            stripped = pending.rstrip()
+            if stripped.endswith('='):
+                suffix = '""'
+            elif re.search(r"\s[^\s=\"'/]+$", stripped):
+                suffix = '=""'
+            elif stripped.endswith('/'):
+                return '>'
+        return suffix + '/>'
+
+def balance_tags(svg_text):
+    """Return `svg_text` with its truncated tail completed and every open element closed"""
+    return svg_text + TagBalancer().feed(svg_text).closing_suffix()
@@ -0,0 +1,220 @@
+from collections import defaultdict
+import numpy as np
+from starvector.data.simplify import rdp, fit_cubic
+from starvector.data.svg_path import serialize_path
+
+def _normalize(v):
+    norm = abs(v)
+    return v / norm if norm > 0 else v
+
+def _as_uint8(image):
+    """[H, W, 3] uint8 array from a PIL image or an array"""
+    array = np.asarray(image.convert('RGB') if hasattr(image, 'convert') else image)
+    if array.ndim == 2:
+        array = np.repeat(array[..., None], 3, axis=-1)
+    return np.ascontiguousarray(array[..., :3], dtype=np.uint8)
+
+def _color_bins(image):
+    """5 bits per channel color bins: per-pixel bin index, and bin keys / counts / mean colors sorted by count"""
+    pixels = image.reshape(-1, 3)
+    keys = (pixels[:, 0].astype(np.int32) >> 3) << 10 | (pixels[:, 1].astype(np.int32) >> 3) << 5 | (pixels[:, 2].astype(np.int32) >> 3)
+    unique, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    means = np.stack([np.bincount(inverse, weights=pixels[:, c], minlength=len(unique)) for c in range(3)], axis=1) / counts[:, None]
+    order = np.argsort(-counts, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[inverse], counts[order], means[order]
+
+def image_complexity(image, coverage=0.99, gradient_threshold=48):
+    """
+    Complexity statistics of an image:
+    - `num_colors`: color bins needed to cover `coverage` of the pixels
+    - `edge_density`: fraction of pixels with a strong gradient (flat shape boundaries)
+    - `gradient_density`: fraction of pixels with a weak, non-zero gradient (shading, textures, photos)
+    """
+    image = _as_uint8(image)
+    _, counts, _ = _color_bins(image)
+    num_colors = int(np.searchsorted(np.cumsum(counts), coverage * counts.sum()) + 1)
+
+    luma = image.astype(np.int16) @ np.array([3, 6, 1], dtype=np.int16) // 10
+    gradient = np.zeros(luma.shape, dtype=np.int16)
+    gradient[:, 1:] = np.abs(np.diff(luma, axis=1))
+    gradient[1:, :] = np.maximum(gradient[1:, :], np.abs(np.diff(luma, axis=0)))
+    strong = gradient >= gradient_threshold
+    # Antialiasing next to a strong edge is not shading
+    near_edge = strong.copy()
+    near_edge[:, 1:] |= strong[:, :-1]
+    near_edge[:, :-1] |= strong[:, 1:]
+    near_edge[1:, :] |= strong[:-1, :]
+    near_edge[:-1, :] |= strong[1:, :]
+    weak = (gradient > 2) & ~near_edge
+    return {
+        'num_colors': num_colors,
+        'edge_density': float(strong.mean()),
+        'gradient_density': float(weak.mean()),
+    }
+
+def quantize_colors(image, max_colors=16):
+    """Palette of up to `max_colors` colors ([K, 3] uint8) and a label map ([H, W]) assigning each pixel to it"""
+    image = _as_uint8(image)
+    bins, _, means = _color_bins(image)
+    palette = means[:max_colors]
+    # Rare bins are merged into the nearest palette color
+    distances = ((means[:, None, :] - palette[None, :, :]) ** 2).sum(-1)
+    mapping = np.argmin(distances, axis=1)
+    mapping[:len(palette)] = np.arange(len(palette))
+    return np.round(palette).astype(np.uint8), mapping[bins].reshape(image.shape[:2])
+
+def boundary_loops(mask):
+    """
+    Closed boundary loops of a binary mask along pixel edges, as [N] complex arrays of pixel corner
+    coordinates. Edges are oriented with the region on the same side, so every loop closes; with
+    the even-odd fill rule the loops reproduce the mask exactly, holes included.
+    """
+    height, width = mask.shape
+    padded = np.pad(mask, 1)
+    stride = width + 1
+    starts, ends = [], []
+
+    # Horizontal edges on row boundaries y, between pixel rows y - 1 and y
+    above, below = padded[:-1, 1:-1], padded[1:, 1:-1]
+    y, x = np.nonzero(above != below)
+    rightward = below[y, x]
+    a, b = y * stride + x, y * stride + x + 1
+    starts.append(np.where(rightward, a, b))
+    ends.append(np.where(rightward, b, a))
+
+    # Vertical edges on column boundaries x, between pixel columns x - 1 and x
+    left, right = padded[1:-1, :-1], padded[1:-1, 1:]
+    y, x = np.nonzero(left != right)
+    downward = left[y, x]
+    a, b = y * stride + x, (y + 1) * stride + x
+    starts.append(np.where(downward, a, b))
+    ends.append(np.where(downward, b, a))
+
+    starts, ends = np.concatenate(starts), np.concatenate(ends)
+    outgoing = defaultdict(list)
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        outgoing[start].append(end)
+
+    loops = []
+    while outgoing:
+        first = next(iter(outgoing))
+        loop = [first]
+        vertex = first
+        while True:
+            targets = outgoing[vertex]
+            vertex_next = targets.pop()
+            if not targets:
+                del outgoing[vertex]
+            if vertex_next == first:
+                break
+            loop.append(vertex_next)
+            vertex = vertex_next
+        loop = np.array(loop)
+        loops.append((loop % stride) + 1j * (loop // stride))
+    return loops
+
+def _corner_indices(points, tolerance, corner_angle):
+    """Indices of the points of a closed polyline where the Ramer-Douglas-Peucker reduction turns sharply"""
+    keep = rdp(np.append(points, points[0]), tolerance)[:-1]
+    vertices = points[keep]
+    incoming = vertices - np.roll(vertices, 1)
+    outgoing = np.roll(vertices, -1) - vertices
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cos_turn = np.nan_to_num((np.conj(incoming) * outgoing).real / (np.abs(incoming) * np.abs(outgoing)), nan=1.0)
+    return keep, np.flatnonzero(cos_turn < np.cos(np.radians(corner_angle)))
+
+def _edge_midpoints(points, tolerance, corner_angle):
+    """
+    Pixel edge midpoints of a closed pixel-corner loop, with its sharp corners kept: staircases of
+    slanted and curved boundaries become straight chains, while square corners are not chamfered.
+    """
+    keep, corners = _corner_indices(points, tolerance, corner_angle)
+    midpoints = (points + np.roll(points, -1)) / 2
+    if not len(corners):
+        return midpoints
+    corners = keep[corners]
+    # Corner point i goes before midpoint i, between the two edges it joins. The loop is rotated to
+    # start at a corner, as the reduction always keeps the first point
+    return np.roll(np.insert(midpoints, corners, points[corners]), -corners[0])
+
+def fit_loop(points, tolerance=0.75, corner_angle=50.0):
+    """
+    Absolute path segments (for `serialize_path`) fitting a closed pixel-corner loop: vertices are
+    reduced with Ramer-Douglas-Peucker on the pixel edge midpoints, turns sharper than `corner_angle`
+    degrees are kept as corners, and the boundary between corners is fit with cubics (straight spans
+    stay lines).
+    """
+    points = _edge_midpoints(points, tolerance, corner_angle)
+    n = len(points)
+    keep, corners = _corner_indices(points, tolerance, corner_angle)
+    vertices = points[keep]
+    m = len(vertices)
+    if m < 3:
+        return []
+    keep = np.append(keep, n)
+
+    # Two turns around the loop, so that spans can wrap past the start
+    vertices_ext = np.concatenate([vertices, vertices, vertices[:1]])
+    dense_ext = np.concatenate([points, points, points[:1]])
+    keep_ext = np.concatenate([keep[:-1], keep[:-1] + n, [2 * n]])
+
+    if len(corners):
+        bounds = list(corners) + [corners[0] + m]
+        start = corners[0]
+    else:
+        bounds = [0, m]
+        start = 0
+    segments = [('M', [vertices_ext[start].real, vertices_ext[start].imag])]
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        if last - first == 1:
+            end = vertices_ext[last]
+            segments.append(('L', [end.real, end.imag]))
+            continue
+        if len(corners):
+            tangent_start = _normalize(vertices_ext[first + 1] - vertices_ext[first])
+            tangent_end = _normalize(vertices_ext[last - 1] - vertices_ext[last])
+        else:
+            # Smooth closed loop: the tangent at the start vertex is shared by both ends
+            tangent_start = _normalize(vertices[1] - vertices[-1])
+            tangent_end = -tangent_start
+        dense = dense_ext[keep_ext[first]:keep_ext[last] + 1]
+        for control in fit_cubic(dense, tangent_start, tangent_end, tolerance):
+            segments.append(('C', [c for point in control[1:] for c in (point.real, point.imag)]))
+    segments.append(('Z', []))
+    return segments
+
+def trace_image(image, max_colors=16, tolerance=0.75, corner_angle=50.0, decimals=1):
+    """
+    Vectorize a flat-color image: quantize to at most `max_colors` colors, trace the boundary of each
+    color region and fit it with lines and cubics. The most frequent color becomes a background
+    rectangle; every other color is one even-odd path. Coordinates are in pixels.
+    """
+    image = _as_uint8(image)
+    height, width = image.shape[:2]
+    palette, labels = quantize_colors(image, max_colors)
+
+    elements = [f'<rect width="{width}" height="{height}" fill="#{palette[0][0]:02x}{palette[0][1]:02x}{palette[0][2]:02x}"/>']
+    for k in range(1, len(palette)):
+        mask = labels == k
+        if not mask.any():
+            continue
+        segments = []
+        for loop in boundary_loops(mask):
+            segments.extend(fit_loop(loop, tolerance, corner_angle))
+        if segments:
+            color = '#{:02x}{:02x}{:02x}'.format(*palette[k])
+            elements.append(f'<path fill="{color}" fill-rule="evenodd" d="{serialize_path(segments, decimals)}"/>')
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" width="{width}" height="{height}">'
+            + ''.join(elements) + '</svg>')
+
+def raster_fidelity(svg, image):
+    """1 - mean absolute pixel difference between the rasterized SVG and the (square) image"""
+    from starvector.data.util import rasterize_svg
+
+    image = _as_uint8(image)
+    raster = np.asarray(rasterize_svg(svg, resolution=image.shape[1], dpi=100, scale=1), dtype=np.int16)
+    if raster.shape != image.shape:
+        return 0.0
+    return 1.0 - float(np.abs(raster - image.astype(np.int16)).mean()) / 255
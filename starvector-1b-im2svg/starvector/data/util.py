@@ -1,8 +1,9 @@
 from PIL import Image
 from torchvision import transforms
 from torchvision.transforms.functional import InterpolationMode
+from torchvision.transforms.v2 import functional as F_v2
 import numpy as np
-import matplotlib.pyplot as plt
+import torch
 from bs4 import BeautifulSoup
 import re
 from svgpathtools import svgstr2paths
@@ -23,19 +24,61 @@ def load_transforms():
     return transforms
 
 class ImageBaseProcessor():
-    def __init__(self, mean=None, std=None):
+    def __init__(self, mean=None, std=None, size=224):
         if mean is None:
             mean = (0.48145466, 0.4578275, 0.40821073)
         if std is None:
             std = (0.26862954, 0.26130258, 0.27577711)
 
+        self.mean = mean
+        self.std = std
+        self.size = size
         self.normalize = transforms.Normalize(mean=mean, std=std)
 
+    def normalize_uint8(self, batch, dtype=torch.float32, out=None):
+        """`ToTensor` + `Normalize` of a uint8 [B, 3, H, W] tensor as one multiply-subtract, on the tensor's device"""
+        std = torch.tensor(self.std, dtype=torch.float32, device=batch.device).view(1, 3, 1, 1)
+        mean = torch.tensor(self.mean, dtype=torch.float32, device=batch.device).view(1, 3, 1, 1)
+        normalized = batch.to(torch.float32).mul_(1.0 / (255.0 * std)).sub_(mean / std)
+        if out is None:
+            return normalized.to(dtype).contiguous()
+        return out.copy_(normalized)
+
+    def _resize_uint8(self, batch):
+        if tuple(batch.shape[-2:]) == (self.size, self.size):
+            return batch
+        return F_v2.resize(batch, [self.size, self.size], interpolation=InterpolationMode.BICUBIC, antialias=True)
+
+    def preprocess_batch(self, images, dtype=torch.float32, pin_memory=False, out=None):
+        """
+        Batched preprocessing of a list of PIL images into a [B, 3, size, size] buffer in `dtype` (pinned
+        if `pin_memory`, so that it can be copied to the GPU with one asynchronous copy), or into `out`.
+
+        Images are decoded once to uint8 and padded to square with white, centered, so images of any
+        size and aspect ratio batch together. They are resized with one call per distinct padded size,
+        and `ToTensor` and `Normalize` are fused by `normalize_uint8`.
+        """
+        arrays = [np.asarray(img if img.mode == "RGB" else img.convert("RGB")) for img in images]
+        if out is None:
+            out = torch.empty((len(arrays), 3, self.size, self.size), dtype=dtype, pin_memory=pin_memory and torch.cuda.is_available())
+
+        groups = {}
+        for i, array in enumerate(arrays):
+            groups.setdefault(max(array.shape[:2]), []).append(i)
+
+        for max_dim, indices in groups.items():
+            batch = torch.full((len(indices), max_dim, max_dim, 3), 255, dtype=torch.uint8)
+            for j, i in enumerate(indices):
+                height, width = arrays[i].shape[:2]
+                top, left = (max_dim - height) // 2, (max_dim - width) // 2
+                batch[j, top:top + height, left:left + width] = torch.from_numpy(arrays[i])
+            batch = self._resize_uint8(batch.permute(0, 3, 1, 2))
+            out.index_copy_(0, torch.tensor(indices), self.normalize_uint8(batch, out.dtype))
+        return out
+
 class ImageTrainProcessor(ImageBaseProcessor):
     def __init__(self, mean=None, std=None, size=224, **kwargs):
-        super().__init__(mean, std)
-
-        self.size = size
+        super().__init__(mean, std, size)
 
         self.transform = transforms.Compose([
             transforms.Resize(self.size, interpolation=InterpolationMode.BICUBIC),
@@ -46,6 +89,27 @@ class ImageTrainProcessor(ImageBaseProcessor):
     def __call__(self, item):
         return self.transform(item)
 
+    def preprocess_array(self, array, dtype=torch.float32, device=None):
+        """
+        Zero-copy path for a uint8 [B, H, W, 3] NumPy array (or tensor): the array is viewed as a tensor
+        without copying, moved to `device` still in uint8 (one host-to-device copy of 1 byte per value),
+        and padded, resized and normalized there like `preprocess_batch`.
+        """
+        batch = torch.from_numpy(array) if isinstance(array, np.ndarray) else array
+        if batch.dtype != torch.uint8:
+            raise ValueError(f"Expected a uint8 image batch, got {batch.dtype}")
+        if batch.ndim == 3:
+            batch = batch.unsqueeze(0)
+        batch = batch.permute(0, 3, 1, 2)
+        if device is not None:
+            batch = batch.to(device, non_blocking=True)
+        height, width = batch.shape[-2:]
+        if height != width:
+            max_dim = max(height, width)
+            top, left = (max_dim - height) // 2, (max_dim - width) // 2
+            batch = torch.nn.functional.pad(batch, (left, max_dim - width - left, top, max_dim - height - top), value=255)
+        return self.normalize_uint8(self._resize_uint8(batch), dtype)
+
 def encode_image_base64(pil_image):
     if pil_image.mode == 'RGBA':
         pil_image = pil_image.convert('RGB')  # Convert RGBA to RGB
@@ -67,8 +131,10 @@ def get_viewbox_size(svg_content):
     """Extract viewbox size from SVG content"""
     soup = BeautifulSoup(svg_content, 'xml')
     svg_tag = soup.find('svg')
-    if svg_tag and 'viewbox' in svg_tag.attrs:
-        viewbox = svg_tag['viewbox'].split()
+    # The xml parser keeps the case of attribute names
+    viewbox = svg_tag and (svg_tag.get('viewBox') or svg_tag.get('viewbox'))
+    if viewbox:
+        viewbox = re.split(r'[\s,]+', viewbox.strip())
         if len(viewbox) >= 4:
             return float(viewbox[2]), float(viewbox[3])
     return 100, 100  # Default size if viewbox not found
@@ -138,50 +204,43 @@ def use_placeholder():
     return VOID_SVF
 
 def process_and_rasterize_svg(svg_string, resolution=256, dpi=128, scale=2):
-    """Process SVG and create a placeholder image since we can't rasterize without Cairo"""
-    try:
-        svgstr2paths(svg_string)  # This will raise an exception if the svg is not valid
-        out_svg = svg_string
-    except:
-        try:
-            svg = clean_svg(svg_string)
-            svgstr2paths(svg)  # This will raise an exception if the svg is still not valid
-            out_svg = svg
-        except Exception as e:
-            out_svg = use_placeholder()
-    
-    # Create a placeholder image since we can't rasterize without Cairo
-    placeholder_image = Image.new('RGB', (resolution, resolution), color='white')
-    return out_svg, placeholder_image
+    """Repair the SVG and rasterize it"""
+    from starvector.data.svg_repair import repair_svg
+    out_svg = repair_svg(svg_string).svg
+    return out_svg, rasterize_svg(out_svg, resolution=resolution, dpi=dpi, scale=scale)
 
 def rasterize_svg(svg_string, resolution=224, dpi=128, scale=2):
-    """Create a placeholder image since we can't rasterize without Cairo"""
-    return Image.new('RGB', (resolution, resolution), color='white')
+    """Rasterize with the shared rasterization service (see `starvector.data.rasterizer`)"""
+    from starvector.data.rasterizer import get_rasterizer
+    return get_rasterizer().rasterize(svg_string, resolution=resolution, dpi=dpi, scale=scale)
+
+def rasterize_svgs(svg_strings, resolution=224, dpi=128, scale=2):
+    """Batch version of `rasterize_svg`, rendering the SVGs concurrently"""
+    from starvector.data.rasterizer import get_rasterizer
+    return get_rasterizer().rasterize_batch(svg_strings, resolution=resolution, dpi=dpi, scale=scale)
+
+def raster_diff(svg_a, svg_b, resolution=512, dpi=100, scale=1):
+    """
+    Mean absolute pixel difference in [0, 1] between the rasterizations of two SVGs. Raises
+    `RasterizationError` if either fails to render, since two blank images would compare as equal.
+    """
+    from starvector.data.rasterizer import get_rasterizer, RasterizationError
+    (image_a, image_b), errors = get_rasterizer().rasterize_batch([svg_a, svg_b], resolution=resolution, dpi=dpi, scale=scale, return_errors=True)
+    failed = [error for error in errors if error is not None]
+    if failed:
+        raise RasterizationError(f"Cannot compare, rendering failed: {'; '.join(failed)}")
+    diff = np.abs(np.asarray(image_a, dtype=np.int16) - np.asarray(image_b, dtype=np.int16))
+    return float(diff.mean()) / 255
 
 def find_unclosed_tags(svg_content):
-    """Find unclosed tags in SVG content"""
-    all_tags_pattern = r"<(\w+)"
-    self_closing_pattern = r"<\w+[^>]*\/>"
-    all_tags = re.findall(all_tags_pattern, svg_content)
-    self_closing_matches = re.findall(self_closing_pattern, svg_content)
-    self_closing_tags = []
-    
-    for match in self_closing_matches:
-        tag = re.search(all_tags_pattern, match)
-        if tag:
-            self_closing_tags.append(tag.group(1))    
-    unclosed_tags = []
-    
-    for tag in all_tags:
-        if all_tags.count(tag) > self_closing_tags.count(tag) + svg_content.count('</' + tag + '>'):
-            unclosed_tags.append(tag)
-    unclosed_tags = list(dict.fromkeys(unclosed_tags))
-    
-    return unclosed_tags
+    """Find unclosed tags in SVG content, in document order"""
+    from starvector.data.tag_balancer import TagBalancer
+    return list(dict.fromkeys(TagBalancer().feed(svg_content).unclosed_tags))
 
 # -------------- Plotting utils --------------
 def plot_images_side_by_side_with_metrics(image1, image2, l2_dist, CD, post_processed, out_path):
     """Plot images side by side with metrics"""
+    import matplotlib.pyplot as plt
     array1 = np.array(image1).astype(np.float32)
     array2 = np.array(image2).astype(np.float32)
     diff = np.abs(array1 - array2).astype(np.uint8)
@@ -204,6 +263,7 @@ def plot_images_side_by_side_with_metrics(image1, image2, l2_dist, CD, post_proc
 
 def plot_images_side_by_side(image1, image2, out_path):
     """Plot images side by side"""
+    import matplotlib.pyplot as plt
     array1 = np.array(image1).astype(np.float32)
     array2 = np.array(image2).astype(np.float32)
     diff = np.abs(array1 - array2).astype(np.uint8)
@@ -224,6 +284,7 @@ def plot_images_side_by_side(image1, image2, out_path):
     return image
 
 def plot_images_side_by_side_temperatures(samples_temp, metrics, sample_dir, outpath_filename):
+    import matplotlib.pyplot as plt
     # Create a plot with the original image and different temperature results
     num_temps = len(samples_temp)
     fig, axes = plt.subplots(2, num_temps + 1, figsize=(15, 4), gridspec_kw={'height_ratios': [10, 2]})
@@ -255,6 +316,7 @@ def plot_images_side_by_side_temperatures(samples_temp, metrics, sample_dir, out
     plt.close()
     
 def plot_images_and_prompt(prompt, svg_raster, gt_svg_raster, out_path):
+    import matplotlib.pyplot as plt
     # First col shows caption, second col shows generated svg, third col shows gt svg
     fig, axes = plt.subplots(1, 3, figsize=(10, 5))
     
@@ -277,6 +339,7 @@ def plot_images_and_prompt(prompt, svg_raster, gt_svg_raster, out_path):
     return image
     
 def plot_images_and_prompt_with_metrics(prompt, svg_raster, gt_svg_raster, clip_score, post_processed, out_path):
+    import matplotlib.pyplot as plt
     # First col shows caption, second col shows generated svg, third col shows gt svg
     fig, axes = plt.subplots(1, 3, figsize=(10, 5))
     
@@ -300,6 +363,7 @@ def plot_images_and_prompt_with_metrics(prompt, svg_raster, gt_svg_raster, clip_
     return image
 
 def plot_images_and_prompt_temperatures(prompt, samples_temp, metrics, sample_dir, outpath_filename):
+    import matplotlib.pyplot as plt
     # Calculate the number of temperature variations
     num_temps = len(samples_temp)
     
@@ -351,6 +415,7 @@ def plot_image_tensor(image):
 
 
 def plot_grid_samples(images, num_cols=5, out_path = 'grid.png'):
+    import matplotlib.pyplot as plt
     # Calculate the number of rows required for the grid
     num_images = len(images)
     num_rows = (num_images + num_cols - 1) // num_cols
@@ -5,11 +5,27 @@ from tqdm import tqdm
 from starvector.metrics.util import AverageMeter
 
 from transformers import AutoTokenizer
+from starvector.data.pretokenize import svg_hash
+
+TOKENIZER_NAME = "bigcode/starcoder2-7b"
 
 class CountTokenLength(BaseMetric): 
     def __init__(self, config=None, device='cuda'):
         super().__init__()
-        self.tokenizer = AutoTokenizer.from_pretrained("bigcode/starcoder2-7b")
+        self.tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+        # Ground truth token counts read from a dataset index (`python -m starvector.data.dataset_index`)
+        # counted with the same tokenizer, e.g. config {index: <file>}
+        self.gt_token_counts = {}
+        index = config.get('index') if hasattr(config, 'get') else None
+        if index:
+            from starvector.data.dataset_index import DatasetIndex
+            index = DatasetIndex(index)
+            if index.token_lengths(TOKENIZER_NAME) is not None:
+                # The index counts the training text, with the end tokens appended to the SVG
+                num_tokens = index['num_tokens'] - index.metadata['num_end_tokens']
+                self.gt_token_counts = dict(zip(index['svg_hash'].tolist(), num_tokens.tolist()))
+            else:
+                print(f"Index {index.path} was not counted with {TOKENIZER_NAME}, counting ground truth tokens")
         self.metric = self.calculate_token_length
         self.meter_gt_tokens = AverageMeter()
         self.meter_gen_tokens = AverageMeter()
@@ -17,11 +33,13 @@ class CountTokenLength(BaseMetric):
 
     def calculate_token_length(self, **kwargs):
         svg = kwargs.get('gt_svg')
-        tokens = self.tokenizer.encode(svg)
+        num_tokens = self.gt_token_counts.get(svg_hash(svg)) if self.gt_token_counts else None
+        if num_tokens is None:
+            num_tokens = len(self.tokenizer.encode(svg))
         gen_svg = kwargs.get('gen_svg')
         gen_tokens = self.tokenizer.encode(gen_svg)
-        diff = len(gen_tokens) - len(tokens)
-        return len(tokens), len(gen_tokens), diff
+        diff = len(gen_tokens) - num_tokens
+        return num_tokens, len(gen_tokens), diff
 
     def calculate_score(self, batch, update=None):
         gt_svgs = batch['gt_svg']
@@ -3,7 +3,7 @@ from starvector.metrics.compute_LPIPS import LPIPSDistanceCalculator
 from starvector.metrics.compute_SSIM import SSIMDistanceCalculator
 from starvector.metrics.compute_fid import FIDCalculator
 from starvector.metrics.compute_clip_score import CLIPScoreCalculator
-from starvector.data.util import rasterize_svg
+from starvector.data.util import rasterize_svgs
 from starvector.metrics.util import AverageMeter
 from starvector.metrics.compute_dino_score import DINOScoreCalculator
 from starvector.metrics.count_token_length import CountTokenLength
@@ -37,7 +37,7 @@ class SVGMetrics:
             'FID': lambda: FIDCalculator(model_name='InceptionV3'),
             'FID_clip': lambda: FIDCalculator(model_name='ViT-B/32'),
             'CLIPScore': CLIPScoreCalculator,
-            'CountTokenLength': CountTokenLength,
+            'CountTokenLength': lambda: CountTokenLength(config=self.config.get('CountTokenLength')),
             'ratio_post_processed': AverageMeter,
             'ratio_non_compiling': AverageMeter,
             'DinoScore': DINOScoreCalculator,
@@ -57,8 +57,8 @@ class SVGMetrics:
 
     def calculate_metrics(self, batch, update=True):
         if not self.batch_contains_raster(batch):
-            batch["gt_im"] = [rasterize_svg(svg) for svg in batch["gt_svg"]]
-            batch["gen_im"] = [rasterize_svg(svg) for svg in batch["gen_svg"]]
+            batch["gt_im"] = rasterize_svgs(batch["gt_svg"])
+            batch["gen_im"] = rasterize_svgs(batch["gen_svg"])
              
         avg_results_dict = {}
         all_results_dict = {}
@@ -100,8 +100,8 @@ class SVGMetrics:
     
     def calculate_fid(self, batch):
         if not self.batch_contains_raster(batch):
-            batch["gt_im"] = [rasterize_svg(svg) for svg in batch["gt_svg"]]
-            batch["gen_im"] = [rasterize_svg(svg) for svg in batch["gen_svg"]]
+            batch["gt_im"] = rasterize_svgs(batch["gt_svg"])
+            batch["gen_im"] = rasterize_svgs(batch["gen_svg"])
         
         return self.active_metrics['FID'].calculate_score(batch).item()
 
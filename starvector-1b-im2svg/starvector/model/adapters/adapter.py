@@ -1,4 +1,6 @@
+import math
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.nn.init as init
 import torch
 
@@ -51,3 +53,70 @@ class Adapter(nn.Module):
                         init.constant_(m.bias, 0)
                 else:
                     raise ValueError("Invalid initialization type specified.")
+            elif isinstance(m, nn.MultiheadAttention):
+                m._reset_parameters()
+            elif isinstance(m, (nn.LayerNorm, nn.BatchNorm1d)):
+                m.reset_parameters()
+
+class PooledAdapter(Adapter):
+    """
+    Adapter that merges neighbouring patch tokens with `pool_size` x `pool_size` average pooling before
+    the projection, e.g. 257 -> 65 tokens for CLIP ViT-L/14 at 224px and 576 -> 144 for SigLIP-384.
+    Leading tokens that are not part of the patch grid (the CLIP class token) are kept as they are.
+    The `c_fc` / `c_proj` weights have the same shapes as `Adapter`, so they can be initialized from it;
+    the norm is over the pooled `query_length` and is re-initialized.
+    """
+    def __init__(self, input_size, output_size, adapter_norm="layer_norm", init_type="glorot", query_length=32, dropout_prob=0.1, pool_size=2):
+        grid_size = math.isqrt(query_length)
+        num_prefix_tokens = query_length - grid_size ** 2
+        pooled_grid_size = math.ceil(grid_size / pool_size)
+        super().__init__(input_size, output_size, adapter_norm=adapter_norm, init_type=init_type,
+                         query_length=num_prefix_tokens + pooled_grid_size ** 2, dropout_prob=dropout_prob)
+        self.input_query_length = query_length
+        self.grid_size = grid_size
+        self.num_prefix_tokens = num_prefix_tokens
+        self.pool_size = pool_size
+
+    def pool(self, hidden_states):
+        prefix = hidden_states[:, :self.num_prefix_tokens]
+        patches = hidden_states[:, self.num_prefix_tokens:]
+        batch_size, _, hidden_size = patches.shape
+        patches = patches.transpose(1, 2).reshape(batch_size, hidden_size, self.grid_size, self.grid_size)
+        patches = F.avg_pool2d(patches, self.pool_size, ceil_mode=True, count_include_pad=False)
+        patches = patches.flatten(2).transpose(1, 2)
+        return torch.cat([prefix, patches], dim=1)
+
+    def forward(self, hidden_states):
+        return super().forward(self.pool(hidden_states))
+
+class ResamplerAdapter(Adapter):
+    """
+    Adapter that resamples the visual tokens to `num_queries` learned queries with one cross-attention
+    layer before the projection.
+    """
+    def __init__(self, input_size, output_size, adapter_norm="layer_norm", init_type="glorot", query_length=32, dropout_prob=0.1, num_queries=64, num_heads=8):
+        super().__init__(input_size, output_size, adapter_norm=adapter_norm, init_type=init_type,
+                         query_length=num_queries, dropout_prob=dropout_prob)
+        self.input_query_length = query_length
+        self.queries = nn.Parameter(torch.empty(num_queries, input_size))
+        self.ln_kv = nn.LayerNorm(input_size)
+        self.attn = nn.MultiheadAttention(input_size, num_heads, batch_first=True)
+        self._initialize_weights()
+
+    def forward(self, hidden_states):
+        kv = self.ln_kv(hidden_states)
+        queries = self.queries.unsqueeze(0).expand(hidden_states.size(0), -1, -1).to(kv.dtype)
+        hidden_states, _ = self.attn(queries, kv, kv, need_weights=False)
+        return super().forward(hidden_states)
+
+    def _initialize_weights(self):
+        super()._initialize_weights()
+        # Called by `Adapter.__init__` before the queries exist
+        if getattr(self, "queries", None) is not None:
+            init.normal_(self.queries, mean=0, std=0.02)
+
+ADAPTERS = {
+    'mlp': Adapter,
+    'pooled': PooledAdapter,
+    'resampler': ResamplerAdapter,
+}
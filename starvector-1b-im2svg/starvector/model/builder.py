@@ -4,8 +4,16 @@ from starvector.data.base import ImageTrainProcessor
 from starvector.util import dtype_mapping
 from transformers import AutoConfig
 
-def load_pretrained_model(model_path, device="cuda", **kwargs):
-    model = StarVectorForCausalLM.from_pretrained(model_path, **kwargs).to(device)
+def load_pretrained_model(model_path, device="cuda", shared_weights=False, **kwargs):
+    if shared_weights:
+        # Weights are views into memory-mapped safetensors shared by all worker processes on the host
+        from starvector.model.shared_weights import load_shared_pretrained_model
+        model = load_shared_pretrained_model(model_path, **kwargs)
+        if device != "cpu":
+            print(f"Warning: shared weights only stay shared on CPU, moving to {device} makes a private copy")
+            model = model.to(device)
+    else:
+        model = StarVectorForCausalLM.from_pretrained(model_path, **kwargs).to(device)
     tokenizer = model.model.svg_transformer.tokenizer
     image_processor = ImageTrainProcessor()
     context_len = model.model.query_length + model.model.max_length
@@ -23,9 +31,18 @@ def model_builder(config):
         "torch_dtype": dtype_mapping[config.training.model_precision],
         "transformer_layer_cls": config.model.get("transformer_layer_cls", False),
         "use_cache": config.model.use_cache,
+        "train_connector": config.training.get("train_connector", False),
+        "packing": config.training.get("packing", False),
+    }
+    adapter_args = {
+        "adapter_type": config.model.get("adapter_type", "mlp"),
+        "adapter_pool_size": config.model.get("adapter_pool_size", 2),
+        "adapter_num_queries": config.model.get("adapter_num_queries", 64),
     }
     if model_name:
-        model = StarVectorForCausalLM.from_pretrained(model_name, **args)
+        # Adapter settings override the pretrained config, so a pretrained model can be fine-tuned with a
+        # compressing adapter (missing or mismatched adapter weights are initialized by `_init_weights`)
+        model = StarVectorForCausalLM.from_pretrained(model_name, **args, **adapter_args)
     else:
         starcoder_model_config = AutoConfig.from_pretrained(config.model.starcoder_model_name)
 
@@ -34,6 +51,7 @@ def model_builder(config):
             image_encoder_type=config.model.image_encoder_type,
             use_flash_attn=config.model.use_flash_attn,
             adapter_norm=config.model.adapter_norm,
+            **adapter_args,
             starcoder_model_name=config.model.starcoder_model_name,
             torch_dtype=dtype_mapping[config.training.model_precision],
             num_attention_heads=starcoder_model_config.num_attention_heads,
@@ -0,0 +1,161 @@
+import os
+import numpy as np
+import torch
+
+# Heavy dependencies (fairscale, taming, open_clip, transformers vision models) are imported inside
+# `build`, so only the backend that is actually configured pulls them in.
+
+class ImageEncoderBackend:
+    """
+    Base class for image encoder backends.
+
+    A backend builds the vision modules on the owning `ImageEncoder` (so parameter names stay
+    `visual_encoder.*` / `ln_vision.*`), declares `hidden_size` and `query_length` of its output, and
+    implements `forward` and `process_images`.
+    """
+    def __init__(self, config, **kwargs):
+        self.image_encoder_type = config.image_encoder_type
+        self.image_size = config.image_size
+        self.torch_dtype = kwargs.get('model_precision', config.torch_dtype)
+        self.config = config
+        self.kwargs = kwargs
+        self.hidden_size = None
+        self.query_length = None
+
+    def build(self, encoder):
+        raise NotImplementedError("Image encoder backends must implement build")
+
+    def forward(self, encoder, image):
+        raise NotImplementedError("Image encoder backends must implement forward")
+
+    def process_images(self, encoder, images, dtype=None, device=None):
+        """
+        Preprocess a list of PIL images, or a uint8 [B, H, W, 3] array, into one contiguous [B, 3, H, W]
+        tensor in `dtype` on `device`, with a single host-to-device copy.
+        """
+        dtype = dtype or next(encoder.parameters()).dtype
+        processor = encoder.processor
+        is_array = isinstance(images, (np.ndarray, torch.Tensor))
+        if hasattr(processor, 'preprocess_array') and is_array:
+            return processor.preprocess_array(images, dtype=dtype, device=device)
+        if hasattr(processor, 'preprocess_batch'):
+            on_gpu = device is not None and torch.device(device).type == 'cuda'
+            pixel_values = processor.preprocess_batch(images, dtype=dtype, pin_memory=on_gpu)
+        else:
+            if is_array:
+                images = list(np.asarray(images))
+            pixel_values = processor(images=images, return_tensors="pt").pixel_values.to(dtype)
+        if device is not None:
+            pixel_values = pixel_values.to(device, non_blocking=True)
+        return pixel_values.contiguous()
+
+class CLIPBackend(ImageEncoderBackend):
+    """EVA/OpenAI CLIP ViT-L/14 (LAVIS implementation), one token per patch plus the class token"""
+    patch_size = 14
+    width = 1024
+
+    def build(self, encoder):
+        from starvector.model.image_encoder.clip_model import VisionTransformer, LayerNorm, convert_weights_to_precision
+        from starvector.data.util import ImageTrainProcessor
+
+        encoder.visual_encoder = VisionTransformer(
+            input_resolution=self.image_size,
+            patch_size=self.patch_size,
+            width=self.width,
+            layers=23,
+            heads=16,
+            use_grad_checkpointing=False)
+        encoder.ln_vision = LayerNorm(encoder.visual_encoder.num_features)
+        convert_weights_to_precision(encoder, self.torch_dtype)
+        encoder.processor = ImageTrainProcessor(size=self.image_size)
+
+        self.hidden_size = encoder.visual_encoder.num_features
+        self.query_length = encoder.visual_encoder.num_patches + 1
+
+    def forward(self, encoder, image):
+        embeds = encoder.visual_encoder(image)
+        return encoder.ln_vision(embeds)
+
+class VQGANBackend(ImageEncoderBackend):
+    """VQGAN encoder, flattened spatial latents as tokens"""
+    def build(self, encoder):
+        from omegaconf import OmegaConf
+        from taming.modules.diffusionmodules.model import Encoder
+        from starvector.data.util import ImageTrainProcessor
+
+        # You can download the checkpoint from https://github.com/EleutherAI/vqgan-clip/blob/main/README.md
+        vqgan_chkp_path = self.kwargs.get('vqgan_checkpoint') or getattr(self.config, 'vqgan_checkpoint', None) or os.environ.get('VQGAN_CHECKPOINT')
+        if not vqgan_chkp_path:
+            raise ValueError("The vqgan image encoder needs a checkpoint, set `vqgan_checkpoint` or the VQGAN_CHECKPOINT environment variable")
+
+        files_in_directory = os.listdir(os.path.join(vqgan_chkp_path, 'configs'))
+        vqgan_config_file = [file for file in files_in_directory if file.endswith('project.yaml')][0]
+        vqgan_config = OmegaConf.load(os.path.join(vqgan_chkp_path, 'configs', vqgan_config_file))
+        visual_encoder = Encoder(**vqgan_config.model.params.ddconfig)
+
+        # Load checkpoint weights, keeping only the encoder
+        checkpoint = torch.load(os.path.join(vqgan_chkp_path, 'checkpoints', 'last.ckpt'))['state_dict']
+        new_state_dict = {}
+        for key, value in checkpoint.items():
+            if key.startswith('encoder.'):
+                new_state_dict[key[len('encoder.'):]] = value
+        visual_encoder.load_state_dict(new_state_dict)
+
+        encoder.visual_encoder = visual_encoder
+        encoder.ln_vision = None
+        encoder.processor = ImageTrainProcessor(size=self.image_size)
+
+        self.hidden_size = vqgan_config.model.params.ddconfig.z_channels
+        self.query_length = 196
+
+    def forward(self, encoder, image):
+        out = encoder.visual_encoder(image)
+        size = out.size()
+        out = out.view(size[0], size[1], -1)
+        return out.permute(0, 2, 1)
+
+class ConvNextBackend(ImageEncoderBackend):
+    """OpenCLIP ConvNeXt-Base trunk, flattened final feature map as tokens"""
+    def build(self, encoder):
+        import open_clip
+        from starvector.data.util import ImageTrainProcessor
+
+        model, _, _ = open_clip.create_model_and_transforms('convnext_base_w', pretrained='laion2b_s13b_b82k')
+        encoder.visual_encoder = model.visual
+        encoder.ln_vision = None
+        encoder.processor = ImageTrainProcessor(size=self.image_size)
+
+        self.hidden_size = 1024
+        self.query_length = 49
+
+    def forward(self, encoder, image):
+        out = encoder.visual_encoder.trunk.forward_features(image)
+        size = out.size()
+        out = out.view(size[0], size[1], -1)
+        return out.permute(0, 2, 1)
+
+class SigLIPBackend(ImageEncoderBackend):
+    """SigLIP vision tower from transformers, one token per patch"""
+    model_names = {
+        'siglip_256': 'google/siglip-base-patch16-256',
+        'siglip_384': 'google/siglip-large-patch16-384',
+        'siglip_512': 'google/siglip-base-patch16-512',
+    }
+
+    def build(self, encoder):
+        from transformers import AutoProcessor, AutoModel
+
+        model_name = self.model_names[self.image_encoder_type]
+        encoder.visual_encoder = AutoModel.from_pretrained(
+            model_name, torch_dtype = self.torch_dtype
+        ).vision_model
+        encoder.processor = AutoProcessor.from_pretrained(
+            model_name, torch_dtype = self.torch_dtype
+        )
+
+        vision_config = encoder.visual_encoder.config
+        self.hidden_size = vision_config.hidden_size
+        self.query_length = (vision_config.image_size // vision_config.patch_size) ** 2
+
+    def forward(self, encoder, image):
+        return encoder.visual_encoder(image)["last_hidden_state"]
@@ -0,0 +1,132 @@
+import copy
+import os
+import torch
+import torch.nn as nn
+
+EXPORT_FORMATS = ['onnx', 'torch.export']
+
+class ImageEncoderWithProjection(nn.Module):
+    """Image encoder followed by the adapter, as a single stateless function of the image tensor"""
+    def __init__(self, image_encoder, image_projection):
+        super().__init__()
+        self.image_encoder = image_encoder
+        self.image_projection = image_projection
+
+    def forward(self, image):
+        embedded_image = self.image_encoder(image)
+        return self.image_projection(embedded_image)
+
+def export_image_encoder(model, output_path, export_format='onnx', image_size=None, opset_version=17):
+    """
+    Export the image encoder and adapter of a StarVector model as an ONNX or `torch.export` artifact.
+
+    The graph is exported in float32 on CPU with a dynamic batch dimension, so it can be served by an
+    optimized CPU runtime, possibly in a different process than the decoder.
+
+    Args:
+        model: `StarVectorForCausalLM` or `StarVectorBase` instance.
+        output_path (str): Where to write the artifact (`.onnx` or `.pt2`).
+        export_format (str): One of `EXPORT_FORMATS`.
+        image_size (int): Input resolution. Defaults to the encoder's configured size.
+        opset_version (int): ONNX opset.
+
+    Returns:
+        str: The path of the written artifact.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Export format {export_format} not supported. Available formats: {EXPORT_FORMATS}")
+
+    starvector = getattr(model, 'model', model)
+    if not starvector.use_image_encoder():
+        raise ValueError(f"Task {starvector.task} does not use an image encoder")
+
+    module = ImageEncoderWithProjection(
+        copy.deepcopy(starvector.image_encoder),
+        copy.deepcopy(starvector.image_projection),
+    ).float().cpu().eval()
+
+    if image_size is None:
+        image_size = starvector.image_encoder.image_size
+    # A batch of 1 would be specialized as a constant by the exporters, trace with 2
+    dummy_image = torch.randn(2, 3, image_size, image_size)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with torch.no_grad():
+        if export_format == 'onnx':
+            torch.onnx.export(
+                module,
+                (dummy_image,),
+                output_path,
+                input_names=['image'],
+                output_names=['image_embeds'],
+                dynamic_axes={'image': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+                opset_version=opset_version,
+                do_constant_folding=True,
+            )
+        else:
+            batch = torch.export.Dim('batch', min=1, max=1024)
+            exported_program = torch.export.export(module, (dummy_image,), dynamic_shapes=({0: batch},))
+            torch.export.save(exported_program, output_path)
+
+    print(f"Exported image encoder + adapter ({export_format}) to {output_path}")
+    return output_path
+
+class ONNXImageEncoderRuntime:
+    """Runs an exported image encoder + adapter through onnxruntime with all graph fusions enabled"""
+    def __init__(self, path, num_threads=None, providers=None, optimized_model_path=None):
+        import onnxruntime as ort
+
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            sess_options.intra_op_num_threads = num_threads
+        if optimized_model_path:
+            # Persist the fused graph so later processes can skip the optimization passes
+            sess_options.optimized_model_filepath = optimized_model_path
+
+        self.session = ort.InferenceSession(path, sess_options, providers=providers or ['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, image):
+        image = image.detach().to(device='cpu', dtype=torch.float32).contiguous()
+        outputs = self.session.run(None, {self.input_name: image.numpy()})
+        return torch.from_numpy(outputs[0])
+
+class TorchExportImageEncoderRuntime:
+    """Runs an image encoder + adapter saved with `torch.export`"""
+    def __init__(self, path):
+        self.module = torch.export.load(path).module()
+
+    def __call__(self, image):
+        with torch.inference_mode():
+            return self.module(image.detach().to(device='cpu', dtype=torch.float32))
+
+def load_image_encoder_runtime(path, **kwargs):
+    """Build the runtime matching the artifact written by `export_image_encoder`"""
+    if path.endswith('.onnx'):
+        return ONNXImageEncoderRuntime(path, **kwargs)
+    elif path.endswith('.pt2'):
+        return TorchExportImageEncoderRuntime(path)
+    else:
+        raise ValueError(f"Unknown image encoder artifact {path}, expected a .onnx or .pt2 file")
+
+def main(config):
+    from starvector.model.starvector_arch import StarVectorForCausalLM
+
+    model = StarVectorForCausalLM.from_pretrained(config.model_name, torch_dtype=torch.float32, trust_remote_code=True)
+    model.eval()
+    export_image_encoder(
+        model,
+        config.output_path,
+        export_format=config.get('format', 'onnx'),
+        image_size=config.get('image_size', None),
+        opset_version=config.get('opset_version', 17),
+    )
+
+if __name__ == "__main__":
+    from omegaconf import OmegaConf
+
+    cli_conf = OmegaConf.from_cli()
+    if 'model_name' not in cli_conf or 'output_path' not in cli_conf:
+        raise ValueError("Usage: python -m starvector.model.image_encoder.export model_name=<hf model or checkpoint> output_path=encoder.onnx [format=onnx|torch.export]")
+    main(cli_conf)
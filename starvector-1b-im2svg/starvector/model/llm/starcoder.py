@@ -12,6 +12,8 @@ class StarCoderModel(nn.Module):
         self.init_tokenizer(config.starcoder_model_name)
         
         self.max_length = config.max_length
+        # Skip reading StarCoder weights when the full StarVector state dict is assigned afterwards
+        load_llm_weights = kwargs.get('load_llm_weights', True)
         model_config = AutoConfig.from_pretrained(config.starcoder_model_name, trust_remote_code=True)
         kwargs = {}
         kwargs['trust_remote_code'] = True
@@ -27,7 +29,11 @@ class StarCoderModel(nn.Module):
         model_config.attn_implementation = "eager"
         
         # model = GPTBigCodeForCausalLM(config=model_config)
-        model = AutoModelForCausalLM.from_pretrained(config.starcoder_model_name, config=model_config, **kwargs)
+        if load_llm_weights:
+            model = AutoModelForCausalLM.from_pretrained(config.starcoder_model_name, config=model_config, **kwargs)
+        else:
+            kwargs.pop('use_flash_attention_2')
+            model = AutoModelForCausalLM.from_config(model_config, **kwargs)
         model.resize_token_embeddings(len(self.tokenizer))
         self.transformer = model
 
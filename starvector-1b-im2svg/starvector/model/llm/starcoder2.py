@@ -19,12 +19,20 @@ class StarCoderModel(nn.Module):
         model_config = AutoConfig.from_pretrained(config.starcoder_model_name, trust_remote_code=True)
         model_config.use_cache = config.use_cache
         model_config.use_bfloat16 = True
-        model = AutoModelForCausalLM.from_pretrained(
-            config.starcoder_model_name, 
-            config=model_config, 
-            attn_implementation="flash_attention_2", 
-            torch_dtype=torch.bfloat16, 
-            trust_remote_code=True)
+        if kwargs.get('load_llm_weights', True):
+            model = AutoModelForCausalLM.from_pretrained(
+                config.starcoder_model_name, 
+                config=model_config, 
+                attn_implementation="flash_attention_2", 
+                torch_dtype=torch.bfloat16, 
+                trust_remote_code=True)
+        else:
+            # Skip reading StarCoder2 weights when the full StarVector state dict is assigned afterwards
+            model = AutoModelForCausalLM.from_config(
+                model_config, 
+                attn_implementation="flash_attention_2", 
+                torch_dtype=torch.bfloat16, 
+                trust_remote_code=True)
         model.resize_token_embeddings(len(self.tokenizer))
         self.transformer = model
 
@@ -0,0 +1,230 @@
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+class RestrictedLMHead(nn.Module):
+    """
+    `lm_head` sliced to the rows of an SVG token subset. The full head is evaluated on the last position
+    to measure the probability mass falling outside the subset; if it exceeds `fallback_threshold`,
+    `fallback_triggered` is set so the caller can regenerate with the full vocabulary.
+
+    Evaluating the full head costs more than the restricted head saves, so the mass is only checked
+    every `check_every` steps and on the steps where the restricted distribution is unsure (top
+    probability below `min_confidence`), which is where a token outside the subset is needed. A
+    confidently restricted step needing another token can be missed; `check_every=1` checks every step.
+    """
+    def __init__(self, lm_head, token_ids, fallback_threshold=1e-3, check_every=16, min_confidence=0.5):
+        super().__init__()
+        self.register_buffer('token_ids', token_ids, persistent=False)
+        self.weight = nn.Parameter(lm_head.weight.detach()[token_ids].clone(), requires_grad=False)
+        if getattr(lm_head, 'bias', None) is not None:
+            self.bias = nn.Parameter(lm_head.bias.detach()[token_ids].clone(), requires_grad=False)
+        else:
+            self.bias = None
+        self.full_head = lm_head
+        self.fallback_threshold = fallback_threshold
+        self.check_every = check_every
+        self.min_confidence = min_confidence
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.checks = 0
+        self.fallback_triggered = False
+
+    def _needs_check(self, logits):
+        if self.fallback_triggered or not self.check_every:
+            return False
+        if self.steps % self.check_every == 0:
+            return True
+        top_prob = logits[:, -1].float().softmax(dim=-1).max(dim=-1).values
+        return top_prob.min().item() < self.min_confidence
+
+    def forward(self, hidden_states):
+        logits = F.linear(hidden_states, self.weight, self.bias)
+        if self._needs_check(logits):
+            self.checks += 1
+            full_probs = self.full_head(hidden_states[:, -1:]).float().softmax(dim=-1)
+            outside_mass = 1.0 - full_probs[..., self.token_ids].sum(dim=-1)
+            if outside_mass.max().item() > self.fallback_threshold:
+                self.fallback_triggered = True
+        self.steps += 1
+        return logits
+
+class RestrictedEmbedding(nn.Module):
+    """Input embedding that takes subset ids and looks up the corresponding full-vocabulary rows"""
+    def __init__(self, embedding, token_ids):
+        super().__init__()
+        self.embedding = embedding
+        self.register_buffer('token_ids', token_ids, persistent=False)
+
+    @property
+    def weight(self):
+        return self.embedding.weight
+
+    def forward(self, input_ids):
+        return self.embedding(self.token_ids[input_ids])
+
+class SVGVocabulary:
+    """
+    Subset of the tokenizer vocabulary used by SVG code. Generation can run entirely in the subset id
+    space: `lm_head` is sliced to the subset rows, sampled ids are fed back through a remapping embedding
+    and mapped back to full-vocabulary ids when generation ends.
+    """
+    def __init__(self, token_ids, stats=None):
+        self.token_ids = sorted(set(int(t) for t in token_ids))
+        self.stats = stats or {}
+        self.full_to_subset = {t: i for i, t in enumerate(self.token_ids)}
+        self.lm_head = None
+        self.embedding = None
+        self.num_generations = 0
+        self.num_fallbacks = 0
+
+    @classmethod
+    def from_corpus(cls, tokenizer, svgs, min_count=1, extra_tokens=("</svg>",)):
+        """Derive the subset from an SVG corpus, keeping special tokens and `extra_tokens` unconditionally"""
+        counts = Counter()
+        for svg in svgs:
+            counts.update(tokenizer.encode(svg, add_special_tokens=False))
+
+        kept = {token_id for token_id, count in counts.items() if count >= min_count}
+        total_tokens = sum(counts.values())
+        covered_tokens = sum(counts[token_id] for token_id in kept)
+
+        kept.update(tokenizer.all_special_ids)
+        kept.update(tokenizer.convert_tokens_to_ids(list(tokenizer.get_added_vocab().keys())))
+        for token in extra_tokens:
+            kept.update(tokenizer.encode(token, add_special_tokens=False))
+
+        stats = {
+            'num_svgs': len(svgs),
+            'corpus_tokens': total_tokens,
+            'observed_tokens': len(counts),
+            'vocab_size': len(tokenizer),
+            'subset_size': len(kept),
+            'subset_ratio': len(kept) / len(tokenizer),
+            'coverage': covered_tokens / total_tokens if total_tokens else 1.0,
+            'min_count': min_count,
+        }
+        return cls(kept, stats)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'token_ids': self.token_ids, 'stats': self.stats}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['token_ids'], data.get('stats'))
+
+    def bind(self, transformer, **kwargs):
+        """Slice the transformer's `lm_head` once. Call after the model has been moved to its device."""
+        lm_head = transformer.get_output_embeddings()
+        token_ids = torch.tensor(self.token_ids, dtype=torch.long, device=lm_head.weight.device)
+        self.lm_head = RestrictedLMHead(lm_head, token_ids, **kwargs)
+        self.embedding = RestrictedEmbedding(transformer.get_input_embeddings(), token_ids)
+
+    def to_subset_ids(self, token_ids):
+        return [self.full_to_subset[t] for t in token_ids if t in self.full_to_subset]
+
+    def to_full_ids(self, subset_ids):
+        return self.lm_head.token_ids[subset_ids]
+
+    @property
+    def fallback_triggered(self):
+        return self.lm_head.fallback_triggered
+
+    @contextmanager
+    def restrict(self, transformer):
+        """Swap the restricted head and embedding into `transformer` for the duration of a generate call"""
+        if self.lm_head is None:
+            raise ValueError("SVGVocabulary is not bound to a model, call bind(transformer) first")
+        full_head = transformer.get_output_embeddings()
+        full_embedding = transformer.get_input_embeddings()
+        self.lm_head.reset()
+        transformer.set_output_embeddings(self.lm_head)
+        transformer.set_input_embeddings(self.embedding)
+        try:
+            yield
+        finally:
+            transformer.set_output_embeddings(full_head)
+            transformer.set_input_embeddings(full_embedding)
+            self.num_generations += 1
+            self.num_fallbacks += int(self.lm_head.fallback_triggered)
+
+    def report(self):
+        return {
+            **self.stats,
+            'num_generations': self.num_generations,
+            'num_fallbacks': self.num_fallbacks,
+            'fallback_rate': self.num_fallbacks / self.num_generations if self.num_generations else 0.0,
+        }
+
+def benchmark_lm_head(vocabulary, hidden_size, full_vocab_size, batch_size=1, num_steps=200, top_p=0.9, device='cpu', dtype=torch.float32, **kwargs):
+    """
+    Time one decode step of logits + top-p sampling with the full head and with a `RestrictedLMHead`
+    built with `kwargs` (its default check policy otherwise), including its out-of-subset checks. The
+    hidden states point at subset tokens, like the mostly confident steps of SVG code.
+    """
+    def decode_step(head, hidden_states):
+        logits = head(hidden_states)[:, -1]
+        sorted_logits, sorted_indices = torch.sort(logits, descending=True)
+        sorted_probs = sorted_logits.softmax(dim=-1)
+        # Keep the tokens up to and including the one crossing `top_p`
+        sorted_logits[sorted_probs.cumsum(dim=-1) - sorted_probs > top_p] = -float('inf')
+        return sorted_indices.gather(-1, torch.multinomial(sorted_logits.softmax(dim=-1), 1))
+
+    full_head = nn.Linear(hidden_size, full_vocab_size, bias=False).to(device=device, dtype=dtype)
+    token_ids = torch.tensor(vocabulary.token_ids, device=device)
+    restricted_head = RestrictedLMHead(full_head, token_ids, **kwargs)
+    targets = token_ids[torch.randint(len(token_ids), (num_steps + 1, batch_size), device=device)]
+    with torch.no_grad():
+        hidden_states = full_head.weight[targets].unsqueeze(2) * (50.0 / full_head.weight[targets].norm(dim=-1, keepdim=True).unsqueeze(2))
+
+    timings = {}
+    with torch.no_grad():
+        for name, head in [('full', full_head), ('restricted', restricted_head)]:
+            decode_step(head, hidden_states[0])
+            restricted_head.reset()
+            if device != 'cpu':
+                torch.cuda.synchronize()
+            start = time.time()
+            for i in range(num_steps):
+                decode_step(head, hidden_states[i + 1])
+            if device != 'cpu':
+                torch.cuda.synchronize()
+            timings[f'{name}_ms_per_step'] = 1000 * (time.time() - start) / num_steps
+    timings['speedup'] = timings['full_ms_per_step'] / timings['restricted_ms_per_step']
+    timings['check_rate'] = restricted_head.checks / num_steps
+    return timings
+
+def main(config):
+    from datasets import load_dataset
+    from transformers import AutoModelForCausalLM
+
+    model = AutoModelForCausalLM.from_pretrained(config.model_name, trust_remote_code=True)
+    tokenizer = model.model.svg_transformer.tokenizer
+
+    data = load_dataset(config.get('dataset_name', 'starvector/svg-stack'), split=config.get('split', 'train'))
+    num_samples = config.get('num_samples', -1)
+    if num_samples != -1:
+        data = data.select(range(num_samples))
+
+    vocabulary = SVGVocabulary.from_corpus(tokenizer, data['Svg'], min_count=config.get('min_count', 1))
+    lm_head = model.model.svg_transformer.transformer.get_output_embeddings()
+    vocabulary.stats.update(benchmark_lm_head(vocabulary, lm_head.weight.shape[1], lm_head.weight.shape[0]))
+    vocabulary.save(config.output_path)
+    print(json.dumps(vocabulary.stats, indent=4))
+
+if __name__ == "__main__":
+    from omegaconf import OmegaConf
+
+    cli_conf = OmegaConf.from_cli()
+    if 'model_name' not in cli_conf or 'output_path' not in cli_conf:
+        raise ValueError("Usage: python -m starvector.model.llm.svg_vocabulary model_name=<model> output_path=svg_vocab.json [dataset_name=... num_samples=... min_count=...]")
+    main(cli_conf)
@@ -1,9 +1,12 @@
 import torch
 import torch.nn as nn
 from abc import ABC, abstractmethod
-from starvector.model.adapters.adapter import Adapter
+from starvector.model.adapters.adapter import ADAPTERS
 from starvector.model.image_encoder.image_encoder import ImageEncoder
+from starvector.model.packing import pack_sequences, block_diagonal_attention
+from starvector.data.pretokenize import pad_token_ids, truncate_token_ids
 from starvector.util import print_trainable_parameters
+from transformers import BatchEncoding
 from transformers.generation.stopping_criteria import StoppingCriteria, StoppingCriteriaList
 
 class StoppingCriteriaSub(StoppingCriteria):
@@ -25,6 +28,10 @@ class StarVectorBase(nn.Module, ABC):
         # Task-specific layers
         self.task = kwargs.get('task', 'im2svg')
         self.model_precision = kwargs.get('model_precision', config.torch_dtype)
+        # Optional exported (ONNX / torch.export) runtime for the image encoder + adapter
+        self.image_encoder_runtime = None
+        # Optional SVG token subset used to restrict lm_head during generation
+        self.svg_vocabulary = None
         # Build Code LLM (StarCoder)
         self.svg_transformer = self._get_svg_transformer(config, **kwargs)
         
@@ -38,6 +45,11 @@ class StarVectorBase(nn.Module, ABC):
             self.query_length = 0
             
         self.max_length = config.max_length_train - self.query_length - 4  # for added special tokens
+        self.max_length_train = config.max_length_train
+        # Concatenate the samples of a training batch into max_length_train rows (see `_pack`)
+        self.packing = kwargs.get('packing', False)
+        # Real tokens and sequence positions of the last training batch, for throughput logging
+        self.token_stats = None
         
         self.train_image_encoder = kwargs.get('train_image_encoder', False)
         self.train_LLM = kwargs.get('train_LLM', False)
@@ -71,39 +83,31 @@ class StarVectorBase(nn.Module, ABC):
 
     def get_adapter(self, config, **kwargs):
         """Get adapter layer for image projection"""
-        vision_hidden_size, self.query_length = self.get_hidden_size_and_query_length(config.image_encoder_type)
+        vision_hidden_size, query_length = self.get_hidden_size_and_query_length(config.image_encoder_type)
         llm_hidden_size = self.svg_transformer.transformer.config.hidden_size
-        image_projection = Adapter(
+        adapter_type = getattr(config, 'adapter_type', 'mlp')
+        if adapter_type not in ADAPTERS:
+            raise ValueError(f"Adapter {adapter_type} not supported. Available adapters: {list(ADAPTERS.keys())}")
+        adapter_kwargs = {}
+        if adapter_type == 'pooled':
+            adapter_kwargs['pool_size'] = config.adapter_pool_size
+        elif adapter_type == 'resampler':
+            adapter_kwargs['num_queries'] = config.adapter_num_queries
+        image_projection = ADAPTERS[adapter_type](
             vision_hidden_size,
             llm_hidden_size,
             adapter_norm=config.adapter_norm,
-            query_length=self.query_length,
-            dropout_prob=kwargs.get('dropout', 0.1)
+            query_length=query_length,
+            dropout_prob=kwargs.get('dropout', 0.1),
+            **adapter_kwargs
         )
+        # Number of visual tokens prepended to the sequence, after compression by the adapter
+        self.query_length = image_projection.query_length
         return image_projection
 
-    def get_hidden_size_and_query_length(self, image_encoder_type):
-        """Get hidden size and query length based on encoder type"""
-        if image_encoder_type == 'clip':
-            hidden_size = self.image_encoder.visual_encoder.num_features
-            query_length = 257
-        elif image_encoder_type == 'open-clip':
-            hidden_size = self.image_encoder.visual_encoder.transformer.width
-            query_length = 256
-        elif image_encoder_type == 'vqgan':
-            hidden_size = 256
-            query_length = 196
-        elif image_encoder_type == 'convnext':
-            hidden_size = 1024
-            query_length = 49
-        elif 'siglip' in image_encoder_type:
-            hidden_size = self.image_encoder.visual_encoder.head.mlp.fc2.out_features
-            if '512' in image_encoder_type:
-                query_length = 1024
-            elif '384' in image_encoder_type:
-                query_length = 576
-            
-        return hidden_size, query_length
+    def get_hidden_size_and_query_length(self, image_encoder_type=None):
+        """Get hidden size and query length declared by the image encoder backend"""
+        return self.image_encoder.hidden_size, self.image_encoder.query_length
 
     def _tokenize(self, text, max_length, device, add_special_tokens=True):
         """Common tokenization logic"""
@@ -127,28 +131,94 @@ class StarVectorBase(nn.Module, ABC):
         """Get embeddings from input ids - implementation differs between v1 and v2"""
         pass
 
-    def embed_text_to_svg(self, batch, device):
-        """Common text to SVG embedding logic"""
+    def _collate_svg_ids(self, svg_input_ids, device):
+        """Pad pre-tokenized target ids (see `starvector.data.pretokenize`) into what `_tokenize` returns for their text"""
+        tokenizer = self.svg_transformer.tokenizer
+        input_ids, attention_mask = pad_token_ids(svg_input_ids, self.max_length, tokenizer.pad_token_id,
+                                                  tokenizer.padding_side, tokenizer.truncation_side)
+        return BatchEncoding({'input_ids': input_ids, 'attention_mask': attention_mask}).to(device)
+
+    def _tokenize_unpadded(self, text, max_length, device, input_ids=None):
+        """Token ids of every text (or of pre-tokenized `input_ids`), truncated but not padded, and their embeddings"""
+        tokenizer = self.svg_transformer.tokenizer
+        if input_ids is None:
+            input_ids = tokenizer(text, truncation=True, max_length=max_length)['input_ids']
+        else:
+            input_ids = [truncate_token_ids(ids.tolist(), max_length, tokenizer.truncation_side) for ids in input_ids]
+        flat_ids = torch.tensor([i for ids in input_ids for i in ids], dtype=torch.long, device=device)
+        embeds = self._get_embeddings(flat_ids).split([len(ids) for ids in input_ids])
+        return [torch.tensor(ids, dtype=torch.long, device=device) for ids in input_ids], embeds
+
+    def _pack(self, sample_embeds, sample_targets, device):
+        """
+        Concatenate samples (embeddings [n_i, hidden] and targets [n_i]) into as few rows of at most
+        `max_length_train` positions as possible. The target of the first position of every sample is
+        masked, as it would be predicted from the previous sample. Returns the row embeddings and
+        targets, position ids restarting at every sample, and the index of the sample of every
+        position in its row (padding is one more sample), for `block_diagonal_attention`.
+        """
+        lengths = [len(targets) for targets in sample_targets]
+        rows = pack_sequences(lengths, self.max_length_train)
+        width = max(sum(lengths[i] for i in row) for row in rows)
+        inputs_embeds = sample_embeds[0].new_zeros(len(rows), width, sample_embeds[0].size(-1))
+        targets = torch.full((len(rows), width), -100, dtype=torch.long, device=device)
+        position_ids = torch.arange(width, device=device).repeat(len(rows), 1)
+        seq_ids = torch.full((len(rows), width), len(lengths), dtype=torch.long, device=device)
+        for r, row in enumerate(rows):
+            start = 0
+            for i in row:
+                end = start + lengths[i]
+                inputs_embeds[r, start:end] = sample_embeds[i]
+                targets[r, start + 1:end] = sample_targets[i][1:]
+                position_ids[r, start:end] = torch.arange(lengths[i], device=device)
+                seq_ids[r, start:end] = i
+                start = end
+            position_ids[r, start:] = torch.arange(width - start, device=device)
+        self.token_stats = {'tokens': sum(lengths), 'positions': len(rows) * width}
+        return inputs_embeds, seq_ids, targets, position_ids
+
+    def embed_text_to_svg(self, batch, device, packing=False):
+        """
+        Common text to SVG embedding logic. With `packing`, returns packed rows (see `_pack`): embeddings,
+        sample index of every position, targets and position ids.
+        """
         captions = batch["caption"]
         svgs = batch["svg"]
         samples = [captions[i] + self.svg_transformer.svg_start_token + svgs[i] + self.svg_transformer.tokenizer.eos_token 
                   for i in range(len(captions))]
 
+        if packing:
+            input_ids, embeds = self._tokenize_unpadded(samples, self.max_length, device)
+            return self._pack(embeds, input_ids, device)
+
         tokens = self._tokenize(samples, self.max_length, device)
         targets = self._create_targets(tokens)
         inputs_embeds = self._get_embeddings(tokens.input_ids)
+        self.token_stats = {'tokens': int(tokens.attention_mask.sum()), 'positions': tokens.attention_mask.numel()}
         
         return inputs_embeds, tokens.attention_mask, targets
 
+    def load_image_encoder_runtime(self, path, **kwargs):
+        """Run the image encoder and adapter through an artifact written by `export_image_encoder`"""
+        from starvector.model.image_encoder.export import load_image_encoder_runtime
+        self.image_encoder_runtime = load_image_encoder_runtime(path, **kwargs)
+
     def get_image_embeddings(self, batch, device):
         """Get image embeddings"""
-        image = batch["image"].to(dtype=self.model_precision)
+        if self.image_encoder_runtime is not None and not self.training:
+            conditioning_embeds = self.image_encoder_runtime(batch["image"])
+            return conditioning_embeds.to(device=device, dtype=self.model_precision)
+
+        image = batch["image"].to(device=device, dtype=self.model_precision)
         embedded_image = self.image_encoder(image)
         conditioning_embeds = self.image_projection(embedded_image)
         return conditioning_embeds
     
-    def embed_im_to_svg(self, batch, device):
-        """Common image to SVG embedding logic"""
+    def embed_im_to_svg(self, batch, device, packing=False):
+        """
+        Common image to SVG embedding logic. With `packing`, returns packed rows of (visual prefix + SVG)
+        samples (see `_pack`): embeddings, sample index of every position, targets and position ids.
+        """
         # Process image
         image = batch["image"].to(dtype=self.model_precision)
         embedded_image = self.image_encoder(image)
@@ -157,8 +227,19 @@ class StarVectorBase(nn.Module, ABC):
 
         # Get SVG text with appropriate end tokens (implemented by subclasses)
         svg_text = self._get_svg_text(batch["svg"])
+
+        if packing:
+            input_ids, embeds = self._tokenize_unpadded(svg_text, self.max_length, device, batch.get("svg_input_ids"))
+            prefix_targets = torch.full((conditioning_embeds.size(1),), -100, dtype=torch.long, device=device)
+            sample_embeds = [torch.cat([conditioning_embeds[i], embeds[i].to(conditioning_embeds.dtype)]) for i in range(len(input_ids))]
+            sample_targets = [torch.cat([prefix_targets, ids]) for ids in input_ids]
+            return self._pack(sample_embeds, sample_targets, device)
         
-        svg_tokens = self._tokenize(svg_text, self.max_length, device)
+        if "svg_input_ids" in batch:
+            # Tokenized offline or in the dataloader workers
+            svg_tokens = self._collate_svg_ids(batch["svg_input_ids"], device)
+        else:
+            svg_tokens = self._tokenize(svg_text, self.max_length, device)
         svg_tokens_embeds = self._get_embeddings(svg_tokens.input_ids)
 
         inputs_embeds = torch.cat([conditioning_embeds, svg_tokens_embeds], dim=1)
@@ -168,6 +249,7 @@ class StarVectorBase(nn.Module, ABC):
         targets = torch.cat([empty_targets, svg_targets], dim=1)
 
         attention_mask = torch.cat([conditioning_embeds_att, svg_tokens.attention_mask], dim=1)
+        self.token_stats = {'tokens': int(attention_mask.sum()), 'positions': attention_mask.numel()}
         
         return inputs_embeds, attention_mask, targets
 
@@ -176,6 +258,21 @@ class StarVectorBase(nn.Module, ABC):
         device = batch["image"].device
         task = self.task
 
+        if self.packing and self.training:
+            embed = self.embed_text_to_svg if task == 'text2svg' else self.embed_im_to_svg
+            inputs_embeds, seq_ids, targets, position_ids = embed(batch, device, packing=True)
+            # No attention across the samples packed in a row
+            with block_diagonal_attention(self.svg_transformer.transformer, seq_ids) as attention_mask:
+                outputs = self.svg_transformer.transformer(
+                    inputs_embeds=inputs_embeds,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    labels=targets,
+                    return_dict=True,
+                    use_cache=False,
+                )
+            return outputs.loss
+
         # Depending 
         if task == 'text2svg':
             inputs_embeds, attention_mask, targets = self.embed_text_to_svg(batch, device)
@@ -202,16 +299,12 @@ class StarVectorBase(nn.Module, ABC):
     
     def _prepare_generation_inputs(self, batch, prompt, device):
         """Common preparation for generation inputs"""
-        image = batch["image"]
-        image = image.to(device).to(self.model_precision)
-        
-        embedded_image = self.image_encoder(image)
-        embedded_image = self.image_projection(embedded_image)
+        embedded_image = self.get_image_embeddings(batch, device)
         embedded_att = torch.ones(embedded_image.size()[:-1], dtype=torch.long).to(device)
         
         if prompt is None:
             prompt = self.svg_transformer.prompt
-        prompt = [prompt] * image.size(0)   
+        prompt = [prompt] * embedded_image.size(0)
         
         prompt_tokens = self._tokenize(prompt, None, device, add_special_tokens=False)
         attention_mask = torch.cat([embedded_att, prompt_tokens.attention_mask], dim=1)    
@@ -252,12 +345,42 @@ class StarVectorBase(nn.Module, ABC):
         # Let subclasses override these defaults if needed
         generation_kwargs.update(self._get_im2svg_specific_kwargs(kwargs))
         
-        outputs = self.svg_transformer.transformer.generate(**generation_kwargs)
+        if self.svg_vocabulary is not None and kwargs.get('use_svg_vocabulary', True):
+            outputs = self._generate_with_svg_vocabulary(generation_kwargs)
+        else:
+            outputs = self.svg_transformer.transformer.generate(**generation_kwargs)
         outputs = torch.cat([prompt_tokens.input_ids, outputs], dim=1)
         raw_svg = self.svg_transformer.tokenizer.batch_decode(outputs, skip_special_tokens=True)
 
         return raw_svg
 
+    def set_svg_vocabulary(self, vocabulary, **kwargs):
+        """Restrict generation to an `SVGVocabulary`. lm_head is sliced once, so call after moving the model to its device."""
+        if vocabulary is not None:
+            vocabulary.bind(self.svg_transformer.transformer, **kwargs)
+        self.svg_vocabulary = vocabulary
+
+    def _generate_with_svg_vocabulary(self, generation_kwargs):
+        """Generate in the SVG vocabulary id space, falling back to the full vocabulary if the model needs other tokens"""
+        vocabulary = self.svg_vocabulary
+        tokenizer = self.svg_transformer.tokenizer
+        end_sequence = tokenizer("</svg>", add_special_tokens=False)['input_ids']
+        pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+        restricted_kwargs = {
+            **generation_kwargs,
+            'stopping_criteria': StoppingCriteriaList([StoppingCriteriaSub(stops=[vocabulary.to_subset_ids(end_sequence)])]),
+            'eos_token_id': vocabulary.to_subset_ids([tokenizer.eos_token_id]),
+            'pad_token_id': vocabulary.to_subset_ids([pad_token_id])[0],
+        }
+        with vocabulary.restrict(self.svg_transformer.transformer):
+            outputs = self.svg_transformer.transformer.generate(**restricted_kwargs)
+
+        if vocabulary.fallback_triggered:
+            print("Warning: tokens outside the SVG vocabulary were needed, regenerating with the full vocabulary")
+            return self.svg_transformer.transformer.generate(**generation_kwargs)
+        return vocabulary.to_full_ids(outputs)
+
     def generate_im2svg_grpo(self, batch, **kwargs):
         """Base implementation of image to SVG generation"""
         inputs_embeds, attention_mask, prompt_tokens = self._prepare_generation_inputs(
@@ -296,7 +419,7 @@ class StarVectorBase(nn.Module, ABC):
 
     def generate_text2svg(self, batch, **kwargs):
         """Base implementation of text to SVG generation"""
-        device = batch["image"].device
+        device = batch["device"] if "device" in batch else batch["image"].device
         prompt = batch["caption"]
         
         prompt_tokens = self._tokenize(
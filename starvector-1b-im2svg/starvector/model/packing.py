@@ -0,0 +1,73 @@
+from contextlib import contextmanager
+import torch
+
+def pack_sequences(lengths, capacity):
+    """
+    Assign sequences of `lengths` to rows of at most `capacity` positions, first-fit decreasing.
+    Returns the sequence indices of every row, in their order in the row.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    rows, free = [], []
+    for i in order:
+        for r, space in enumerate(free):
+            if lengths[i] <= space:
+                rows[r].append(i)
+                free[r] -= lengths[i]
+                break
+        else:
+            rows.append([i])
+            free.append(capacity - lengths[i])
+    return rows
+
+def block_diagonal_mask(seq_ids):
+    """
+    [batch_size, length, length] boolean mask letting every position attend to the earlier positions
+    of its own sequence. `seq_ids` [batch_size, length] holds the index of the sequence of each
+    position in its row (padding is one more sequence).
+    """
+    causal = torch.ones(seq_ids.size(1), seq_ids.size(1), dtype=torch.bool, device=seq_ids.device).tril()
+    return (seq_ids[:, :, None] == seq_ids[:, None, :]) & causal
+
+def _restrict_layer_mask(layer_mask, allowed):
+    """Combine a GPTBigCode layer mask (boolean or additive, MQA or MHA layout) with a [batch_size, query, key] mask"""
+    # MQA eager masks are [batch_size, query, 1, key], the others [batch_size, 1, query, key]
+    allowed = allowed[:, None] if layer_mask.size(1) == 1 else allowed[:, :, None]
+    if layer_mask.dtype == torch.bool:
+        return layer_mask & allowed
+    return torch.where(allowed, layer_mask, torch.finfo(layer_mask.dtype).min)
+
+@contextmanager
+def block_diagonal_attention(transformer, seq_ids):
+    """
+    Keep the attention of sequences packed in the same row apart, for a forward pass of `transformer`
+    (a HF causal LM). Yields the attention mask to pass with position ids restarting at every sequence:
+    - flash_attention_2: no mask, HF splits the rows at the position id resets (varlen kernels)
+    - GPTBigCode: no mask; its layers only take the causal mask they build themselves, which is
+      combined with the block-diagonal one by forward pre-hooks on the blocks for this context
+    - other models: a 4D additive block-diagonal mask
+    """
+    config = transformer.config
+    if getattr(config, '_attn_implementation', None) == 'flash_attention_2':
+        yield None
+        return
+    allowed = block_diagonal_mask(seq_ids)
+    if config.model_type != 'gpt_bigcode':
+        dtype = transformer.get_input_embeddings().weight.dtype
+        mask = torch.zeros(allowed.shape, dtype=dtype, device=allowed.device).masked_fill(~allowed, torch.finfo(dtype).min)
+        yield mask[:, None]
+        return
+
+    def restrict(module, args, kwargs):
+        # attention_mask is the third argument of GPTBigCodeBlock.forward, positional under gradient checkpointing
+        if kwargs.get('attention_mask') is not None:
+            kwargs['attention_mask'] = _restrict_layer_mask(kwargs['attention_mask'], allowed)
+        elif len(args) > 2 and args[2] is not None:
+            args = args[:2] + (_restrict_layer_mask(args[2], allowed),) + args[3:]
+        return args, kwargs
+
+    handles = [block.register_forward_pre_hook(restrict, with_kwargs=True) for block in transformer.transformer.h]
+    try:
+        yield None
+    finally:
+        for handle in handles:
+            handle.remove()
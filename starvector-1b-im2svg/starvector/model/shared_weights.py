@@ -0,0 +1,140 @@
+import json
+import mmap
+import os
+import struct
+import torch
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+# One mapping per file and process, shared by every tensor viewing into it
+_mappings = {}
+
+def mmap_safetensors(path):
+    """
+    Map a safetensors file into memory and return its tensors as views into the mapping.
+
+    The file is mapped copy-on-write (MAP_PRIVATE): pages come straight from the page cache, so every
+    process mapping the same file shares one physical copy of the weights. A write only duplicates the
+    touched page in the writing process instead of corrupting the shared file.
+    """
+    path = os.path.realpath(path)
+    if path not in _mappings:
+        with open(path, 'rb') as f:
+            _mappings[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    buffer = _mappings[path]
+
+    header_size = struct.unpack('<Q', buffer[:8])[0]
+    header = json.loads(buffer[8:8 + header_size])
+    header.pop('__metadata__', None)
+    data_start = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = SAFETENSORS_DTYPES[info['dtype']]
+        start, end = info['data_offsets']
+        count = (end - start) // dtype.itemsize
+        if count == 0:
+            tensors[name] = torch.empty(info['shape'], dtype=dtype)
+            continue
+        tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + start)
+        tensors[name] = tensor.view(info['shape'])
+    return tensors
+
+def resolve_safetensors_files(model_path):
+    """Return the local model directory and the safetensors files holding its weights"""
+    if not os.path.isdir(model_path):
+        from huggingface_hub import snapshot_download
+        model_path = snapshot_download(model_path, allow_patterns=["*.safetensors", "*.json", "*.py", "*.txt", "*.model"])
+
+    index_file = os.path.join(model_path, 'model.safetensors.index.json')
+    if os.path.exists(index_file):
+        with open(index_file) as f:
+            weight_map = json.load(f)['weight_map']
+        files = sorted(set(weight_map.values()))
+    else:
+        files = ['model.safetensors']
+
+    files = [os.path.join(model_path, f) for f in files]
+    for f in files:
+        if not os.path.exists(f):
+            raise FileNotFoundError(f"Shared weights require safetensors checkpoints, {f} not found")
+    return model_path, files
+
+def cast_safetensors(path, torch_dtype, cache_dir=None):
+    """
+    Return a safetensors file holding the tensors of `path` with their floating point tensors cast to
+    `torch_dtype`: `path` itself when they already are, otherwise a copy written once to `cache_dir`
+    (a directory named after the dtype next to `path` by default). Every process casting the same file
+    maps the same copy, so the cast weights are shared like the stored ones. The copy is written to a
+    temporary file and renamed, so processes casting concurrently never map a partial file.
+    """
+    from safetensors.torch import load_file, save_file
+
+    tensors = mmap_safetensors(path)
+    if all(not tensor.is_floating_point() or tensor.dtype == torch_dtype for tensor in tensors.values()):
+        return path
+    dtype_name = str(torch_dtype).rsplit('.', 1)[-1]
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.realpath(path)), dtype_name)
+    cast_path = os.path.join(cache_dir, os.path.basename(path))
+    if not os.path.exists(cast_path) or os.path.getmtime(cast_path) < os.path.getmtime(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        print(f"Casting {path} to {dtype_name} in {cache_dir}")
+        tensors = {name: tensor.to(torch_dtype) if tensor.is_floating_point() else tensor
+                   for name, tensor in load_file(path).items()}
+        tmp_path = f"{cast_path}.{os.getpid()}.tmp"
+        save_file(tensors, tmp_path)
+        os.replace(tmp_path, cast_path)
+    return cast_path
+
+def load_shared_pretrained_model(model_path, torch_dtype=None, cache_dir=None, **kwargs):
+    """
+    Load a `StarVectorForCausalLM` whose parameters are views into memory-mapped safetensors files.
+
+    The model skeleton is built without allocating weights, then every parameter is assigned a view
+    into the mapping. All workers on a host loading the same checkpoint share the weights through the
+    page cache, so per-worker RSS is reduced to activations and KV cache. This is meant for CPU
+    inference: moving the model to another device makes a private copy. When `torch_dtype` differs from
+    the stored dtype, the checkpoint is cast once to a file in `cache_dir` (see `cast_safetensors`) and
+    the weights are views into that file instead.
+    """
+    from accelerate import init_empty_weights
+    from starvector.model.starvector_arch import StarVectorConfig, StarVectorForCausalLM
+
+    model_path, files = resolve_safetensors_files(model_path)
+    config = StarVectorConfig.from_pretrained(model_path)
+
+    if torch_dtype is not None:
+        files = [cast_safetensors(f, torch_dtype, cache_dir) for f in files]
+    state_dict = {}
+    for f in files:
+        state_dict.update(mmap_safetensors(f))
+
+    config.torch_dtype = torch_dtype or next(tensor.dtype for tensor in state_dict.values() if tensor.is_floating_point())
+
+    with init_empty_weights():
+        model = StarVectorForCausalLM(config, load_llm_weights=False, **kwargs)
+
+    model.load_state_dict(state_dict, strict=False, assign=True)
+    # The LM head is tied to the input embeddings and usually not serialized
+    model.model.svg_transformer.transformer.tie_weights()
+
+    still_empty = [name for name, param in model.named_parameters() if param.device.type == 'meta']
+    if still_empty:
+        raise ValueError(f"Parameters not found in {model_path}: {still_empty[:10]}{'...' if len(still_empty) > 10 else ''}")
+
+    for param in model.parameters():
+        param.requires_grad = False
+
+    model.eval()
+    return model
@@ -12,8 +12,14 @@ from torchvision import transforms
 from torchvision.transforms.functional import InterpolationMode, pad
 from transformers.feature_extraction_sequence_utils import BatchFeature
 from transformers import AutoProcessor
+from starvector.data.util import ImageBaseProcessor
 
-class SimpleStarVectorProcessor(ProcessorMixin):
+# The batched path resizes uint8 tensors with torchvision's antialiased bicubic kernel instead of PIL's.
+# Both follow the same filter, but rounding differs near sharp edges: per pixel, before normalization,
+# outputs agree within BATCH_PIXEL_TOLERANCE (in [0, 1] units), and mostly match exactly.
+BATCH_PIXEL_TOLERANCE = 3 / 255
+
+class SimpleStarVectorProcessor(ProcessorMixin, ImageBaseProcessor):
     attributes = ["tokenizer"]  # Only include tokenizer in attributes
     valid_kwargs = ["size", "mean", "std"]  # Add other parameters as valid kwargs
     image_processor_class = "AutoImageProcessor"
@@ -26,16 +32,8 @@ class SimpleStarVectorProcessor(ProcessorMixin):
                  std=None, 
                  **kwargs,
                  ):
-        if mean is None:
-            mean = (0.48145466, 0.4578275, 0.40821073)
-        if std is None:
-            std = (0.26862954, 0.26130258, 0.27577711)
-
-        # Store these as instance variables
-        self.mean = mean
-        self.std = std
-        self.size = size
-        self.normalize = transforms.Normalize(mean=mean, std=std)        
+        # Mean, std and size, and the batched `preprocess_batch` shared with the training processor
+        ImageBaseProcessor.__init__(self, mean, std, size)
         
         self.transform = transforms.Compose([
             transforms.Lambda(lambda img: img.convert("RGB") if img.mode == "RGBA" else img),
@@ -64,7 +62,7 @@ class SimpleStarVectorProcessor(ProcessorMixin):
         image_inputs = {}
         if images is not None:
             if isinstance(images, (list, tuple)):
-                images_ = torch.stack([self.transform(img) for img in images])
+                images_ = self.preprocess_batch(images, pin_memory=kwargs.get('pin_memory', False))
             else:
                 images_ = self.transform(images)
             image_inputs = {"pixel_values": images_}
@@ -81,6 +79,16 @@ class SimpleStarVectorProcessor(ProcessorMixin):
 
         return BatchFeature(data={**text_inputs, **image_inputs})
 
+    def check_batch_equivalence(self, images):
+        """Max absolute difference, in [0, 1] pixel units, between `preprocess_batch` and the per-image `transform`"""
+        reference = torch.stack([self.transform(img) for img in images])
+        batched = self.preprocess_batch(images)
+        std = torch.tensor(self.std).view(1, 3, 1, 1)
+        max_diff = ((batched - reference).abs() * std).max().item()
+        if max_diff > BATCH_PIXEL_TOLERANCE:
+            raise ValueError(f"Batched preprocessing differs by {max_diff:.4f}, above tolerance {BATCH_PIXEL_TOLERANCE:.4f}")
+        return max_diff
+
     def _pad_to_square(self, img):
         # Calculate padding to make the image square
         width, height = img.size
@@ -101,6 +109,9 @@ class StarVectorConfig(PretrainedConfig):
         starcoder_model_name: str = "bigcode/starcoderbase-1b",
         image_encoder_type: str = "clip",
         adapter_norm: str = "layer_norm",
+        adapter_type: str = "mlp",
+        adapter_pool_size: int = 2,
+        adapter_num_queries: int = 64,
         image_size: int = 224,
         max_length: int = 8192,
         max_length_train: int = 8192,
@@ -118,6 +129,9 @@ class StarVectorConfig(PretrainedConfig):
         self.starcoder_model_name = starcoder_model_name
         self.image_encoder_type = image_encoder_type
         self.adapter_norm = adapter_norm
+        self.adapter_type = adapter_type
+        self.adapter_pool_size = adapter_pool_size
+        self.adapter_num_queries = adapter_num_queries
         self.image_size = image_size
         self.max_length = max_length
         self.max_length_train = max_length_train
@@ -143,7 +157,14 @@ class StarVectorForCausalLM(PreTrainedModel):
         else:
             from starvector.model.models.starvector_v1 import StarVectorStarCoder
             self.model = StarVectorStarCoder(config=config, **kwargs)
-            
+
+    def _init_weights(self, module):
+        # `from_pretrained` builds the model with torch.nn.init disabled, so adapter weights that are missing
+        # from the checkpoint or mismatched (e.g. a pooled / resampler adapter) are initialized here
+        from starvector.model.adapters.adapter import Adapter
+        if isinstance(module, Adapter):
+            module._initialize_weights()
+
 
     @property
     def supports_gradient_checkpointing(self):
@@ -189,6 +210,12 @@ class StarVectorForCausalLM(PreTrainedModel):
     def generate_im2text(self, batch, **kwargs):
         return self.model.generate_im2text(batch, **kwargs)
 
-    def process_images(self, images):
-        return self.model.image_encoder.process_images(images)
+    def load_image_encoder_runtime(self, path, **kwargs):
+        return self.model.load_image_encoder_runtime(path, **kwargs)
+
+    def set_svg_vocabulary(self, vocabulary, **kwargs):
+        return self.model.set_svg_vocabulary(vocabulary, **kwargs)
+
+    def process_images(self, images, dtype=None, device=None):
+        return self.model.image_encoder.process_images(images, dtype=dtype, device=device)
 
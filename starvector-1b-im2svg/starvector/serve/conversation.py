@@ -1,10 +1,11 @@
 import dataclasses
-from typing import List
+from typing import List, Optional
 from PIL import Image
-import concurrent.futures
 from bs4 import BeautifulSoup
 import cairosvg
 from io import BytesIO
+from starvector.data.rasterizer import get_rasterizer
+from starvector.serve.svg_renderer import StreamingSVGRenderer
 
 @dataclasses.dataclass
 class Conversation:
@@ -19,7 +20,9 @@ class Conversation:
     skip_next: bool = False
     display_images: bool = False
     task: str = "Im2SVG"
-    
+    # Preview renderer of this session, created on first use
+    renderer: Optional[StreamingSVGRenderer] = dataclasses.field(default=None, repr=False, compare=False)
+
     def set_task(self, task):
         self.task = task
 
@@ -87,29 +90,8 @@ class Conversation:
         return image, svg_out   
 
     def rasterize_svg(self, svg_string, resolution=224, dpi = 128, scale=2):
-        try:
-            svg_raster_bytes = cairosvg.svg2png(
-                bytestring=svg_string,
-                background_color='white',
-                output_width=resolution, 
-                output_height=resolution,
-                dpi=dpi,
-                scale=scale) 
-            svg_raster = Image.open(BytesIO(svg_raster_bytes))
-        except: 
-            try:
-                svg = self.clean_svg(svg_string)
-                svg_raster_bytes = cairosvg.svg2png(
-                    bytestring=svg,
-                    background_color='white',
-                    output_width=resolution, 
-                    output_height=resolution,
-                    dpi=dpi,
-                    scale=scale) 
-                svg_raster = Image.open(BytesIO(svg_raster_bytes))
-            except:
-                svg_raster = Image.new('RGB', (resolution, resolution), color = 'white')
-        return svg_raster
+        # Shared rasterization service: process pool with timeouts, repair and fallback on failure
+        return get_rasterizer().rasterize(svg_string, resolution=resolution, dpi=dpi, scale=scale)
 
     def clean_svg(self, svg_text, output_width=None, output_height=None):
         soup = BeautifulSoup(svg_text, 'xml') # Read as soup to parse as xml
@@ -118,20 +100,21 @@ class Conversation:
         svg_clean = "\n".join([line for line in svg_cairo.split("\n") if not line.strip().startswith("<?xml")]) # Remove xml header
         return svg_clean
 
+    def get_renderer(self):
+        if self.renderer is None:
+            self.renderer = StreamingSVGRenderer(resolution=512)
+        return self.renderer
+
     def render_svg(self, svg_string):
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future = executor.submit(self.rasterize_svg, svg_string, resolution = 512)
-            try:
-                result = future.result(timeout=0.1)  # Specify the timeout duration in seconds
-            except concurrent.futures.TimeoutError:
-                # print("Timeout occurred!")
-                result = None
-            return result
-    
-    def to_gradio_svg_render(self):
+        # Blocking render of a complete (or truncated) SVG
+        return self.get_renderer().finish(svg_string)
+
+    def to_gradio_svg_render(self, final=False):
+        # Called on every streamed chunk: coalesced, non-blocking preview until the stream ends
         svg_string = self.messages[-1][-1][:-1]
-        result = self.render_svg(svg_string)
-        return result
+        if final:
+            return self.render_svg(svg_string)
+        return self.get_renderer().update(svg_string)
 
     def to_gradio_svg_code(self):
         ret = []
@@ -0,0 +1,95 @@
+import time
+import numpy as np
+from PIL import Image
+from starvector.data.tracer import image_complexity, trace_image, raster_fidelity
+
+TRACER = 'tracer'
+MODEL = 'model'
+FALLBACK = 'fallback'
+
+def expand_to_square(image, background=255):
+    """Pad a [H, W, 3] uint8 array to a square, centered"""
+    height, width = image.shape[:2]
+    if height == width:
+        return image
+    side = max(height, width)
+    out = np.full((side, side, 3), background, dtype=np.uint8)
+    top, left = (side - height) // 2, (side - width) // 2
+    out[top:top + height, left:left + width] = image
+    return out
+
+class ImageRouter:
+    """
+    Routes im2svg inputs between the classical tracer and the model.
+
+    Images with at most `max_colors` dominant colors and little shading (`max_gradient_density`) are
+    traced (see `starvector.data.tracer`); the trace is accepted if its raster fidelity to the input
+    is at least `min_fidelity`, otherwise the image falls back to the model. Every other image goes to
+    the model. `route` only decides and traces: callers generate for the images it returns None for,
+    and report the time spent with `record_model_time` so that `report` can estimate the savings.
+    """
+    def __init__(self, max_colors=8, max_gradient_density=0.02, min_fidelity=0.97, max_size=256, tracer_kwargs=None):
+        self.max_colors = max_colors
+        self.max_gradient_density = max_gradient_density
+        self.min_fidelity = min_fidelity
+        self.max_size = max_size
+        self.tracer_kwargs = dict(tracer_kwargs or {})
+        self.stats = {TRACER: 0, MODEL: 0, FALLBACK: 0, 'tracer_seconds': 0.0, 'tracer_fidelity': 0.0,
+                      'model_samples': 0, 'model_seconds': 0.0}
+
+    def _prepare(self, image):
+        if not hasattr(image, 'convert'):
+            # NumPy [H, W, C] or [H, W] uint8 arrays (e.g. the validator's rasters)
+            image = np.asarray(image, dtype=np.uint8)
+            image = Image.fromarray(image[..., :3] if image.ndim == 3 else image)
+        image = image.convert('RGB')
+        if max(image.size) > self.max_size:
+            # Tracing time grows with the boundary length, a thumbnail keeps it in milliseconds
+            image = image.copy()
+            image.thumbnail((self.max_size, self.max_size))
+        return expand_to_square(np.asarray(image, dtype=np.uint8))
+
+    def is_simple(self, complexity):
+        return complexity['num_colors'] <= self.max_colors and complexity['gradient_density'] <= self.max_gradient_density
+
+    def route(self, image):
+        """Returns `(svg, decision)`: the traced SVG, or None when the model has to generate this image"""
+        start = time.time()
+        image = self._prepare(image)
+        complexity = image_complexity(image)
+        if not self.is_simple(complexity):
+            self.stats[MODEL] += 1
+            self.stats['tracer_seconds'] += time.time() - start
+            return None, MODEL
+
+        svg = trace_image(image, max_colors=self.max_colors, **self.tracer_kwargs)
+        fidelity = raster_fidelity(svg, image)
+        self.stats['tracer_seconds'] += time.time() - start
+        if fidelity < self.min_fidelity:
+            self.stats[FALLBACK] += 1
+            return None, FALLBACK
+        self.stats[TRACER] += 1
+        self.stats['tracer_fidelity'] += fidelity
+        return svg, TRACER
+
+    def route_batch(self, images):
+        return [self.route(image) for image in images]
+
+    def record_model_time(self, num_samples, seconds):
+        self.stats['model_samples'] += num_samples
+        self.stats['model_seconds'] += seconds
+
+    def report(self):
+        stats = self.stats
+        total = stats[TRACER] + stats[MODEL] + stats[FALLBACK]
+        model_seconds_per_sample = stats['model_seconds'] / stats['model_samples'] if stats['model_samples'] else float('nan')
+        return {
+            'route_tracer': stats[TRACER],
+            'route_model': stats[MODEL],
+            'route_fallback': stats[FALLBACK],
+            'route_tracer_ratio': stats[TRACER] / total if total else 0.0,
+            'route_mean_tracer_fidelity': stats['tracer_fidelity'] / stats[TRACER] if stats[TRACER] else float('nan'),
+            'route_seconds_per_sample': stats['tracer_seconds'] / total if total else 0.0,
+            # Model time avoided by traced images, minus the time spent scoring and tracing every image
+            'route_estimated_seconds_saved': stats[TRACER] * model_seconds_per_sample - stats['tracer_seconds'],
+        }
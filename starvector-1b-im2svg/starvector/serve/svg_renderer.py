@@ -0,0 +1,91 @@
+import io
+import time
+from PIL import Image
+from starvector.data.rasterizer import RasterizationTimeout, get_rasterizer
+from starvector.data.tag_balancer import TagBalancer
+
+class StreamingSVGRenderer:
+    """
+    Per-session preview renderer for streamed SVG code.
+
+    `update` is called with the growing SVG text on every streamed chunk and never blocks: the new
+    text is fed to an incremental `TagBalancer`, and a render is submitted to the shared rasterizer
+    pool only when the text completed at least one new element since the last render, no render is
+    in flight and `min_interval` seconds have passed. Updates in between are coalesced, and the most
+    recent finished preview is returned. `finish` renders the final text and waits for it.
+
+    Previews are submitted with this renderer's `timeout`, which the rasterizer enforces inside the
+    pool worker, so a hung preview frees its worker for the other sessions instead of holding it for the
+    rasterizer's own timeout. The session also stops waiting for a preview still running `timeout`
+    seconds after it started (time spent queued behind other sessions does not count), and submits
+    again on its next new element; the shared pool itself is never recycled by a session.
+    """
+    def __init__(self, resolution=512, min_interval=0.25, timeout=2.0, rasterizer=None):
+        self.resolution = resolution
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.rasterizer = rasterizer or get_rasterizer()
+        self.stats = {'updates': 0, 'submitted': 0, 'rendered': 0, 'failed': 0, 'timeouts': 0}
+        self.reset()
+
+    def reset(self):
+        self.balancer = TagBalancer()
+        self.text = ''
+        self.image = None
+        self._future = None
+        self._submitted_at = 0.0
+        self._started_at = None
+        self._rendered_closed = 0
+
+    def _feed(self, svg_text):
+        if self.text and not svg_text.startswith(self.text):
+            # The text was replaced (new generation), not extended
+            self.reset()
+        self.balancer.feed(svg_text[len(self.text):])
+        self.text = svg_text
+
+    def update(self, svg_text):
+        """Feed the current partial SVG text and return the latest finished preview (or None)"""
+        self.stats['updates'] += 1
+        self._feed(svg_text)
+        self._collect()
+        if (self._future is None
+                and self.balancer.num_closed > self._rendered_closed
+                and time.monotonic() - self._submitted_at >= self.min_interval):
+            self._future = self.rasterizer.submit(self.text + self.balancer.closing_suffix(), resolution=self.resolution,
+                                                  timeout=self.timeout)
+            self._submitted_at = time.monotonic()
+            self._started_at = None
+            self._rendered_closed = self.balancer.num_closed
+            self.stats['submitted'] += 1
+        return self.image
+
+    def _collect(self):
+        future = self._future
+        if future is None:
+            return
+        if future.done():
+            self._future = None
+            try:
+                self.image = Image.open(io.BytesIO(future.result())).convert('RGB')
+                self.stats['rendered'] += 1
+            except RasterizationTimeout:
+                self.stats['timeouts'] += 1
+            except Exception:
+                # Invalid partial SVG, or the pool was recycled: keep the previous preview
+                self.stats['failed'] += 1
+        elif future.running():
+            if self._started_at is None:
+                self._started_at = time.monotonic()
+            elif time.monotonic() - self._started_at > self.timeout:
+                # Stuck past the worker's alarm (e.g. in C code): drop this session's render only, the pool is
+                # shared with the other sessions
+                self._future = None
+                self.stats['timeouts'] += 1
+
+    def finish(self, svg_text):
+        """Render the complete text, waiting for the result (uses the rasterizer cache and timeout)"""
+        self._feed(svg_text)
+        self._future = None
+        self.image = self.rasterizer.rasterize(self.text + self.balancer.closing_suffix(), resolution=self.resolution)
+        return self.image
@@ -236,7 +236,7 @@ def http_bot(state, task_selector, text_caption, model_selector, num_beams, temp
         yield (state, None, None) + (disable_btn, disable_btn, disable_btn, enable_btn, enable_btn, disable_btn, disable_btn)
         return
 
-    yield (state, state.messages[-1][-1], state.to_gradio_svg_render()) + (enable_btn,) * 7
+    yield (state, state.messages[-1][-1], state.to_gradio_svg_render(final=True)) + (enable_btn,) * 7
 
     finish_tstamp = time.time()
     logger.info(f"{output}")
@@ -254,7 +254,7 @@ def http_bot(state, task_selector, text_caption, model_selector, num_beams, temp
         fout.write(json.dumps(data) + "\n")
 
     # Fix: Replace 'btn_list' with (enable_btn,) * 7
-    return (state, state.messages[-1][-1], state.to_gradio_svg_render()) + (enable_btn,) * 7
+    return (state, state.messages[-1][-1], state.to_gradio_svg_render(final=True)) + (enable_btn,) * 7
 
 title_markdown = ("""
 # 💫 StarVector: Generating Scalable Vector Graphics Code from Images and Text
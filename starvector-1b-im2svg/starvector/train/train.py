@@ -20,8 +20,8 @@ from starvector.train.util import (
 )
 import logging
 import math
-from torch.utils.data import DataLoader
-from transformers import get_scheduler
+from torch.utils.data import DataLoader, IterableDataset
+from transformers import get_scheduler, AutoTokenizer
 from accelerate import Accelerator
 from accelerate.logging import get_logger
 from accelerate.utils import ProjectConfiguration
@@ -30,11 +30,13 @@ from omegaconf import OmegaConf
 import os
 import time
 from starvector.metrics.util import AverageMeter
-from util import save_checkpoint, get_optimizer
+from util import save_checkpoint, get_optimizer, load_data_state
 from starvector.util import get_output_dir
 from starvector.model.builder import model_builder
 from safetensors.torch import load_file as load_safetensors
 from starvector.util import get_config
+from starvector.data.samplers import get_batch_sampler, ResumableSampler, resume_epoch, set_train_epoch
+from starvector.data.pretokenize import collate_svg_batch
 import torch
 
 from starvector.train.util import load_checkpoint, is_deepspeed, consolidate_deepspeed_checkpoint
@@ -86,13 +88,37 @@ def main(config=None):
     # --------------- Datasets ---------------
     train_dataset = instantiate_from_config(config.data.train)
     test_dataset = instantiate_from_config(config.data.test)
-    train_dataloader = DataLoader(train_dataset, batch_size=config.data.train.batch_size, shuffle=True, num_workers=config.data.num_workers, pin_memory=True)
-    test_dataloader = DataLoader(test_dataset, batch_size=config.data.test.batch_size, shuffle=False, num_workers=config.data.num_workers, pin_memory=True)
+    bucketing = config.data.get('bucketing', False)
+    # Streamed datasets shard themselves over processes and workers and checkpoint their position
+    streaming = isinstance(train_dataset, IterableDataset)
+    if streaming:
+        if bucketing:
+            raise ValueError("Bucketing needs the lengths of a map-style dataset, it can't be used with a streamed train dataset")
+        train_sampler = None
+        train_dataloader = DataLoader(train_dataset, batch_size=config.data.train.batch_size, num_workers=config.data.num_workers, collate_fn=collate_svg_batch, pin_memory=True)
+        test_dataloader = DataLoader(test_dataset, batch_size=config.data.test.batch_size, shuffle=False, num_workers=config.data.num_workers, collate_fn=collate_svg_batch, pin_memory=True)
+    elif bucketing:
+        # Batches of similar token length, padded to their longest sample by the model
+        tokenizer = AutoTokenizer.from_pretrained(config.model.starcoder_model_name)
+        train_sampler = get_batch_sampler(train_dataset.data, config.data.train.batch_size, bucketing, shuffle=True, tokenizer=tokenizer, max_length=config.model.max_length,
+                                          lengths=train_dataset.token_lengths(config.model.starcoder_model_name))
+        test_sampler = get_batch_sampler(test_dataset.data, config.data.test.batch_size, bucketing, shuffle=False, tokenizer=tokenizer, max_length=config.model.max_length,
+                                         lengths=test_dataset.token_lengths(config.model.starcoder_model_name))
+        print(f"Padding efficiency: {train_sampler.report()}")
+        train_dataloader = DataLoader(train_dataset, batch_sampler=train_sampler, num_workers=config.data.num_workers, collate_fn=collate_svg_batch, pin_memory=True)
+        test_dataloader = DataLoader(test_dataset, batch_sampler=test_sampler, num_workers=config.data.num_workers, collate_fn=collate_svg_batch, pin_memory=True)
+    else:
+        # Seeded order whose position is checkpointed, so resuming skips the consumed samples without loading them
+        train_sampler = ResumableSampler(len(train_dataset), config.data.train.batch_size, shuffle=True, seed=config.data.get('seed', 0))
+        train_dataloader = DataLoader(train_dataset, batch_size=config.data.train.batch_size, sampler=train_sampler, num_workers=config.data.num_workers, collate_fn=collate_svg_batch, pin_memory=True)
+        test_dataloader = DataLoader(test_dataset, batch_size=config.data.test.batch_size, shuffle=False, num_workers=config.data.num_workers, collate_fn=collate_svg_batch, pin_memory=True)
     num_update_steps_per_epoch = math.ceil(len(train_dataloader) / config.training.gradient_accumulation_steps)
     max_train_steps = config.training.n_epochs * num_update_steps_per_epoch
 
     global_step = 0
     first_epoch = 0
+    resume_step = 0
+    resumed_stream = False
 
     model = model_builder(config)
     
@@ -111,6 +137,25 @@ def main(config=None):
             resume_global_step = global_step * config.training.gradient_accumulation_steps
             first_epoch = global_step // num_update_steps_per_epoch
             resume_step = resume_global_step % (num_update_steps_per_epoch * config.training.gradient_accumulation_steps)
+            if streaming:
+                # Resume the stream after its last consumed sample instead of skipping batches
+                data_state = load_data_state(config.training.resume_from_checkpoint, int(os.environ.get('RANK', 0)))
+                if data_state is None:
+                    raise ValueError(f"{config.training.resume_from_checkpoint} has no data state to resume the stream from")
+                train_dataset.load_state_dict(data_state)
+                # The stream resumes its own epoch, `set_epoch` of any other epoch would drop the consumed positions
+                first_epoch = resume_epoch(data_state, global_step, num_update_steps_per_epoch)
+                resume_step = 0
+                resumed_stream = True
+            else:
+                # Every process holds the same sampler state, which does not depend on the number of processes
+                data_state = load_data_state(config.training.resume_from_checkpoint, 0)
+                if data_state is not None:
+                    # Restart the sampler at the first unconsumed sample instead of skipping batches, in the
+                    # epoch it recorded: `set_epoch` of another epoch would reset its offset
+                    train_sampler.load_state_dict(data_state)
+                    first_epoch = resume_epoch(data_state, global_step, num_update_steps_per_epoch)
+                    resume_step = 0
         else:
             global_step = 0
             first_epoch = 0
@@ -192,9 +237,15 @@ def main(config=None):
         num_training_steps= (len(train_dataloader) * config.training.n_epochs),
     )
     
-    optimizer, train_dataloader, test_dataloader, lr_scheduler = accelerator.prepare(
-        optimizer, train_dataloader, test_dataloader, lr_scheduler
-    )
+    if streaming:
+        # The stream is already split over processes, its batches are moved to the device in the loop
+        optimizer, test_dataloader, lr_scheduler = accelerator.prepare(
+            optimizer, test_dataloader, lr_scheduler
+        )
+    else:
+        optimizer, train_dataloader, test_dataloader, lr_scheduler = accelerator.prepare(
+            optimizer, train_dataloader, test_dataloader, lr_scheduler
+        )
         
     loss_meter = AverageMeter()
 
@@ -230,19 +281,27 @@ def main(config=None):
     total_steps = num_update_steps_per_epoch * config.training.n_epochs
     progress_bar = tqdm(total=total_steps, disable=not accelerator.is_local_main_process)
     progress_bar.set_description(f"Training Progress")
+    progress_bar.update(global_step)
 
-    for epoch in range(config.training.n_epochs):
+    for epoch in range(first_epoch, config.training.n_epochs):
         model.train()
+        set_train_epoch(epoch, train_dataloader, train_sampler, train_dataset if streaming else None,
+                        resumed=resumed_stream and epoch == first_epoch)
         for step, batch in enumerate(train_dataloader):
             s_time = time.time()
+            if streaming:
+                train_dataset.update_state(batch)
+                batch = {k: v.to(accelerator.device) if torch.is_tensor(v) else v for k, v in batch.items()}
+            else:
+                train_sampler.update_state(accelerator.num_processes)
 
-            if config.training.resume_from_checkpoint and epoch == first_epoch and step < resume_step:
-                if step % config.training.gradient_accumulation_steps == 0:
-                    progress_bar.update(1)
+            if epoch == first_epoch and step < resume_step:
+                # Checkpoints without a sampler state: the consumed batches are loaded again and skipped
                 continue
             
             with accelerator.accumulate(model):
                 loss = model(batch)
+                token_stats = accelerator.unwrap_model(model).model.token_stats
                 accelerator.backward(loss)
                 loss_meter.update(loss.detach().item(), batch['image'].shape[0])
                 if accelerator.sync_gradients:
@@ -257,7 +316,8 @@ def main(config=None):
                     accelerator.wait_for_everyone()
                     val_loss = validate(model, test_dataloader, accelerator)
                     accelerator.log({"val_loss": val_loss}, step=global_step)
-                    save_checkpoint(accelerator, model, global_step, logging_dir, config.training.checkpoints_total_limit)
+                    save_checkpoint(accelerator, model, global_step, logging_dir, config.training.checkpoints_total_limit,
+                                    data_state=train_dataset.state_dict() if streaming else train_sampler.state_dict())
                     model.train()   
             logs = {
                 "loss": loss_meter.val, 
@@ -265,6 +325,10 @@ def main(config=None):
                 "step": global_step, 
                 "step_time": time.time() - s_time,
                 "epoch": epoch}
+            if token_stats is not None:
+                # Real (non-padding) tokens, to compare padded and packed batches
+                logs["tokens_per_second"] = token_stats['tokens'] / logs["step_time"]
+                logs["token_utilisation"] = token_stats['tokens'] / token_stats['positions']
             progress_bar.set_postfix(**logs)
             accelerator.log(logs, step=global_step)
     
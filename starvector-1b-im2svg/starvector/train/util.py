@@ -1,4 +1,5 @@
 import os
+import json
 import torch
 import transformers
 import os
@@ -95,12 +96,16 @@ def push_model_to_hub(model, new_model_name, tokenizer, processor):
     processor.push_to_hub(new_model_name, commit_message=new_model_name, private=True)
 
 # push_model_to_hub(self.model, new_model_name, self.tokenizer, self.processor)
-def save_checkpoint(accelerator, model, global_step, logging_dir, checkpoint_limit):
+def save_checkpoint(accelerator, model, global_step, logging_dir, checkpoint_limit, data_state=None):
     print("Saving checkpoint! Global Step: " + str(global_step))
     save_checkpoint_dir = os.path.join(logging_dir, f"checkpoint-{global_step}")
     os.makedirs(save_checkpoint_dir, exist_ok=True)
     accelerator.wait_for_everyone()
     accelerator.save_state(save_checkpoint_dir)
+    if data_state is not None:
+        # Iteration state of this process's data, see `load_data_state`
+        with open(os.path.join(save_checkpoint_dir, f"data_state_{accelerator.process_index}.json"), 'w') as f:
+            json.dump(data_state, f)
 
     chkp_dirs = sorted(glob.glob(os.path.join(logging_dir, "checkpoint-*")), key = checkpoint_key)
     chkp_to_remove = chkp_dirs[:-checkpoint_limit]
@@ -112,6 +117,14 @@ def save_checkpoint(accelerator, model, global_step, logging_dir, checkpoint_lim
                 print("could not remove checkpoint")
     print(f"Saved state to {save_checkpoint_dir}")
 
+def load_data_state(checkpoint_dir, process_index):
+    """Data iteration state saved by `save_checkpoint` for a process, None if the checkpoint has none"""
+    path = os.path.join(checkpoint_dir, f"data_state_{process_index}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
 def push_model_to_hub(model, new_model_name, hf_token=None):
     tokenizer = model.model.svg_transformer.tokenizer
     # Register the model for HF
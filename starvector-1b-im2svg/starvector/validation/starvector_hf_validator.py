@@ -1,19 +1,24 @@
 # hf https://huggingface.co/docs/transformers/main_classes/text_generation
 from starvector.validation.svg_validator_base import SVGValidator, register_validator
 import torch
-from transformers import AutoProcessor, AutoModelForCausalLM
+import numpy as np
 from torch.utils.data import Dataset, DataLoader
+from starvector.model.starvector_arch import StarVectorForCausalLM
 from datasets import load_dataset
 from starvector.data.util import rasterize_svg
+from starvector.serve.router import ImageRouter
+from starvector.data.samplers import get_batch_sampler
+from omegaconf import OmegaConf
+import time
 
 class SVGValDataset(Dataset):
-    def __init__(self, dataset_name, config_name, split, im_size, num_samples, processor):
+    def __init__(self, dataset_name, config_name, split, im_size, num_samples, task='im2svg'):
         self.dataset_name = dataset_name
         self.config_name = config_name
         self.split = split
         self.im_size = im_size
         self.num_samples = num_samples
-        self.processor = processor
+        self.task = task
 
         if self.config_name:
             self.data = load_dataset(self.dataset_name, self.config_name, split=self.split)
@@ -29,15 +34,16 @@ class SVGValDataset(Dataset):
     def __getitem__(self, idx):
         svg_str = self.data[idx]['Svg']
         sample_id = self.data[idx]['Filename']
-        image = rasterize_svg(svg_str, resolution=self.im_size)
-        image = self.processor(image, return_tensors="pt")['pixel_values'].squeeze(0)
         caption = self.data[idx].get('Caption', "")
-        return {
+        sample = {
             'Svg': svg_str,
-            'image': image,
             'Filename': sample_id,
             'Caption': caption
         }
+        if self.task != 'text2svg':
+            # uint8 [H, W, 3]; normalization happens batched, on the device, in the model's processor
+            sample['image'] = np.asarray(rasterize_svg(svg_str, resolution=self.im_size).convert('RGB'))
+        return sample
     
                 
 @register_validator
@@ -51,19 +57,40 @@ class StarVectorHFSVGValidator(SVGValidator):
             'float32': torch.float32
         }[config.model.torch_dtype]
 
-        # could also use AutoModelForCausalLM
         if config.model.from_checkpoint:
-            self.model = AutoModelForCausalLM.from_pretrained(self.resume_from_checkpoint, trust_remote_code=True, torch_dtype=self.torch_dtype).to(config.run.device)
+            self.model = StarVectorForCausalLM.from_pretrained(self.resume_from_checkpoint, torch_dtype=self.torch_dtype).to(config.run.device)
         else:
-            self.model = AutoModelForCausalLM.from_pretrained(config.model.name, trust_remote_code=True, torch_dtype=self.torch_dtype).to(config.run.device)
+            self.model = StarVectorForCausalLM.from_pretrained(config.model.name, torch_dtype=self.torch_dtype).to(config.run.device)
         
         self.tokenizer = self.model.model.svg_transformer.tokenizer
         self.svg_end_token_id = self.tokenizer.encode("</svg>")[0] 
 
+        # Optional routing of simple images to the classical tracer
+        router_config = config.get('router')
+        self.router = None
+        if self.task == 'im2svg' and router_config and router_config.get('enabled', False):
+            self.router = ImageRouter(**{k: v for k, v in OmegaConf.to_container(router_config).items() if k != 'enabled'})
+        self.get_dataloader()
+
     def get_dataloader(self):
-        self.dataset = SVGValDataset(self.config.dataset.dataset_name, self.config.dataset.config_name, self.config.dataset.split, self.config.dataset.im_size, self.config.dataset.num_samples, self.processor)
-        self.dataloader = DataLoader(self.dataset, batch_size=self.config.dataset.batch_size, shuffle=False, num_workers=self.config.dataset.num_workers)
+        self.dataset = SVGValDataset(self.config.dataset.dataset_name, self.config.dataset.config_name, self.config.dataset.split, self.config.dataset.im_size, self.config.dataset.num_samples, task=self.task)
+        # Batches of similar SVG length finish generating together
+        self.batch_sampler = get_batch_sampler(self.dataset.data, self.config.dataset.batch_size, self.config.dataset.get('bucketing', False), shuffle=False, tokenizer=self.tokenizer)
+        if self.batch_sampler is not None:
+            self.dataloader = DataLoader(self.dataset, batch_sampler=self.batch_sampler, num_workers=self.config.dataset.num_workers, pin_memory=torch.cuda.is_available())
+        else:
+            self.dataloader = DataLoader(self.dataset, batch_size=self.config.dataset.batch_size, shuffle=False, num_workers=self.config.dataset.num_workers, pin_memory=torch.cuda.is_available())
     
+    def throughput_report(self):
+        report = super().throughput_report()
+        # Visual tokens prepended to every sequence, reduced by the pooled / resampler adapters
+        report['visual_tokens'] = self.model.model.query_length
+        if self.router is not None:
+            report.update(self.router.report())
+        if self.batch_sampler is not None:
+            report.update(self.batch_sampler.report())
+        return report
+
     def release_memory(self):
         # Clear references to free GPU memory
         self.model.model.svg_transformer.tokenizer = None
@@ -79,11 +106,30 @@ class StarVectorHFSVGValidator(SVGValidator):
             generate_config['temperature'] = 1.0
             generate_config['do_sample'] = False
         outputs = []
-        batch['image'] = batch['image'].to('cuda').to(self.torch_dtype)
         # for i, batch in enumerate(batch['svg']):
-        if self.task == 'im2svg':
+        if self.task == 'im2svg' and self.router is not None:
+            outputs = self.generate_routed(batch, generate_config)
+        elif self.task == 'im2svg':
+            # uint8 rasters are copied to the device once and normalized there
+            batch['image'] = self.model.process_images(batch['image'], dtype=self.torch_dtype, device=self.config.run.device)
             outputs = self.model.model.generate_im2svg(batch = batch, **generate_config)
         elif self.task == 'text2svg':
-            outputs = self.model.model.generate_text2svg(batch = batch, **generate_config)
+            # Text-only batch: the caption tokens go to the model's device
+            outputs = self.model.model.generate_text2svg(batch = {'caption': batch['Caption'], 'device': self.config.run.device}, **generate_config)
+        return outputs
+        
+
+    def generate_routed(self, batch, generate_config):
+        """Trace the simple images of the batch and generate the rest with the model"""
+        images = np.asarray(batch['image'])
+        routed = self.router.route_batch(images)
+        outputs = [svg for svg, _ in routed]
+        model_indices = [i for i, (svg, _) in enumerate(routed) if svg is None]
+        if model_indices:
+            start = time.time()
+            pixel_values = self.model.process_images(images[model_indices], dtype=self.torch_dtype, device=self.config.run.device)
+            generated = self.model.model.generate_im2svg(batch = {'image': pixel_values}, **generate_config)
+            self.router.record_model_time(len(model_indices), time.time() - start)
+            for i, svg in zip(model_indices, generated):
+                outputs[i] = svg
         return outputs
-        
\ No newline at end of file
@@ -2,7 +2,7 @@
 # TODO: This is not maintained, need to update it to use the new VLLM API
 
 from .svg_validator_base import SVGValidator, register_validator
-from starvector.data.util import rasterize_svg, clean_svg, use_placeholder
+from starvector.data.util import rasterize_svgs, clean_svg, use_placeholder
 from starvector.data.util import encode_image_base64
 from svgpathtools import svgstr2paths
 import os
@@ -27,9 +27,11 @@ class StarVectorVLLMAPIValidator(SVGValidator):
     
     def generate_svg(self, batch, generate_config):
         outputs = []
+        if self.task == "im2svg":
+            images = rasterize_svgs(batch['svg'], 512)
         for i, sample in enumerate(batch['svg']):
             if self.task == "im2svg":
-                image = rasterize_svg(sample, 512)
+                image = images[i]
                 base64_image = encode_image_base64(image)
                 content = [
                     {
@@ -1,7 +1,7 @@
 # vllm https://docs.vllm.ai/en/v0.5.5/dev/sampling_params.html
 
 from .svg_validator_base import SVGValidator, register_validator
-from starvector.data.util import rasterize_svg, clean_svg, use_placeholder
+from starvector.data.util import rasterize_svgs, clean_svg, use_placeholder
 from svgpathtools import svgstr2paths
 from vllm import LLM, SamplingParams
 from datasets import load_dataset
@@ -25,8 +25,8 @@ class StarVectorVLLMValidator(SVGValidator):
         prompt_start = "<image-start>"
 
         model_inputs_vllm = []
-        for i, sample in enumerate(batch['Svg']):
-            image = rasterize_svg(sample, self.config.dataset.im_size)
+        images = rasterize_svgs(batch['Svg'], self.config.dataset.im_size)
+        for i, image in enumerate(images):
             model_inputs_vllm.append({
                 "prompt": prompt_start,
                 "multi_modal_data": {"image": image}
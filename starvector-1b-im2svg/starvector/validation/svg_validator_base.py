@@ -5,15 +5,17 @@ import pandas as pd
 from starvector.metrics.metrics import SVGMetrics
 from copy import deepcopy
 import numpy as np
-from starvector.data.util import rasterize_svg
+from starvector.data.util import rasterize_svgs
+from starvector.data.rasterizer import get_rasterizer
 import importlib
 from typing import Type
 from omegaconf import OmegaConf
 from tqdm import tqdm   
 from datetime import datetime
 import re
-from starvector.data.util import clean_svg, use_placeholder
-from svgpathtools import svgstr2paths
+import time
+from starvector.data.svg_repair import repair_svg, VALID, PLACEHOLDER
+from starvector.data.svg_minify import SVGMinifier
 
 # Registry for SVGValidator subclasses
 validator_registry = {}
@@ -54,6 +56,14 @@ class SVGValidator(ABC):
         default_metrics_config = OmegaConf.load(metrics_config_path)
         self.metrics = SVGMetrics(default_metrics_config['metrics'])
         self.results = {}
+        self.generation_stats = {'num_samples': 0, 'generated_tokens': 0, 'generation_time': 0.0}
+
+        # Optional minification stage after repair, see configs/generation/*/im2svg.yaml
+        minify_config = config.get('minify')
+        self.minifier = None
+        if minify_config and minify_config.get('enabled', False):
+            minify_kwargs = {k: v for k, v in OmegaConf.to_container(minify_config).items() if k != 'enabled'}
+            self.minifier = SVGMinifier(**minify_kwargs)
 
         # If wandb reporting is enabled, initialize wandb and a table to record sample results.
         if self.report_to_wandb:
@@ -197,7 +207,10 @@ class SVGValidator(ABC):
             gt_raster = result.get('gt_im')
             gen_raster = result.get('gen_im')
             if gt_raster is None or gen_raster is None:
-                continue
+                if 'svg' not in result or 'gt_svg' not in result:
+                    continue
+                # Served from the rasterization cache when the files were saved
+                gen_raster, gt_raster = rasterize_svgs([result['svg'], result['gt_svg']], resolution=512, dpi=100, scale=1)
             
             # Define the output path for the comparison plot image
             output_path = os.path.join(sample_dir, f"{sample_id}_comparison.png")
@@ -266,8 +279,7 @@ class SVGValidator(ABC):
             f.write(res['gt_svg'])
         
         # Rasterize and save PNG
-        svg_raster = rasterize_svg(res['svg'], resolution=512, dpi=100, scale=1)
-        gt_svg_raster = rasterize_svg(res['gt_svg'], resolution=512, dpi=100, scale=1)
+        svg_raster, gt_svg_raster = rasterize_svgs([res['svg'], res['gt_svg']], resolution=512, dpi=100, scale=1)
         svg_raster.save(os.path.join(sample_dir, f"{outpath_filename}_generated.png"))
         gt_svg_raster.save(os.path.join(sample_dir, f"{outpath_filename}_original.png"))
         
@@ -326,6 +338,10 @@ class SVGValidator(ABC):
         out_path_results = os.path.join(self.out_dir, 'results')
         os.makedirs(out_path_results, exist_ok=True)
         
+        avg_results.update(self.throughput_report())
+        if self.minifier is not None:
+            avg_results.update(self.minifier.report())
+
         # Save average results
         with open(os.path.join(out_path_results, 'results_avg.json'), 'w') as f:
             json.dump(avg_results, f, indent=4, sort_keys=True)        
@@ -343,6 +359,15 @@ class SVGValidator(ABC):
         
         # Create comparison plots with metrics
         self.create_comparison_plots_with_metrics(all_results)
+
+        self.save_raster_report(out_path_results)
+
+    def save_raster_report(self, out_path_results):
+        """Print and save rasterization and cache statistics for the run"""
+        raster_report = get_rasterizer().report()
+        print(f"Rasterization: {raster_report}")
+        with open(os.path.join(out_path_results, 'raster_stats.json'), 'w') as f:
+            json.dump(raster_report, f, indent=4, sort_keys=True)
     
     def preprocess_results(self):
         """Preprocess results from self.results into batch format with lists"""
@@ -372,38 +397,44 @@ class SVGValidator(ABC):
     
     def generate_and_process_batch(self, batch, generate_config):
         """Generate and post-process SVGs for a batch"""
+        start = time.time()
         generated_outputs = self.generate_svg(batch, generate_config)
+        self.update_generation_stats(generated_outputs, time.time() - start)
         processed_results = [self.post_process_svg(output) for output in generated_outputs]
         return processed_results
 
+    def update_generation_stats(self, generated_outputs, elapsed):
+        """Accumulate generation time and generated tokens, counted with the model tokenizer when available"""
+        tokenizer = getattr(self, 'tokenizer', None)
+        self.generation_stats['num_samples'] += len(generated_outputs)
+        self.generation_stats['generation_time'] += elapsed
+        if tokenizer is not None:
+            self.generation_stats['generated_tokens'] += sum(len(tokenizer.encode(text)) for text in generated_outputs)
+
+    def throughput_report(self):
+        """Generation throughput, saved next to the quality metrics so runs with different adapters can be compared"""
+        stats = self.generation_stats
+        elapsed = stats['generation_time'] or float('nan')
+        report = {
+            'samples_per_second': stats['num_samples'] / elapsed,
+            'seconds_per_sample': elapsed / stats['num_samples'] if stats['num_samples'] else float('nan'),
+        }
+        if stats['generated_tokens']:
+            report['tokens_per_second'] = stats['generated_tokens'] / elapsed
+        return report
 
     def post_process_svg(self, text):
         """Post-process a single SVG text"""
-        try:
-            svgstr2paths(text)
-            return {
-                'svg': text,
-                'svg_raw': text,
-                'post_processed': False,
-                'no_compile': False
-            }
-        except:
-            try:
-                cleaned_svg = clean_svg(text)
-                svgstr2paths(cleaned_svg)
-                return {
-                    'svg': cleaned_svg,
-                    'svg_raw': text,
-                    'post_processed': True,
-                    'no_compile': False
-                }
-            except:
-                return {
-                    'svg': use_placeholder(),
-                    'svg_raw': text,
-                    'post_processed': True,
-                    'no_compile': True
-                }
+        result = repair_svg(text)
+        svg = result.svg
+        if self.minifier is not None and result.status != PLACEHOLDER:
+            svg = self.minifier(svg).svg
+        return {
+            'svg': svg,
+            'svg_raw': text,
+            'post_processed': result.status != VALID,
+            'no_compile': result.status == PLACEHOLDER
+        }
     
 
     @classmethod
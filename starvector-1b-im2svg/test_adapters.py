@@ -0,0 +1,49 @@
+import math
+import pytest
+import torch
+from transformers.modeling_utils import no_init_weights
+from starvector.model.adapters.adapter import ADAPTERS, Adapter, PooledAdapter, ResamplerAdapter
+from starvector.model.starvector_arch import StarVectorForCausalLM
+
+@pytest.mark.parametrize("query_length, expected", [(257, 65), (576, 144), (17, 5)])
+def test_pooled_adapter_shapes(query_length, expected):
+    adapter = PooledAdapter(32, 48, query_length=query_length).eval()
+    out = adapter(torch.randn(2, query_length, 32))
+    assert out.shape == (2, expected, 48)
+    assert adapter.query_length == expected
+
+def test_pooled_adapter_keeps_the_class_token():
+    adapter = PooledAdapter(4, 4, query_length=17)
+    hidden_states = torch.randn(1, 17, 4)
+    pooled = adapter.pool(hidden_states)
+    assert torch.equal(pooled[:, 0], hidden_states[:, 0])
+    # First pooled patch is the mean of the top-left 2x2 block of the 4x4 grid
+    grid = hidden_states[:, 1:].reshape(1, 4, 4, 4)
+    assert torch.allclose(pooled[:, 1], grid[:, :2, :2].mean(dim=(1, 2)))
+
+def test_resampler_adapter_shapes():
+    adapter = ResamplerAdapter(32, 48, query_length=257, num_queries=16, num_heads=4).eval()
+    assert adapter(torch.randn(2, 257, 32)).shape == (2, 16, 48)
+    assert adapter(torch.randn(1, 100, 32)).shape == (1, 16, 48)
+
+def test_adapters_registry():
+    assert ADAPTERS == {'mlp': Adapter, 'pooled': PooledAdapter, 'resampler': ResamplerAdapter}
+
+def test_init_weights_after_from_pretrained():
+    # from_pretrained builds the model with torch.nn.init disabled and relies on `_init_weights`
+    # for the weights the checkpoint does not provide
+    with no_init_weights():
+        adapter = ResamplerAdapter(64, 48, query_length=257, num_queries=32, num_heads=4)
+    torch.nn.init.constant_(adapter.attn.in_proj_weight, float('nan'))
+    torch.nn.init.constant_(adapter.c_fc.weight, float('nan'))
+    adapter.apply(lambda module: StarVectorForCausalLM._init_weights(None, module))
+
+    for name, param in adapter.named_parameters():
+        assert torch.isfinite(param).all(), name
+    bound = math.sqrt(6 / (64 + 3 * 64))
+    assert adapter.attn.in_proj_weight.abs().max() <= bound
+    assert torch.count_nonzero(adapter.attn.in_proj_bias) == 0
+    assert torch.count_nonzero(adapter.attn.out_proj.bias) == 0
+    assert adapter.c_fc.weight.abs().max() <= math.sqrt(6 / (64 + 128))
+    assert torch.equal(adapter.norm.weight, torch.ones_like(adapter.norm.weight))
+    assert abs(adapter.queries.std().item() - 0.02) < 0.005
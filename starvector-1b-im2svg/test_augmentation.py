@@ -1,6 +1,6 @@
 import numpy as np
-from svgpathtools import Path, Arc, CubicBezier, QuadraticBezier
-from starvector.data.augmentation import SVGTransforms
+from svgpathtools import Path, Arc, CubicBezier, QuadraticBezier, parse_path
+from starvector.data.augmentation import SVGTransforms, check_equivalence
 
 def create_test_svg():
     # Create a simple SVG with different path types
@@ -51,5 +51,32 @@ def test_augmentation():
         f.write(augmented_svg)
     print("\nAugmented SVG saved to 'augmented_test.svg'")
 
+def test_add_noise_offsets_by_slot():
+    transformer = SVGTransforms({'p': 1.0})
+    path = parse_path('M 0,0 L 10,0 C 20,0 20,10 10,10 A 5,5 0 0,1 0,10')
+    noisy = transformer.add_noise(path, 0.5)
+    # Lines are left in place, every other segment moves its i-th point by the noise at i * 20
+    assert noisy[0] == path[0]
+    for segment, noisy_segment in zip(path[1:], noisy[1:]):
+        points = (segment.start, segment.end) if isinstance(segment, Arc) else segment.bpoints()
+        noisy_points = (noisy_segment.start, noisy_segment.end) if isinstance(noisy_segment, Arc) else noisy_segment.bpoints()
+        for i, (point, noisy_point) in enumerate(zip(points, noisy_points)):
+            offset = complex(transformer.noise_gen.noise2(i * 20, 0), transformer.noise_gen.noise2(0, i * 20)) * 0.5
+            assert abs(noisy_point - point - offset) < 1e-9
+
+def test_engine_matches_legacy():
+    transformations = {
+        'noise_std': {'from': 0.1, 'to': 0.3},
+        'rotate': {'from': -10, 'to': 10},
+        'shift_re': {'from': -5, 'to': 5},
+        'shift_im': {'from': -5, 'to': 5},
+        'scale': {'from': 0.9, 'to': 1.1},
+        'color_change': True,
+        'p': 0.5
+    }
+    svg_content = create_test_svg().replace('height="200"', 'height="200" viewBox="0 0 200 200"')
+    for seed in range(20):
+        assert check_equivalence(transformations, svg_content, seed=seed)
+
 if __name__ == "__main__":
     test_augmentation() 
\ No newline at end of file
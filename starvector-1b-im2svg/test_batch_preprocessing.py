@@ -0,0 +1,68 @@
+import json
+import numpy as np
+import pytest
+import torch
+from PIL import Image, ImageDraw
+from transformers import GPT2Tokenizer
+from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+from starvector.model.starvector_arch import SimpleStarVectorProcessor, BATCH_PIXEL_TOLERANCE
+
+def drawing(width, height, seed, mode="RGB"):
+    """Flat shapes with sharp edges, the worst case for the two bicubic kernels"""
+    rng = np.random.default_rng(seed)
+    image = Image.new(mode, (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x0, y0 = rng.integers(0, width), rng.integers(0, height)
+        x1, y1 = x0 + rng.integers(5, width), y0 + rng.integers(5, height)
+        fill = tuple(int(c) for c in rng.integers(0, 256, size=len(mode)))
+        draw.ellipse([x0, y0, x1, y1], fill=fill) if rng.random() < 0.5 else draw.rectangle([x0, y0, x1, y1], fill=fill)
+    return image
+
+@pytest.fixture
+def processor(tmp_path):
+    vocab = {token: i for i, token in enumerate(bytes_to_unicode().values())}
+    (tmp_path / 'vocab.json').write_text(json.dumps(vocab))
+    (tmp_path / 'merges.txt').write_text('#version: 0.2\n')
+    return SimpleStarVectorProcessor(GPT2Tokenizer(str(tmp_path / 'vocab.json'), str(tmp_path / 'merges.txt')), size=224)
+
+def test_batch_matches_transform(processor):
+    # Mixed sizes, aspect ratios, modes and an image already at the target size
+    images = [drawing(512, 512, 0), drawing(300, 180, 1), drawing(97, 401, 2),
+              drawing(224, 224, 3), drawing(512, 512, 4, mode="RGBA"), drawing(64, 64, 5, mode="L")]
+    reference = torch.stack([processor.transform(img if img.mode != "L" else img.convert("RGB")) for img in images])
+    batched = processor.preprocess_batch(images)
+    assert batched.shape == (len(images), 3, 224, 224)
+    std = torch.tensor(processor.std).view(1, 3, 1, 1)
+    assert ((batched - reference).abs() * std).max().item() <= BATCH_PIXEL_TOLERANCE
+    # `transform` itself only converts RGBA, not L
+    assert processor.check_batch_equivalence(images[:-1]) <= BATCH_PIXEL_TOLERANCE
+
+def test_order_is_kept_across_size_groups(processor):
+    images = [drawing(300, 300, 0), drawing(120, 80, 1), drawing(300, 300, 2)]
+    batched = processor.preprocess_batch(images)
+    for i, img in enumerate(images):
+        single = processor.preprocess_batch([img])[0]
+        assert torch.equal(batched[i], single)
+
+def test_preallocated_output(processor):
+    images = [drawing(128, 96, 0), drawing(96, 128, 1)]
+    out = torch.zeros(2, 3, 224, 224, dtype=torch.float16)
+    assert processor.preprocess_batch(images, out=out) is out
+    assert torch.allclose(out.float(), processor.preprocess_batch(images), atol=1e-2)
+
+def test_call_batches_lists(processor):
+    images = [drawing(200, 100, 0), drawing(100, 200, 1)]
+    assert processor(images=images)["pixel_values"].shape == (2, 3, 224, 224)
+    assert processor(images=images[0])["pixel_values"].shape == (3, 224, 224)
+
+def test_training_processor_shares_the_batch_path(processor):
+    from starvector.data.util import ImageTrainProcessor
+    # Mixed sizes and aspect ratios, as `process_images` accepts them
+    images = [drawing(512, 512, 0), drawing(300, 180, 1), drawing(64, 64, 2)]
+    batched = ImageTrainProcessor(size=224).preprocess_batch(images)
+    assert torch.equal(batched, processor.preprocess_batch(images))
+    # The uint8 array path pads and resizes the same way
+    array = np.stack([np.asarray(drawing(300, 180, seed)) for seed in (1, 3)])
+    assert torch.equal(ImageTrainProcessor(size=224).preprocess_array(array),
+                       processor.preprocess_batch([Image.fromarray(a) for a in array]))
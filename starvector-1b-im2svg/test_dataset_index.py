@@ -0,0 +1,84 @@
+import pytest
+from datasets import Dataset
+from starvector.data.dataset_index import DatasetIndex, build_index
+from starvector.data.materialize import OK, BLANK, INVALID
+from starvector.data.pretokenize import SVGTokenizer
+
+SVGS = [
+    '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"><path d="M0 0H10V10z"/><rect width="2" height="2"/></svg>',
+    '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"></svg>',
+    '<svg xmlns="http://www.w3.org/2000/svg"><path d=',
+]
+
+def can_render():
+    try:
+        import cairosvg
+    except (ImportError, OSError):
+        return False
+    return True
+
+def whitespace_tokenizer(texts):
+    return {'input_ids': [[0] * len(text.split()) for text in texts]}
+
+# Appends two end tokens, as `load_svg_tokenizer` does for StarCoder2
+svg_tokenizer = SVGTokenizer(whitespace_tokenizer, ' <svg-end> <eos>')
+
+def test_facts(tmp_path):
+    data = Dataset.from_dict({'Svg': SVGS, 'model_name': ['a', 'b', 'a']})
+    index, num_processed = build_index(data, str(tmp_path / 'index.parquet'), tokenizer=svg_tokenizer, tokenizer_name='ws', im_size=32)
+    assert num_processed == 3
+    assert index['flag'][2] == INVALID
+    assert index['num_paths'].tolist() == [1, 0, 0]
+    assert index['num_elements'].tolist() == [3, 1, 0]
+    # The training text, with the end tokens
+    assert index['num_tokens'].tolist() == [len(svg.split()) + 2 for svg in SVGS]
+    assert index.metadata['num_end_tokens'] == 2
+    assert index['model_name'].tolist() == ['a', 'b', 'a']
+    assert index.token_lengths('ws') is not None and index.token_lengths('other') is None
+
+@pytest.mark.skipif(not can_render(), reason="cairo is not available")
+def test_render_flags(tmp_path):
+    index, _ = build_index(Dataset.from_dict({'Svg': SVGS}), str(tmp_path / 'index.parquet'), im_size=32)
+    assert index['flag'].tolist() == [OK, BLANK, INVALID]
+
+def test_incremental_update(tmp_path):
+    path = str(tmp_path / 'index.parquet')
+    build_index(Dataset.from_dict({'Svg': SVGS[:2]}), path, im_size=32)
+    grown = Dataset.from_dict({'Svg': [SVGS[2]] + SVGS[:2]})
+    index, num_processed = build_index(grown, path, im_size=32)
+    # Only the new SVG is processed, the facts of the others follow them to their new rows
+    assert num_processed == 1
+    assert index['num_elements'].tolist() == [0, 3, 1]
+    index.check(grown)
+    assert DatasetIndex(path).report()['num_samples'] == 3
+    # An index built with another image size is not reused
+    assert build_index(grown, path, im_size=64)[1] == 3
+
+def test_dataset_selects_from_the_index(tmp_path):
+    from starvector.data.stacksvg import SVGStackDataset
+
+    data = Dataset.from_dict({'Svg': SVGS, 'Filename': ['0', '1', '2'], 'model_name': ['a', 'b', 'a']})
+    data.to_parquet(str(tmp_path / 'data' / 'train.parquet'))
+    build_index(data, str(tmp_path / 'index.parquet'), tokenizer=svg_tokenizer, tokenizer_name='ws', im_size=32)
+    dataset = SVGStackDataset(str(tmp_path / 'data'), 'train', 32, index=str(tmp_path / 'index.parquet'), select_dataset_name='a')
+    assert dataset.data['Filename'] == ['0', '2']
+    assert dataset.token_lengths('ws').tolist() == [len(SVGS[0].split()) + 2, len(SVGS[2].split()) + 2]
+    assert dataset.token_lengths('other') is None
+
+def test_check_compares_the_split(tmp_path):
+    data = Dataset.from_dict({'Svg': SVGS})
+    index, _ = build_index(data, str(tmp_path / 'index.parquet'), im_size=32)
+    assert index.metadata['fingerprint'] == data._fingerprint
+    index.check(data, im_size=32)
+    # Flags rendered at another size
+    with pytest.raises(ValueError, match='built at im_size 32, the dataset uses 224'):
+        index.check(data, im_size=224)
+    # Another fingerprint with the same SVGs (a copy of the split) is checked row by row
+    index.check(Dataset.from_dict({'Svg': list(SVGS)}))
+    # Same size, other order or other SVGs
+    with pytest.raises(ValueError, match=r'differ in 2 of 3 rows \(first at row 0\)'):
+        index.check(Dataset.from_dict({'Svg': [SVGS[1], SVGS[0], SVGS[2]]}))
+    with pytest.raises(ValueError, match=r'differ in 1 of 3 rows \(first at row 2\)'):
+        index.check(Dataset.from_dict({'Svg': SVGS[:2] + ['<svg/>']}))
+    with pytest.raises(ValueError, match='has 3 rows, the dataset split has 2'):
+        index.check(Dataset.from_dict({'Svg': SVGS[:2]}))
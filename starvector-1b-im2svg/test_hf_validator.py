@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from datasets import Dataset
+from omegaconf import OmegaConf
+
+hf_validator = pytest.importorskip("starvector.validation.starvector_hf_validator")
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg" width="8" height="8"><rect width="4" height="4"/></svg>'
+
+def dataset(task):
+    data = hf_validator.SVGValDataset.__new__(hf_validator.SVGValDataset)
+    data.data = Dataset.from_dict({'Svg': [SVG], 'Filename': ['a.svg'], 'Caption': ['a square']})
+    data.im_size = 8
+    data.task = task
+    return data
+
+class RecordingModel:
+    """Stands in for StarVectorForCausalLM and records what the validator generates from"""
+    def __init__(self):
+        self.model = self
+        self.batches = []
+
+    def generate_text2svg(self, batch, **kwargs):
+        self.batches.append(batch)
+        return [SVG] * len(batch['caption'])
+
+def test_text2svg_samples_are_not_rasterized(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("text2svg validation rasterized a sample")
+    monkeypatch.setattr(hf_validator, "rasterize_svg", fail)
+    sample = dataset('text2svg')[0]
+    assert 'image' not in sample and sample['Caption'] == 'a square'
+
+def test_im2svg_samples_are_uint8_rasters(monkeypatch):
+    from PIL import Image
+    monkeypatch.setattr(hf_validator, "rasterize_svg", lambda svg, resolution: Image.new('RGBA', (resolution, resolution)))
+    image = dataset('im2svg')[0]['image']
+    assert image.dtype == np.uint8 and image.shape == (8, 8, 3)
+
+def test_text2svg_generation_runs_on_the_configured_device():
+    validator = hf_validator.StarVectorHFSVGValidator.__new__(hf_validator.StarVectorHFSVGValidator)
+    validator.task = 'text2svg'
+    validator.router = None
+    validator.model = RecordingModel()
+    validator.config = OmegaConf.create({'run': {'device': 'cuda:1'}})
+    outputs = validator.generate_svg({'Caption': ['a square', 'a circle'], 'Svg': [SVG, SVG]}, {'temperature': 0.5})
+    assert outputs == [SVG, SVG]
+    assert validator.model.batches == [{'caption': ['a square', 'a circle'], 'device': 'cuda:1'}]
@@ -42,9 +42,7 @@ def test_im2svg(image_path):
     image_pil = image_pil.convert('RGB')
     
     # Process image for the model
-    image = starvector.process_images([image_pil])[0].to(torch.float16 if device == "cuda" else torch.float32)
-    if device == "cuda":
-        image = image.cuda()
+    image = starvector.process_images([image_pil], dtype=torch.float16 if device == "cuda" else torch.float32, device=device)
     batch = {"image": image}
     
     # Generate SVG
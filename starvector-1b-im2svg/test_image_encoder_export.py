@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+import pytest
+import torch
+import torch.nn as nn
+from starvector.model.adapters.adapter import Adapter
+from starvector.model.image_encoder.export import export_image_encoder, load_image_encoder_runtime
+
+class PatchEncoder(nn.Module):
+    """Tiny ViT-like encoder: 8x8 patches embedded into 16 tokens of width 32"""
+    image_size = 32
+
+    def __init__(self):
+        super().__init__()
+        self.patch = nn.Conv2d(3, 32, kernel_size=8, stride=8)
+        self.mlp = nn.Sequential(nn.Linear(32, 32), nn.GELU(), nn.Linear(32, 32))
+
+    def forward(self, image):
+        tokens = self.patch(image).flatten(2).transpose(1, 2)
+        return tokens + self.mlp(tokens)
+
+def tiny_starvector():
+    torch.manual_seed(0)
+    return SimpleNamespace(
+        task='im2svg',
+        use_image_encoder=lambda: True,
+        image_encoder=PatchEncoder().eval(),
+        image_projection=Adapter(32, 48, query_length=16).eval(),
+    )
+
+def eager(model, image):
+    with torch.no_grad():
+        return model.image_projection(model.image_encoder(image))
+
+@pytest.mark.parametrize('export_format,suffix', [('onnx', '.onnx'), ('torch.export', '.pt2')])
+def test_runtime_matches_eager(tmp_path, export_format, suffix):
+    if export_format == 'onnx':
+        pytest.importorskip('onnxruntime')
+        pytest.importorskip('onnx')
+    model = tiny_starvector()
+    path = export_image_encoder(model, str(tmp_path / f'encoder{suffix}'), export_format=export_format)
+    runtime = load_image_encoder_runtime(path)
+    # The batch dimension is dynamic
+    for batch_size in (1, 3):
+        image = torch.randn(batch_size, 3, 32, 32)
+        torch.testing.assert_close(runtime(image), eager(model, image), rtol=1e-4, atol=1e-4)
+
+def test_unknown_artifact():
+    with pytest.raises(ValueError):
+        load_image_encoder_runtime('encoder.bin')
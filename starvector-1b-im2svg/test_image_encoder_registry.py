@@ -0,0 +1,41 @@
+import subprocess
+import sys
+from types import SimpleNamespace
+import pytest
+import torch
+import torch.nn as nn
+from starvector.model.image_encoder.backends import ImageEncoderBackend
+from starvector.model.image_encoder.image_encoder import ImageEncoder, get_image_encoder_backend, register_image_encoder_backend
+
+class TinyBackend(ImageEncoderBackend):
+    def build(self, encoder):
+        encoder.visual_encoder = nn.Conv2d(3, 8, kernel_size=4, stride=4)
+        self.hidden_size = 8
+        self.query_length = (self.image_size // 4) ** 2
+
+    def forward(self, encoder, image):
+        return encoder.visual_encoder(image).flatten(2).transpose(1, 2)
+
+def config(image_encoder_type):
+    return SimpleNamespace(image_encoder_type=image_encoder_type, image_size=16, torch_dtype='float32')
+
+def test_registered_backend_declares_its_shapes():
+    register_image_encoder_backend('tiny', TinyBackend)
+    encoder = ImageEncoder(config('tiny'))
+    assert (encoder.hidden_size, encoder.query_length) == (8, 16)
+    assert encoder(torch.randn(2, 3, 16, 16)).shape == (2, encoder.query_length, encoder.hidden_size)
+    # Parameter names do not depend on the backend
+    assert {name for name, _ in encoder.named_parameters()} == {'visual_encoder.weight', 'visual_encoder.bias'}
+
+def test_dotted_path_and_unknown_types():
+    assert get_image_encoder_backend(f'{__name__}.TinyBackend') is TinyBackend
+    with pytest.raises(ValueError):
+        get_image_encoder_backend('unknown')
+
+def test_backends_import_their_dependencies_lazily():
+    code = ("import sys\n"
+            "from starvector.model.image_encoder.image_encoder import get_image_encoder_backend\n"
+            "get_image_encoder_backend('clip'); get_image_encoder_backend('siglip_384')\n"
+            "print(sorted(m for m in ('taming', 'open_clip', 'fairscale') if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == '[]'
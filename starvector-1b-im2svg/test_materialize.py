@@ -0,0 +1,139 @@
+import hashlib
+import io
+import numpy as np
+import pytest
+from datasets import Dataset
+from PIL import Image
+from starvector.data import rasterizer as rasterizer_module
+from starvector.data.rasterizer import Rasterizer, RasterizationError
+from starvector.data.materialize import materialize, materialize_variants, RasterStore, VariantStore, OK, BLANK, INVALID
+
+SVGS = ['<svg><rect width="1"/></svg>', '<svg/>', 'fail', '<svg><circle r="2"/></svg>', '<svg><path d="M0 0"/></svg>']
+
+def hash_render(svg_string, resolution, dpi, scale, background='white', backends=()):
+    """A flat color derived from the SVG text; `<svg/>` renders blank and `fail` does not render"""
+    if svg_string == 'fail':
+        raise RasterizationError('cannot render')
+    color = (255, 255, 255) if svg_string == '<svg/>' else tuple(hashlib.sha1(svg_string.encode()).digest()[:3])
+    buffer = io.BytesIO()
+    Image.new('RGB', (resolution, resolution), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+class HashRasterizer(Rasterizer):
+    render_fn = staticmethod(hash_render)
+
+def raster(svg, im_size=8):
+    return np.asarray(Image.open(io.BytesIO(hash_render(svg, im_size, 0, 0))).convert('RGB'))
+
+class SVGs:
+    """The attributes of an `SVGDatasetBase` that materialization reads"""
+    def __init__(self, svgs, im_size=8, transforms=None):
+        self.data = Dataset.from_dict({'Svg': svgs})
+        self.simplifier = None
+        self.im_size = im_size
+        self.transforms = transforms
+        self.p = transforms.p if transforms is not None else 0.0
+
+class Suffix:
+    """Deterministic stand-in for `SVGTransforms`: appends the seed, fails on seeds divisible by 5"""
+    p = 0.5
+
+    def reseed(self, seed):
+        self.seed = seed
+
+    def augment(self, svg):
+        if self.seed % 5 == 0:
+            raise ValueError('augmentation failed')
+        return svg.replace('</svg>', f'<g id="{self.seed}"/></svg>'), None
+
+@pytest.fixture(autouse=True)
+def fake_rasterizer(monkeypatch):
+    monkeypatch.setattr(rasterizer_module, '_rasterizer', HashRasterizer(num_workers=0))
+
+def test_materialize(tmp_path):
+    from starvector.data.util import use_placeholder
+    store = materialize(SVGs(SVGS), str(tmp_path), shard_size=2, batch_size=3)
+    assert len(store) == len(SVGS) and len(store.index['shards']) == 3
+    assert [store.flag(i) for i in range(len(SVGS))] == [OK, BLANK, INVALID, OK, OK]
+    for i in (0, 3, 4):
+        assert np.array_equal(store[i], raster(SVGS[i]))
+    for i in (1, 2):
+        assert np.array_equal(store[i], raster(use_placeholder()))
+    assert store.report() == {'num_samples': 5, 'im_size': 8, 'num_blank': 1, 'num_invalid': 1}
+    # Reopened from disk
+    assert np.array_equal(RasterStore(str(tmp_path))[4], raster(SVGS[4]))
+
+def test_check_compares_the_fingerprint(tmp_path):
+    dataset = SVGs(SVGS)
+    store = materialize(dataset, str(tmp_path))
+    store.check(len(SVGS), 8, dataset.data._fingerprint)
+    # Older stores and in-memory data without a fingerprint are only checked for size
+    store.check(len(SVGS), 8)
+    # Same size, other order
+    shuffled = dataset.data.shuffle(seed=0)
+    with pytest.raises(ValueError, match='fingerprint'):
+        store.check(len(shuffled), 8, shuffled._fingerprint)
+    with pytest.raises(ValueError, match='5 samples at 8px'):
+        store.check(len(SVGS), 16, dataset.data._fingerprint)
+
+def test_variant_store(tmp_path):
+    dataset = SVGs(SVGS[:2] + SVGS[3:], transforms=Suffix())
+    store = materialize_variants(dataset, str(tmp_path), num_variants=3, seed=7, shard_size=4, batch_size=6)
+    assert len(store) == 4 and store.num_variants == 3 and store.index['p'] == 0.5
+    assert isinstance(VariantStore(str(tmp_path)), VariantStore)
+    for row in range(12):
+        seed = int(store.seeds[row])
+        if seed % 5 == 0:
+            assert store.flag(row) == INVALID and store.svg(row) == ''
+        elif store.flag(row) == OK:
+            assert store.svg(row).endswith(f'<g id="{seed}"/></svg>')
+            assert np.array_equal(store[row], raster(store.svg(row)))
+    svg, image = store.sample(3)
+    assert svg.startswith(SVGS[4][:-len('</svg>')]) and image.shape == (8, 8, 3)
+    store.check(4, 8, dataset.data._fingerprint)
+    with pytest.raises(ValueError, match='fingerprint'):
+        store.check(4, 8, dataset.data.shuffle(seed=0)._fingerprint)
+
+TRANSFORMS = {
+    'noise_std': {'from': 0.1, 'to': 0.3},
+    'noise_type': 'perlin',
+    'rotate': {'from': -10, 'to': 10},
+    'shift_re': {'from': -5, 'to': 5},
+    'shift_im': {'from': -5, 'to': 5},
+    'scale': {'from': 0.9, 'to': 1.1},
+    'color_noise': {'from': 0.1, 'to': 0.2},
+    'p': 0.5,
+}
+
+PATH_SVGS = [
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 200 200"><path d="M 50,50 C 100,0 100,100 150,50" fill="red"/></svg>',
+    '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 200 200"><path d="M 50,100 Q 100,50 150,100" fill="blue"/>'
+    '<path d="M 50,150 A 50,50 0 1,1 150,150" fill="green"/></svg>',
+]
+
+def test_variants_regenerate_from_their_seed(tmp_path):
+    from starvector.data.augmentation import SVGTransforms
+    from starvector.data.materialize import variant_seed
+    store = materialize_variants(SVGs(PATH_SVGS, transforms=SVGTransforms(TRANSFORMS)), str(tmp_path / 'a'), num_variants=3, seed=11)
+    variants = [store.svg(row) for row in range(6)]
+    assert len(set(variants)) == 6 and not set(variants) & set(PATH_SVGS)
+    for row, svg in enumerate(variants):
+        idx, k = divmod(row, 3)
+        assert int(store.seeds[row]) == variant_seed(11, idx, k, 3)
+        # A fresh transforms instance, as in another process, reproduces the variant from its seed
+        transforms = SVGTransforms(TRANSFORMS)
+        transforms.reseed(int(store.seeds[row]))
+        assert transforms.augment(PATH_SVGS[idx])[0] == svg
+    # And the whole store is reproducible
+    again = materialize_variants(SVGs(PATH_SVGS, transforms=SVGTransforms(TRANSFORMS)), str(tmp_path / 'b'), num_variants=3, seed=11)
+    assert [again.svg(row) for row in range(6)] == variants
+    assert np.array_equal(again.seeds, store.seeds) and np.array_equal(again.flags, store.flags)
+
+def test_reseed_resets_the_noise_state():
+    from starvector.data.augmentation import SVGTransforms
+    transforms = SVGTransforms(TRANSFORMS)
+    transforms.reseed(3)
+    first = transforms.augment(PATH_SVGS[1])[0]
+    transforms.augment(PATH_SVGS[0])
+    transforms.reseed(3)
+    assert transforms.augment(PATH_SVGS[1])[0] == first
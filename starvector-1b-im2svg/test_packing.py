@@ -0,0 +1,18 @@
+import torch
+from starvector.model.packing import pack_sequences, block_diagonal_mask
+
+def test_sequences_fill_rows():
+    lengths = [700, 300, 500, 200, 900, 100, 250]
+    rows = pack_sequences(lengths, 1000)
+    assert sorted(i for row in rows for i in row) == list(range(len(lengths)))
+    assert all(sum(lengths[i] for i in row) <= 1000 for row in rows)
+    assert len(rows) == 3
+
+def test_no_attention_across_sequences():
+    seq_ids = torch.tensor([[0, 0, 0, 1, 1, 2]])
+    mask = block_diagonal_mask(seq_ids)[0]
+    assert mask[2, :3].all() and not mask[2, 3:].any()
+    assert mask[4, 3:5].all() and not mask[4, :3].any()
+    # Causal within a sequence
+    assert not mask[3, 4]
+    assert mask[5].tolist() == [False] * 5 + [True]
@@ -0,0 +1,58 @@
+import json
+import numpy as np
+import pytest
+import torch
+from datasets import Dataset
+from transformers import GPT2Tokenizer
+from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+from starvector.data.pretokenize import SVGTokenizer, TokenStore, pad_token_ids, pretokenize, svg_hash
+
+SVGS = ['<svg><path d="M0 0L10 10"/></svg>', '<svg/>', '<svg><circle r="5"/><rect width="3"/></svg>']
+
+def byte_tokenizer(tmp_path, padding_side='right', truncation_side='right'):
+    vocab = {token: i for i, token in enumerate(bytes_to_unicode().values())}
+    (tmp_path / 'vocab.json').write_text(json.dumps(vocab))
+    (tmp_path / 'merges.txt').write_text('#version: 0.2\n')
+    tokenizer = GPT2Tokenizer(str(tmp_path / 'vocab.json'), str(tmp_path / 'merges.txt'),
+                              padding_side=padding_side, truncation_side=truncation_side)
+    tokenizer.add_special_tokens({'eos_token': '<|endoftext|>', 'pad_token': '<pad>', 'additional_special_tokens': ['<svg-end>']})
+    return tokenizer
+
+class SVGs:
+    def __init__(self, svgs):
+        self.data = Dataset.from_dict({'Svg': svgs})
+        self.simplifier = None
+
+def test_padding_matches_the_tokenizer(tmp_path):
+    for padding_side in ('right', 'left'):
+        for truncation_side in ('right', 'left'):
+            tokenizer = byte_tokenizer(tmp_path, padding_side, truncation_side)
+            texts = [svg + '<svg-end>' + tokenizer.eos_token for svg in SVGS]
+            expected = tokenizer(texts, truncation=True, padding='longest', max_length=20, return_tensors='pt')
+            input_ids, attention_mask = pad_token_ids(SVGTokenizer(tokenizer, '<svg-end>' + tokenizer.eos_token)(SVGS), 20,
+                                                      tokenizer.pad_token_id, padding_side, truncation_side)
+            assert torch.equal(input_ids, expected.input_ids)
+            assert torch.equal(attention_mask, expected.attention_mask)
+
+def test_store_round_trip(tmp_path):
+    tokenizer = SVGTokenizer(byte_tokenizer(tmp_path), '<svg-end><|endoftext|>')
+    pretokenize(SVGs(SVGS), str(tmp_path / 'tokens'), tokenizer, 'bigcode/starcoder2-7b', batch_size=2)
+    store = TokenStore(str(tmp_path / 'tokens'))
+    store.check(len(SVGS))
+    for i, ids in enumerate(tokenizer(SVGS)):
+        np.testing.assert_array_equal(store[i], ids)
+        assert store.hashes[i] == svg_hash(SVGS[i])
+    # A sample whose SVG changed since (e.g. augmented) is tokenized again
+    store._tokenizer = tokenizer
+    np.testing.assert_array_equal(store.get(0, SVGS[1]), tokenizer([SVGS[1]])[0])
+    assert store.report()['num_tokens'] == sum(len(ids) for ids in tokenizer(SVGS))
+
+def test_check_compares_the_fingerprint(tmp_path):
+    dataset = SVGs(SVGS)
+    pretokenize(dataset, str(tmp_path / 'tokens'), SVGTokenizer(byte_tokenizer(tmp_path), '<|endoftext|>'), 'bigcode/starcoder2-7b')
+    store = TokenStore(str(tmp_path / 'tokens'))
+    store.check(len(SVGS), 224, dataset.data._fingerprint)
+    with pytest.raises(ValueError, match='fingerprint'):
+        store.check(len(SVGS), 224, dataset.data.shuffle(seed=0)._fingerprint)
+    with pytest.raises(ValueError, match='computed for 3 samples'):
+        store.check(2)
@@ -0,0 +1,187 @@
+import io
+import os
+import signal
+import threading
+import time
+import pytest
+from PIL import Image
+from starvector.data.rasterizer import Rasterizer, RasterCache, RasterizationError
+
+COLORS = {'red': (255, 0, 0), 'green': (0, 255, 0), 'blue': (0, 0, 255)}
+
+def fake_render(svg_string, resolution, dpi, scale, background='white', backends=()):
+    """Module level so spawned pool workers can unpickle it. The SVG string names the behaviour"""
+    if svg_string == 'hang':
+        # Swallows ordinary exceptions like the backend fallbacks in `render_png`
+        while True:
+            try:
+                time.sleep(0.05)
+            except Exception:
+                pass
+    if svg_string == 'stuck':
+        # Like a render stuck in C code, which the alarm cannot interrupt
+        signal.signal(signal.SIGALRM, signal.SIG_IGN)
+        time.sleep(60)
+    if svg_string == 'crash':
+        os._exit(1)
+    if svg_string == 'fail':
+        raise RasterizationError('cannot render')
+    buffer = io.BytesIO()
+    Image.new('RGB', (resolution, resolution), COLORS[svg_string]).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+class FakeRasterizer(Rasterizer):
+    render_fn = staticmethod(fake_render)
+
+def colors(images):
+    return [image.getpixel((0, 0)) for image in images]
+
+def test_inline_timeout():
+    rasterizer = FakeRasterizer(num_workers=0, timeout=0.3)
+    start = time.time()
+    images, errors = rasterizer.rasterize_batch(['red', 'hang', 'blue'], resolution=8, return_errors=True)
+    assert time.time() - start < 5
+    assert colors(images) == [COLORS['red'], (255, 255, 255), COLORS['blue']]
+    assert errors[0] is None and errors[2] is None
+    assert 'timed out' in errors[1]
+    assert rasterizer.stats['timeouts'] == 1
+    # The alarm is disarmed and the previous handler restored
+    time.sleep(0.5)
+    assert rasterizer.rasterize('green', resolution=8).getpixel((0, 0)) == COLORS['green']
+
+def test_inline_submit_timeout():
+    future = FakeRasterizer(num_workers=0, timeout=0.3).submit('hang', resolution=8)
+    with pytest.raises(RasterizationError, match='timed out'):
+        future.result()
+
+def test_inline_off_main_thread_is_unbounded():
+    # SIGALRM can only be handled on the main thread, renders elsewhere run without a timeout
+    rasterizer = FakeRasterizer(num_workers=0, timeout=0.3)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(rasterizer.rasterize('red', resolution=8)))
+    thread.start()
+    thread.join()
+    assert colors(results) == [COLORS['red']]
+
+def test_pool_timeout_recovers():
+    rasterizer = FakeRasterizer(num_workers=2, timeout=2.0)
+    try:
+        images, errors = rasterizer.rasterize_batch(['red', 'hang', 'green', 'fail'], resolution=8, return_errors=True)
+        assert colors(images)[0] == COLORS['red'] and colors(images)[2] == COLORS['green']
+        assert 'timed out' in errors[1] and errors[3] == 'cannot render'
+        assert rasterizer.stats['timeouts'] == 1
+        # The hung render was interrupted in its worker, the pool keeps serving
+        pool = rasterizer._get_pool()
+        assert colors(rasterizer.rasterize_batch(['blue', 'red'], resolution=8)) == [COLORS['blue'], COLORS['red']]
+        assert rasterizer._get_pool() is pool
+    finally:
+        rasterizer.shutdown()
+
+def test_pool_recycles_a_stuck_worker():
+    rasterizer = FakeRasterizer(num_workers=2, timeout=1.0)
+    try:
+        pool = rasterizer._get_pool()
+        start = time.time()
+        images, errors = rasterizer.rasterize_batch(['red', 'stuck', 'green'], resolution=8, return_errors=True)
+        assert time.time() - start < 10
+        assert colors(images)[0] == COLORS['red'] and colors(images)[2] == COLORS['green']
+        assert 'timed out' in errors[1] and rasterizer.stats['timeouts'] == 1
+        # The stuck worker was terminated, and a fresh pool serves the next batch
+        assert rasterizer._get_pool() is not pool
+        assert colors(rasterizer.rasterize_batch(['blue'], resolution=8)) == [COLORS['blue']]
+    finally:
+        rasterizer.shutdown()
+
+def test_pool_crash_recovers():
+    rasterizer = FakeRasterizer(num_workers=2, timeout=30.0, max_attempts=2)
+    try:
+        images, errors = rasterizer.rasterize_batch(['red', 'crash', 'blue'], resolution=8, return_errors=True)
+        assert colors(images)[0] == COLORS['red'] and colors(images)[2] == COLORS['blue']
+        assert errors == [None, 'Rasterization worker crashed', None]
+        assert rasterizer.stats['crashes'] >= 1
+        assert rasterizer.rasterize('green', resolution=8).getpixel((0, 0)) == COLORS['green']
+    finally:
+        rasterizer.shutdown()
+
+def test_on_error_raise():
+    with pytest.raises(RasterizationError, match='cannot render'):
+        FakeRasterizer(num_workers=0, on_error='raise').rasterize('fail', resolution=8)
+
+def test_cache_key_covers_the_render_settings():
+    key = RasterCache.key('<svg/>', 224, 128, 2, 'white', ('cairosvg',))
+    assert key != RasterCache.key('<svg/>', 224, 128, 2, 'white', ('svglib',))
+    assert key != RasterCache.key('<svg/>', 224, 128, 2, 'white', ('cairosvg', 'svglib'))
+    assert key != RasterCache.key('<svg/>', 448, 128, 2, 'white', ('cairosvg',))
+    assert '#' not in RasterCache.key('<svg/>', 224, 128, 2, '#ffffff', ('cairosvg',))
+
+def test_cached_renders_are_per_backend(tmp_path):
+    cache = RasterCache(cache_dir=str(tmp_path))
+    red = FakeRasterizer(num_workers=0, backends=('cairosvg',), cache=cache).rasterize('red', resolution=8)
+    other = FakeRasterizer(num_workers=0, backends=('svglib',), cache=cache)
+    assert other.rasterize('red', resolution=8).getpixel((0, 0)) == red.getpixel((0, 0))
+    assert other.stats['rendered'] == 1 and cache.stats['misses'] == 2
+    # The disk tier serves a fresh process-level cache
+    again = FakeRasterizer(num_workers=0, backends=('svglib',), cache=RasterCache(cache_dir=str(tmp_path)))
+    again.rasterize('red', resolution=8)
+    assert again.stats['rendered'] == 0 and again.cache.stats['disk_hits'] == 1
+
+def test_memory_tier_eviction():
+    cache = RasterCache(max_memory_bytes=10)
+    for key in 'abc':
+        cache.put(key, b'1234')
+    assert cache.get('a') is None and cache.get('c') == b'1234'
+    # get() refreshes recency, so 'c' is evicted before 'b'
+    assert cache.get('b') == b'1234'
+    cache.put('d', b'1234')
+    assert cache.get('c') is None and cache.get('b') == b'1234'
+    assert cache.report()['memory_bytes'] == 8
+
+def test_cache_is_thread_safe(tmp_path):
+    cache = RasterCache(max_memory_bytes=40, cache_dir=str(tmp_path))
+    errors = []
+
+    def worker(seed):
+        try:
+            for n in range(500):
+                key = f"{(seed * 7 + n) % 23:02d}key"
+                if cache.get(key) is None:
+                    cache.put(key, key.encode() * 2)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    report = cache.report()
+    assert report['memory_bytes'] == sum(len(png) for png in cache.memory.values()) <= 40
+    assert report['memory_hits'] + report['disk_hits'] + report['misses'] == 8 * 500
+
+class CacheSizes:
+    """Map-style dataset reporting the memory tier of the process-wide rasterizer's cache in its worker"""
+    def __len__(self):
+        return 1
+
+    def __getitem__(self, idx):
+        from starvector.data.rasterizer import get_rasterizer
+        cache = get_rasterizer().cache
+        return -1 if cache is None else cache.max_memory_bytes
+
+def test_worker_caches_are_opt_in(monkeypatch):
+    from torch.utils.data import DataLoader
+    from starvector.data import rasterizer as rasterizer_module
+    monkeypatch.delenv('STARVECTOR_RASTER_CACHE_MB', raising=False)
+    monkeypatch.delenv('STARVECTOR_RASTER_CACHE_DIR', raising=False)
+    monkeypatch.setattr(rasterizer_module, '_rasterizer', None)
+    monkeypatch.setattr(rasterizer_module, '_rasterizer_pid', None)
+    # Built in the main process first, so forked workers inherit it
+    assert rasterizer_module.get_rasterizer().cache.max_memory_bytes == 256 * 2**20
+    sizes = lambda: [int(size) for size in DataLoader(CacheSizes(), num_workers=1, multiprocessing_context='fork')]
+    assert sizes() == [-1]
+    monkeypatch.setenv('STARVECTOR_RASTER_WORKER_CACHE_MB', '8')
+    assert sizes() == [8 * 2**20]
+    # An explicitly set rasterizer is kept
+    rasterizer_module.set_rasterizer(FakeRasterizer(num_workers=0, cache=RasterCache(123)))
+    assert sizes() == [123]
@@ -0,0 +1,124 @@
+import numpy as np
+from starvector.data.samplers import BucketBatchSampler, ResumableSampler, padding_efficiency, set_train_epoch
+
+def long_tailed_lengths(n=1000, seed=0):
+    return np.random.RandomState(seed).lognormal(6, 1, n).astype(int) + 1
+
+def test_batches_cover_every_sample_once():
+    lengths = long_tailed_lengths()
+    sampler = BucketBatchSampler(lengths, batch_size=8, bucket_size_multiplier=10)
+    batches = list(sampler)
+    assert len(batches) == len(sampler)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    # A new epoch shuffles the batches
+    sampler.set_epoch(1)
+    assert list(sampler) != batches
+
+def test_bucketing_reduces_padding():
+    sampler = BucketBatchSampler(long_tailed_lengths(), batch_size=8, bucket_size_multiplier=10)
+    report = sampler.report()
+    assert report['padding_efficiency_bucketed'] > 2 * report['padding_efficiency_random']
+    assert padding_efficiency([1, 3], [[0, 1]]) == 4 / 6
+
+def test_replicas_split_the_batches():
+    lengths = long_tailed_lengths(100)
+    replicas = [list(BucketBatchSampler(lengths, batch_size=8, num_replicas=3, rank=rank)) for rank in range(3)]
+    assert len({len(batches) for batches in replicas}) == 1
+    assert len(replicas[0]) == len(BucketBatchSampler(lengths, batch_size=8, num_replicas=3))
+    assert {i for batches in replicas for batch in batches for i in batch} == set(range(100))
+
+def test_resume_at_the_next_unseen_index():
+    sampler = ResumableSampler(100, batch_size=8, seed=3)
+    sampler.set_epoch(2)
+    order = list(sampler)
+    assert sorted(order) == list(range(100))
+    sampler.update_state(5)
+    resumed = ResumableSampler(100, batch_size=8, seed=3)
+    resumed.load_state_dict(sampler.state_dict())
+    resumed.set_epoch(2)
+    assert list(resumed) == order[40:]
+    # The next epoch starts over
+    resumed.set_epoch(3)
+    assert len(list(resumed)) == 100
+
+def test_bucket_sampler_resumes():
+    sampler = BucketBatchSampler(long_tailed_lengths(100), batch_size=8, bucket_size_multiplier=2)
+    batches = list(sampler)
+    sampler.update_state(4)
+    resumed = BucketBatchSampler(long_tailed_lengths(100), batch_size=8, bucket_size_multiplier=2)
+    resumed.load_state_dict(sampler.state_dict())
+    assert list(resumed) == batches[4:]
+
+def test_resume_with_several_processes():
+    from torch.utils.data import DataLoader
+    from accelerate.data_loader import prepare_data_loader
+    from starvector.data.samplers import resume_epoch
+    num_processes, batch_size, steps_in_epoch_1 = 2, 4, 5
+
+    def loaders(state=None):
+        """One sampler and prepared dataloader per process, as `accelerator.prepare` shards them"""
+        samplers, prepared = [], []
+        for rank in range(num_processes):
+            sampler = ResumableSampler(100, batch_size, seed=3)
+            if state is not None:
+                sampler.load_state_dict(state)
+            samplers.append(sampler)
+            prepared.append(prepare_data_loader(DataLoader(list(range(100)), batch_size=batch_size, sampler=sampler),
+                                                num_processes=num_processes, process_index=rank))
+        return samplers, prepared
+
+    samplers, prepared = loaders()
+    # Measured before `prepare`, like in train.py: twice the steps each process really takes
+    num_update_steps_per_epoch = len(DataLoader(list(range(100)), batch_size=batch_size))
+    assert num_update_steps_per_epoch == 25 and len(prepared[0]) == 13
+    global_step, seen = 0, []
+    for epoch in range(2):
+        for sampler, loader in zip(samplers, prepared):
+            set_train_epoch(epoch, loader, sampler)
+        for step, batches in enumerate(zip(*prepared)):
+            if epoch == 1 and step == steps_in_epoch_1:
+                break
+            for sampler in samplers:
+                sampler.update_state(num_processes)
+            if epoch == 1:
+                seen.extend(int(i) for batch in batches for i in batch)
+            global_step += 1
+
+    state = samplers[0].state_dict()
+    assert global_step == 18 and global_step // num_update_steps_per_epoch == 0
+    first_epoch = resume_epoch(state, global_step, num_update_steps_per_epoch)
+    assert first_epoch == 1
+
+    samplers, prepared = loaders(state)
+    for sampler, loader in zip(samplers, prepared):
+        set_train_epoch(first_epoch, loader, sampler)
+    rest = [int(i) for batches in zip(*prepared) for batch in batches for i in batch]
+    order = ResumableSampler(100, batch_size, seed=3)
+    order.set_epoch(1)
+    order = list(order)
+    assert seen == order[:40]
+    # The rest of epoch 1 in order, the last step padded with repeats to give both processes a batch
+    assert rest[:60] == order[40:] and set(rest) == set(order[40:])
+
+def test_bucketing_with_several_processes():
+    from torch.utils.data import DataLoader
+    from accelerate.data_loader import prepare_data_loader
+    num_processes, lengths = 2, long_tailed_lengths(100)
+    samplers = [BucketBatchSampler(lengths, batch_size=4, bucket_size_multiplier=2) for _ in range(num_processes)]
+    # The bucket sampler is wrapped in a `BatchSamplerShard`, which the prepared dataloader's `set_epoch` does not reach
+    prepared = [prepare_data_loader(DataLoader(list(range(100)), batch_sampler=sampler), num_processes=num_processes, process_index=rank)
+                for rank, sampler in enumerate(samplers)]
+    epochs = []
+    for epoch in range(3):
+        for sampler, loader in zip(samplers, prepared):
+            set_train_epoch(epoch, loader, sampler)
+        seen = []
+        for batches in zip(*prepared):
+            for sampler in samplers:
+                sampler.update_state(num_processes)
+            seen.extend(int(i) for batch in batches for i in batch)
+        assert samplers[0].epoch == epoch
+        # Every epoch covers the dataset again, in a new order
+        assert len(prepared[0]) > 0 and set(seen) == set(range(100))
+        epochs.append(seen)
+    assert epochs[0] != epochs[1] != epochs[2]
@@ -0,0 +1,57 @@
+import json
+import torch
+from safetensors.torch import save_file, load_file
+from starvector.model.shared_weights import mmap_safetensors, resolve_safetensors_files, cast_safetensors
+
+def tensors():
+    torch.manual_seed(0)
+    return {
+        'linear.weight': torch.randn(4, 3),
+        'linear.bias': torch.randn(4).to(torch.bfloat16),
+        'steps': torch.arange(5),
+        'empty': torch.zeros(0, 3),
+    }
+
+def test_views_match_the_checkpoint(tmp_path):
+    path = str(tmp_path / 'model.safetensors')
+    save_file(tensors(), path)
+    mapped = mmap_safetensors(path)
+    expected = load_file(path)
+    assert mapped.keys() == expected.keys()
+    for name, tensor in expected.items():
+        assert mapped[name].dtype == tensor.dtype
+        torch.testing.assert_close(mapped[name], tensor)
+    # Tensors of a file are views into one mapping, shared by every call
+    again = mmap_safetensors(path)
+    assert again['linear.weight'].data_ptr() == mapped['linear.weight'].data_ptr()
+
+def test_writes_stay_private(tmp_path):
+    path = str(tmp_path / 'model.safetensors')
+    save_file(tensors(), path)
+    mmap_safetensors(path)['linear.weight'].fill_(0)
+    torch.testing.assert_close(load_file(path)['linear.weight'], tensors()['linear.weight'])
+
+def test_sharded_checkpoint_files(tmp_path):
+    weights = tensors()
+    save_file({'linear.weight': weights['linear.weight']}, str(tmp_path / 'model-00001-of-00002.safetensors'))
+    save_file({'steps': weights['steps']}, str(tmp_path / 'model-00002-of-00002.safetensors'))
+    (tmp_path / 'model.safetensors.index.json').write_text(json.dumps({'weight_map': {
+        'linear.weight': 'model-00001-of-00002.safetensors', 'steps': 'model-00002-of-00002.safetensors'}}))
+    model_path, files = resolve_safetensors_files(str(tmp_path))
+    assert model_path == str(tmp_path)
+    assert [f.rsplit('/', 1)[1] for f in files] == ['model-00001-of-00002.safetensors', 'model-00002-of-00002.safetensors']
+
+def test_cast_copy_is_shared(tmp_path):
+    path = str(tmp_path / 'model.safetensors')
+    save_file(tensors(), path)
+    cast_path = cast_safetensors(path, torch.float32)
+    assert cast_path == str(tmp_path / 'float32' / 'model.safetensors')
+    cast = mmap_safetensors(cast_path)
+    assert cast['linear.bias'].dtype == torch.float32 and cast['steps'].dtype == torch.int64
+    torch.testing.assert_close(cast['linear.bias'], tensors()['linear.bias'].float())
+    # Written once, then mapped by every process casting the same file
+    mtime = (tmp_path / 'float32' / 'model.safetensors').stat().st_mtime_ns
+    assert cast_safetensors(path, torch.float32) == cast_path
+    assert (tmp_path / 'float32' / 'model.safetensors').stat().st_mtime_ns == mtime
+    # A file already in the dtype is mapped as is
+    assert cast_safetensors(cast_path, torch.float32) == cast_path
@@ -0,0 +1,58 @@
+import numpy as np
+from svgpathtools import parse_path
+from starvector.data.simplify import rdp, PathSimplifier, SVGSimplifier
+
+def test_rdp_drops_collinear_points():
+    points = np.array([0, 1 + 0.001j, 2, 3 - 0.001j, 4, 4 + 4j])
+    assert list(rdp(points, 0.01)) == [0, 4, 5]
+    # 2 is the midpoint of 1 and 3, exactly on their chord
+    assert list(rdp(points, 0.0001)) == [0, 1, 3, 4, 5]
+
+def test_lines_are_reduced():
+    path = parse_path('M0 0 L1 0.001 L2 0 L3 0 L3 3')
+    simplified = PathSimplifier(tolerance=0.01)(path)
+    assert len(simplified) == 2
+    assert simplified.start == path.start and simplified.end == path.end
+
+def test_curve_chain_is_refit_within_tolerance():
+    # A quarter circle split into many small cubics
+    angles = np.linspace(0, np.pi / 2, 17)
+    points = 10 * np.exp(1j * angles)
+    d = f'M{points[0].real} {points[0].imag}' + ''.join(
+        f' Q{(10 / np.cos(np.pi / 64) * np.exp(1j * (a + b) / 2)).real} {(10 / np.cos(np.pi / 64) * np.exp(1j * (a + b) / 2)).imag} {p.real} {p.imag}'
+        for a, b, p in zip(angles[:-1], angles[1:], points[1:]))
+    path = parse_path(d)
+    simplified = PathSimplifier(tolerance=0.01)(path)
+    assert len(simplified) < len(path)
+    for t in np.linspace(0, 1, 50):
+        point = simplified.point(t)
+        assert abs(abs(point) - 10) < 0.05
+
+def test_document_paths_only_get_shorter():
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><path d="M0 0 L50.0001 0.0002 L100 0 L100 100 Z" fill="red"/><polyline points="0,0 1,0.0001 2,0 2,2"/></svg>'
+    simplified = SVGSimplifier(tolerance=0.001)(svg)
+    assert len(simplified) < len(svg)
+    assert 'fill="red"' in simplified
+    assert SVGSimplifier()('<svg') == '<svg'
+
+def test_closed_subpaths_keep_their_closepath():
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><path d="{}"/></svg>'
+    simplifier = SVGSimplifier(tolerance=0.001)
+    assert 'd="M0 0H10V10z"' in simplifier(svg.format('M0 0 L10 0 L10 10 Z'))
+    # Only the closed subpath gets a `z`, and the commands after it start from its first point
+    simplified = simplifier(svg.format('M0 0 L10 0 L10 10 Z l5 5 L20 20.0001 L30 20 M50 50 L60 50 L60 60'))
+    assert 'd="M0 0H10V10zM0 0 20 20H30M50 50H60V60"' in simplified
+    # Nothing to draw: the path data is kept
+    assert 'd="M10 10"' in simplifier(svg.format('M10 10'))
+
+def test_verified_simplification_keeps_the_input(monkeypatch):
+    from starvector.data import util
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><path d="M0 0 L50 1 L100 0 L100 100 Z"/></svg>'
+    diffs = []
+    monkeypatch.setattr(util, 'raster_diff', lambda a, b, **kwargs: diffs.pop())
+    simplifier = SVGSimplifier(tolerance=0.05, verify=True, max_raster_diff=0.01)
+    diffs.append(0.001)
+    assert simplifier(svg) == simplifier.simplify(svg) != svg
+    diffs.append(0.02)
+    assert simplifier(svg) == svg
+    assert simplifier.report() == {'simplify_num_svgs': 2, 'simplify_rejected': 1, 'simplify_unverified': 0}
@@ -0,0 +1,107 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+from torch.utils.data import DataLoader
+from starvector.data.streaming import StreamingSVGDataset
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 10 10"><rect width="{}" height="5"/></svg>'
+
+def write_shards(path, num_files=3, rows_per_file=12):
+    for f in range(num_files):
+        ids = [f'{f}-{i}' for i in range(rows_per_file)]
+        table = pa.table({
+            'Svg': [SVG.format(1 + i % 9) for i in range(rows_per_file)],
+            'Filename': ids,
+            'model_name': ['a' if i % 2 else 'b' for i in range(rows_per_file)],
+        })
+        pq.write_table(table, path / f'part-{f}.parquet', row_group_size=5)
+
+def ids(dataset, **kwargs):
+    return [id for batch in DataLoader(dataset, batch_size=4, **kwargs) for id in batch['id']]
+
+def test_ranks_split_the_stream(tmp_path):
+    write_shards(tmp_path)
+    ranks = [StreamingSVGDataset(str(tmp_path), 'train', 32, rank=rank, world_size=2) for rank in range(2)]
+    streams = [ids(dataset) for dataset in ranks]
+    assert len(streams[0]) == len(streams[1]) == len(ranks[0]) == 18
+    assert len(set(streams[0] + streams[1])) == 36
+    # Shuffled differently every epoch
+    ranks[0].set_epoch(1)
+    assert ids(ranks[0]) != streams[0]
+
+def test_filter_and_num_samples(tmp_path):
+    write_shards(tmp_path)
+    dataset = StreamingSVGDataset(str(tmp_path), 'train', 32, num_samples=15, select_dataset_name='a', shuffle=False)
+    stream = ids(dataset)
+    assert len(stream) == 15
+    assert all(int(id.split('-')[1]) % 2 for id in stream)
+
+def test_exact_resume(tmp_path):
+    write_shards(tmp_path)
+    dataset = StreamingSVGDataset(str(tmp_path), 'train', 32, seed=3)
+    dataset.set_epoch(2)
+    full = ids(dataset, num_workers=2)
+
+    dataset = StreamingSVGDataset(str(tmp_path), 'train', 32, seed=3)
+    dataset.set_epoch(2)
+    seen = []
+    for batch in DataLoader(dataset, batch_size=4, num_workers=2):
+        dataset.update_state(batch)
+        seen.extend(batch['id'])
+        if len(seen) == 12:
+            break
+    resumed = StreamingSVGDataset(str(tmp_path), 'train', 32, seed=3)
+    resumed.load_state_dict(dataset.state_dict())
+    # Every unconsumed sample once, the workers' batches may interleave differently
+    assert sorted(seen + ids(resumed, num_workers=2)) == sorted(full)
+
+def test_resume_in_the_recorded_epoch(tmp_path):
+    from starvector.data.samplers import resume_epoch
+    write_shards(tmp_path)
+    seen, rest = [], []
+    for rank in range(2):
+        dataset = StreamingSVGDataset(str(tmp_path), 'train', 32, seed=3, rank=rank, world_size=2)
+        dataset.set_epoch(1)
+        for batch in DataLoader(dataset, batch_size=4):
+            dataset.update_state(batch)
+            seen.extend(batch['id'])
+            break
+        state = dataset.state_dict()
+        resumed = StreamingSVGDataset(str(tmp_path), 'train', 32, seed=3, rank=rank, world_size=2)
+        resumed.load_state_dict(state)
+        # 6 steps counted against an epoch length that is too long would give epoch 0, and restart it
+        first_epoch = resume_epoch(state, global_step=6, num_update_steps_per_epoch=10)
+        assert first_epoch == 1
+        resumed.set_epoch(first_epoch)
+        rest.extend(ids(resumed))
+    assert len(seen) == 8 and len(rest) == 28
+    assert not set(seen) & set(rest) and len(set(seen + rest)) == 36
+    assert resume_epoch(None, global_step=6, num_update_steps_per_epoch=5) == 1
+
+def test_streamed_epochs_through_the_loop(tmp_path):
+    from starvector.data.samplers import set_train_epoch
+    write_shards(tmp_path, num_files=2, rows_per_file=6)
+
+    def run(dataset, epochs, first_epoch=0, resumed=False, stop=None):
+        """The epochs of the training loop, over a dataloader that is not prepared, as train.py streams"""
+        loader = DataLoader(dataset, batch_size=4)
+        seen = {}
+        for epoch in range(first_epoch, epochs):
+            set_train_epoch(epoch, loader, None, dataset, resumed=resumed and epoch == first_epoch)
+            seen[epoch] = []
+            for batch in loader:
+                dataset.update_state(batch)
+                seen[epoch].extend(batch['id'])
+                if (epoch, len(seen[epoch])) == stop:
+                    return seen
+        return seen
+
+    dataset = StreamingSVGDataset(str(tmp_path), 'train', 32, seed=3)
+    full = run(dataset, 2)
+    assert len(full[0]) == len(full[1]) == 12 and full[0] != full[1]
+    # Stopped in epoch 1 and resumed there, without restarting the epoch
+    dataset = StreamingSVGDataset(str(tmp_path), 'train', 32, seed=3)
+    seen = run(dataset, 2, stop=(1, 4))
+    resumed = StreamingSVGDataset(str(tmp_path), 'train', 32, seed=3)
+    resumed.load_state_dict(dataset.state_dict())
+    rest = run(resumed, 2, first_epoch=1, resumed=True)
+    assert seen[1] + rest[1] == full[1]
@@ -0,0 +1,71 @@
+import io
+import pytest
+from PIL import Image
+from starvector.data import rasterizer as rasterizer_module
+from starvector.data.rasterizer import Rasterizer, RasterizationError
+from starvector.data.svg_minify import SVGMinifier
+
+SVG = '''<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100">
+  <!-- two squares -->
+  <path d="M 10.000001 10 L 40 10 L 40 40 L 10 40 Z" fill="red"/>
+  <path d="M 60 60 L 90 60 L 90 90 L 60 90 Z" fill="red"/>
+</svg>'''
+
+def count_render(svg_string, resolution, dpi, scale, background='white', backends=()):
+    """Gray level from the number of <path> elements, so merging paths changes the raster"""
+    if 'class="broken"' in svg_string or (svg_string.count('\n') == 0 and 'fail-minified' in svg_string):
+        raise RasterizationError('cannot render')
+    level = 40 * svg_string.count('<path')
+    buffer = io.BytesIO()
+    Image.new('RGB', (resolution, resolution), (level, level, level)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+class CountRasterizer(Rasterizer):
+    render_fn = staticmethod(count_render)
+
+@pytest.fixture(autouse=True)
+def fake_rasterizer(monkeypatch):
+    monkeypatch.setattr(rasterizer_module, '_rasterizer', CountRasterizer(num_workers=0))
+
+def test_merge_fallback_is_verified():
+    minifier = SVGMinifier(verify_resolution=8)
+    result = minifier(SVG)
+    # Merging the two paths changes the (fake) raster, so they are kept apart
+    assert result.accepted and result.raster_diff == 0.0
+    assert result.svg.count('<path') == 2 and '<!--' not in result.svg
+    assert result.minified_bytes < result.original_bytes
+    assert minifier.stats['merge_fallbacks'] == 1 and minifier.stats['rejected'] == 0
+
+def test_render_failures_are_not_accepted():
+    minifier = SVGMinifier(verify_resolution=8)
+    broken = SVG.replace('<path d="M 60', '<path class="broken" d="M 60')
+    result = minifier(broken)
+    assert not result.accepted and result.svg == broken and result.raster_diff is None
+    # Only the minified side fails to render
+    result = minifier(SVG.replace('fill="red"/>\n</svg>', 'fill="red"/><g id="fail-minified"/>\n</svg>'))
+    assert not result.accepted and result.raster_diff is None
+    assert minifier.stats['unverified'] == 2 and minifier.report()['minify_unverified'] == 2
+
+def test_raster_diff_raises_on_render_failure():
+    from starvector.data.util import raster_diff
+    assert raster_diff(SVG, SVG, resolution=8) == 0.0
+    with pytest.raises(RasterizationError, match='cannot render'):
+        raster_diff(SVG, SVG.replace('<path', '<path class="broken"', 1), resolution=8)
+
+def test_deeply_nested_groups():
+    depth = 1500
+    svg = ('<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100">' + '<g fill="#000">' * depth
+           + '<path d="M 10.0001 10 L 40 10"/><path d="M 60 60 L 90 60"/>' + '</g>' * depth + '</svg>')
+    minified = SVGMinifier(verify=False).minify(svg)
+    # Walked without recursion: the default fill is stripped at every level and the two paths merged
+    assert minified.count('<g>') == depth and 'fill' not in minified
+    assert minified.count('<path') == 1 and 'M10 10H40M60 60H90' in minified
+
+def test_non_finite_extent():
+    from lxml import etree
+    from starvector.data.svg_minify import coordinate_decimals
+    for view_box in ('0 0 1e999 1e999', '0 0 nan nan', '0 0 -5 -5', '0 0 0 0'):
+        root = etree.fromstring(f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{view_box}"/>')
+        assert coordinate_decimals(root, 4) == 1, view_box
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 1e999 1e999"><rect x="1e999" width="10.123"/></svg>'
+    assert SVGMinifier(verify=False).minify(svg) == '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 1e999 1e999"><rect x="1e999" width="10.1"/></svg>'
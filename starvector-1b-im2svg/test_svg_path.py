@@ -0,0 +1,46 @@
+from starvector.data.svg_path import parse_path, serialize_path, format_number
+
+def test_format_number():
+    assert format_number(0.5, 2) == '.5'
+    assert format_number(-0.5, 2) == '-.5'
+    assert format_number(12.000, 2) == '12'
+    assert format_number(-0.0001, 2) == '0'
+    assert format_number(3.14159, 3) == '3.142'
+
+def test_parse_relative_and_implicit_commands():
+    segments = parse_path('m1,1 2,2 h3 v-4 z l1 1')
+    assert segments == [
+        ('M', [1.0, 1.0]), ('L', [3.0, 3.0]), ('H', [6.0]), ('V', [-1.0]), ('Z', []), ('L', [2.0, 2.0])
+    ]
+
+def test_parse_relative_arc_end_point_only():
+    assert parse_path('M10 10 a5 5 30 0 1 10 10') == [('M', [10.0, 10.0]), ('A', [5.0, 5.0, 30.0, 0.0, 1.0, 20.0, 20.0])]
+
+def test_parse_arc_flags_without_separators():
+    expected = [('M', [0.0, 0.0]), ('A', [5.0, 5.0, 0.0, 1.0, 0.0, 10.0, 10.0])]
+    assert parse_path('M0 0 A 5 5 0 1010 10') == expected
+    assert parse_path('M0 0A5 5 0 1 0 10 10') == expected
+    assert parse_path('M0 0A5,5,0,10,10,10') == expected
+    # A flag is 0 or 1
+    assert parse_path('M0 0 A 5 5 0 2 0 10 10') is None
+
+def test_parse_rejects_malformed_paths():
+    assert parse_path('M0 0 L1') is None
+    assert parse_path('10 10 L1 1') is None
+    assert parse_path('M0 0 Z 1') is None
+    assert parse_path('M0 0 L1 1 x') is None
+
+def test_serialize_shortest_form():
+    segments = parse_path('M10.000 20.0000 L 30.12345 20 L30.12345 40 C 1 2 3 4 5 6 z')
+    assert serialize_path(segments, 2) == 'M10 20H30.12V40C1 2 3 4 5 6z'
+    # Relative offsets are shorter far from the origin, repeated letters are omitted
+    assert serialize_path(parse_path('M1000 1000 L1001 1001 L1002 1003'), 0) == 'M1000 1000l1 1 1 2'
+
+def test_round_trip_keeps_geometry():
+    d = 'M12.3456 7.891 c1.11 2.22 3.33 4.44 5.55 6.66 s1 1 2 2 q3 3 4 4 t5 5 a2 2 0 1 0 4 4 Z m-3 -3 l-1.5 .25'
+    decimals = 2
+    original = parse_path(d)
+    round_trip = parse_path(serialize_path(original, decimals))
+    assert [command for command, _ in round_trip] == [command for command, _ in original]
+    for (_, a), (_, b) in zip(original, round_trip):
+        assert all(abs(x - y) <= 0.5 * 10 ** -decimals + 1e-9 for x, y in zip(a, b))
@@ -0,0 +1,104 @@
+import io
+import threading
+import time
+from PIL import Image
+from starvector.data.rasterizer import Rasterizer
+from starvector.serve.svg_renderer import StreamingSVGRenderer
+
+BLUE = (0, 0, 255)
+
+def preview_render(svg_string, resolution, dpi, scale, background='white', backends=()):
+    """Module level so spawned pool workers can unpickle it. SVGs with a `hang` element never finish"""
+    if '<hang' in svg_string:
+        time.sleep(60)
+    buffer = io.BytesIO()
+    Image.new('RGB', (resolution, resolution), BLUE).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+class PreviewRasterizer(Rasterizer):
+    render_fn = staticmethod(preview_render)
+
+def stream(renderer, elements, deadline):
+    """Stream the SVG one element at a time, then poll until a preview arrives or the session times out"""
+    text = '<svg xmlns="http://www.w3.org/2000/svg">'
+    timeouts = renderer.stats['timeouts']
+    for element in elements:
+        text += element
+        renderer.update(text)
+        time.sleep(0.01)
+    while renderer.image is None and renderer.stats['timeouts'] == timeouts and time.monotonic() < deadline:
+        renderer.update(text)
+        time.sleep(0.02)
+
+def test_concurrent_sessions_survive_a_hung_preview():
+    rasterizer = PreviewRasterizer(num_workers=3)
+    try:
+        # Start the workers, so the timeouts below are not spent spawning them
+        rasterizer.rasterize_batch(['<svg/>', '<svg><g/></svg>', '<svg><a/></svg>'], resolution=8)
+        pool = rasterizer._get_pool()
+        hung = StreamingSVGRenderer(resolution=8, min_interval=0.0, timeout=0.5, rasterizer=rasterizer)
+        sessions = [StreamingSVGRenderer(resolution=8, min_interval=0.0, timeout=0.5, rasterizer=rasterizer) for _ in range(4)]
+
+        deadline = time.monotonic() + 30
+        threads = [threading.Thread(target=stream, args=(hung, ['<hang/>'], deadline))]
+        threads += [threading.Thread(target=stream, args=(session, ['<rect/>', '<circle/>'], deadline)) for session in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert hung.stats['timeouts'] == 1 and hung.image is None
+        for session in sessions:
+            assert session.stats['failed'] == 0 and session.stats['timeouts'] == 0
+            assert session.image is not None and session.image.getpixel((0, 0)) == BLUE
+        # The pool was kept and serves the remaining sessions
+        assert sessions[0].finish(sessions[0].text + '<path/>').getpixel((0, 0)) == BLUE
+        assert rasterizer._get_pool() is pool
+    finally:
+        rasterizer.shutdown()
+
+def test_hung_previews_free_their_worker():
+    # More hung previews than workers: each is interrupted in its worker after the session's timeout,
+    # well before the rasterizer's own, so the next session still gets a preview
+    rasterizer = PreviewRasterizer(num_workers=1, timeout=60.0)
+    try:
+        rasterizer.rasterize_batch(['<svg/>'], resolution=8)
+        pool = rasterizer._get_pool()
+        start = time.monotonic()
+        for _ in range(2):
+            hung = StreamingSVGRenderer(resolution=8, min_interval=0.0, timeout=0.3, rasterizer=rasterizer)
+            stream(hung, ['<hang/>'], start + 30)
+            assert hung.stats['timeouts'] == 1
+        session = StreamingSVGRenderer(resolution=8, min_interval=0.0, timeout=0.3, rasterizer=rasterizer)
+        stream(session, ['<rect/>'], start + 30)
+        assert session.stats['timeouts'] == 0 and session.image.getpixel((0, 0)) == BLUE
+        assert time.monotonic() - start < 10
+        assert rasterizer._get_pool() is pool
+    finally:
+        rasterizer.shutdown()
+
+def test_session_renders_again_after_a_timeout():
+    rasterizer = PreviewRasterizer(num_workers=2)
+    try:
+        rasterizer.rasterize_batch(['<svg/>', '<svg><g/></svg>'], resolution=8)
+        pool = rasterizer._get_pool()
+        renderer = StreamingSVGRenderer(resolution=8, min_interval=0.0, timeout=0.3, rasterizer=rasterizer)
+        stream(renderer, ['<hang/>'], time.monotonic() + 30)
+        assert renderer.stats['timeouts'] == 1
+        # A new generation replaces the text and is previewed normally
+        stream(renderer, ['<rect/>'], time.monotonic() + 30)
+        assert renderer.image.getpixel((0, 0)) == BLUE
+        assert renderer.stats['submitted'] == 2
+        assert rasterizer._get_pool() is pool
+    finally:
+        rasterizer.shutdown()
+
+def test_updates_are_coalesced():
+    renderer = StreamingSVGRenderer(resolution=8, min_interval=60.0, rasterizer=PreviewRasterizer(num_workers=0))
+    text = '<svg xmlns="http://www.w3.org/2000/svg"><rect/>'
+    renderer.update(text)
+    # No new element, then a new element within `min_interval`: no render is submitted
+    renderer.update(text + '<circle r="1')
+    renderer.update(text + '<circle r="1"/>')
+    assert renderer.stats['submitted'] == 1 and renderer.stats['updates'] == 3
+    assert renderer.update(text + '<circle r="1"/>').getpixel((0, 0)) == BLUE
@@ -0,0 +1,90 @@
+from lxml import etree
+from starvector.data.svg_repair import (SVGRepairEngine, check_path_data, repair_svg,
+                                        VALID, REPAIRED, PLACEHOLDER, PLACEHOLDER_SVG)
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 10 10"><path d="M0 0L10 10Z"/></svg>'
+
+def paths(svg):
+    root = etree.fromstring(svg.encode('utf-8'))
+    return [element.get('d') for element in root.iter('{*}path')]
+
+def test_check_path_data():
+    assert check_path_data('M0 0L10 10Z') == 'M0 0L10 10Z'
+    # Implicit linetos after a moveto
+    assert check_path_data('M0 0 5 5 10 0') == 'M0 0 5 5 10 0'
+    # Cut in the middle of a curve: trimmed to the last complete segment
+    assert check_path_data('M0 0L10 10C1 2 3 4 5') == 'M0 0L10 10'
+    assert check_path_data('M0 0L10 10C1 2 3 4 5 6 M1') == 'M0 0L10 10C1 2 3 4 5 6'
+    # A close path takes no arguments
+    assert check_path_data('M0 0L10 10Z 4') is None
+    # Not parseable at all
+    assert check_path_data('L10') is None
+    assert check_path_data('M0 0 L1 Q') is None
+    assert check_path_data('M0 0 #') is None
+
+def test_arc_flags_without_separators():
+    from svgpathtools import parse_path
+    d = 'M0 0 A 5 5 0 1010 10'
+    parse_path(d)
+    assert check_path_data(d) == d
+    assert check_path_data('M0 0 A 5 5 0 1010 10 a5 5 0 01-5') == 'M0 0 A 5 5 0 1010 10'
+    svg = f'<svg xmlns="http://www.w3.org/2000/svg"><path d="{d}"/></svg>'
+    assert repair_svg(svg).status == VALID
+
+def test_engines_are_per_thread():
+    import threading
+    from starvector.data import svg_repair
+    truncated = SVG[:SVG.index('Z')] + 'C1 2 3 4 5'
+    expected = [repair_svg(svg) for svg in (SVG, truncated)]
+    results, engines = [], []
+
+    def worker():
+        results.append([repair_svg(svg) for svg in (SVG, truncated)])
+        engines.append(svg_repair._local.engine)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [expected] * 4
+    # No parser (and error log) is shared between threads
+    assert len({id(engine.parser) for engine in engines + [svg_repair._local.engine]}) == 5
+
+def test_valid_svg_is_unchanged():
+    result = repair_svg(SVG)
+    assert result.status == VALID and result.svg == SVG and result.issues == []
+
+def test_truncated_path_data():
+    svg = SVG[:SVG.index('Z')] + 'C1 2 3 4 5'
+    result = SVGRepairEngine().repair(svg)
+    assert result.status == REPAIRED
+    assert paths(result.svg) == ['M0 0L10 10']
+    assert any('trimmed truncated d' in issue for issue in result.issues)
+
+def test_truncated_inside_the_attribute():
+    svg = '<svg xmlns="http://www.w3.org/2000/svg"><rect width="5" height="5"/><path d="M0 0L10 10L2'
+    result = repair_svg(svg)
+    assert result.status == REPAIRED
+    assert paths(result.svg) == ['M0 0L10 10']
+    assert etree.fromstring(result.svg.encode('utf-8')).find('{*}rect') is not None
+
+def test_invalid_geometry_is_dropped():
+    svg = '<svg><path d="L10 oops"/><polygon points="0,0 10,10 calc(5)"/><polyline points="0,0 1,1"/></svg>'
+    result = repair_svg(svg)
+    assert result.status == REPAIRED
+    root = etree.fromstring(result.svg.encode('utf-8'))
+    assert root.find('path').get('d') is None
+    assert root.find('polygon').get('points') is None
+    assert root.find('polyline').get('points') == '0,0 1,1'
+
+def test_leading_text_is_stripped():
+    result = repair_svg('Here is the SVG: ' + SVG)
+    assert result.status == REPAIRED
+    assert result.svg.startswith('<svg') and paths(result.svg) == ['M0 0L10 10Z']
+
+def test_placeholder():
+    for svg in ['', 'no markup here', None]:
+        result = repair_svg(svg)
+        assert result.status == PLACEHOLDER and result.svg == PLACEHOLDER_SVG
+    assert SVGRepairEngine(placeholder='<svg/>').repair('nothing').svg == '<svg/>'
@@ -0,0 +1,60 @@
+import torch
+import torch.nn as nn
+from transformers import GPT2Config, GPT2LMHeadModel
+from starvector.model.llm.svg_vocabulary import RestrictedLMHead, SVGVocabulary, benchmark_lm_head
+
+SUBSET = torch.tensor([0, 1, 2, 3])
+
+def head_preferring(token, num_tokens=8, hidden_size=8, strength=10.0):
+    """lm_head whose logits for hidden state e_k put `strength` on token k, and for e_7 on `token`"""
+    head = nn.Linear(hidden_size, num_tokens, bias=False)
+    with torch.no_grad():
+        head.weight.copy_(torch.eye(num_tokens, hidden_size) * strength)
+        head.weight[token, 7] = strength
+    return head
+
+def step(head, k, hidden_size=8):
+    hidden = torch.zeros(1, 1, hidden_size)
+    hidden[0, 0, k] = 1.0
+    return head(hidden)
+
+def test_every_step_is_checked():
+    head = RestrictedLMHead(head_preferring(5), SUBSET, check_every=1)
+    for k in (0, 1, 2):
+        step(head, k)
+    assert not head.fallback_triggered
+    # Token 5, outside the subset, is needed on a step that is not a multiple of any period
+    step(head, 5)
+    assert head.fallback_triggered
+    assert head.checks == 4
+
+def test_periodic_checks_catch_unsure_steps():
+    # Periodic by default, confident steps in between skip the full head
+    head = RestrictedLMHead(head_preferring(5), SUBSET)
+    for k in (0, 1, 2, 3) * 5:
+        step(head, k)
+    assert head.checks == 2 and not head.fallback_triggered
+    # The subset logits are flat when the model wants token 5: unsure, checked despite the period
+    step(head, 5)
+    assert head.fallback_triggered
+
+def test_generation_in_subset_space():
+    torch.manual_seed(0)
+    model = GPT2LMHeadModel(GPT2Config(vocab_size=32, n_positions=32, n_embd=16, n_layer=1, n_head=2)).eval()
+    vocabulary = SVGVocabulary(range(32))
+    vocabulary.bind(model)
+    input_ids = torch.tensor([[1, 2, 3]])
+    expected = model.generate(input_ids, max_new_tokens=5, do_sample=False, pad_token_id=0)
+    with vocabulary.restrict(model):
+        subset_ids = model.generate(torch.tensor([vocabulary.to_subset_ids([1, 2, 3])]), max_new_tokens=5, do_sample=False, pad_token_id=0)
+    assert torch.equal(vocabulary.to_full_ids(subset_ids), expected)
+    # The full heads are restored and the generation is reported
+    assert model.get_output_embeddings() is not vocabulary.lm_head
+    report = vocabulary.report()
+    assert report['num_generations'] == 1 and report['num_fallbacks'] == 0 and report['fallback_rate'] == 0.0
+
+def test_benchmark_counts_the_checks():
+    torch.manual_seed(0)
+    timings = benchmark_lm_head(SVGVocabulary(range(0, 256, 4)), hidden_size=128, full_vocab_size=256, num_steps=32)
+    assert timings['check_rate'] == 2 / 32 and timings['speedup'] > 0
+    assert benchmark_lm_head(SVGVocabulary(range(0, 256, 4)), 128, 256, num_steps=32, check_every=1)['check_rate'] == 1.0
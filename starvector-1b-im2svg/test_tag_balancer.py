@@ -0,0 +1,71 @@
+from starvector.data.tag_balancer import TagBalancer, balance_tags
+
+def feed_in_chunks(text, chunk_size):
+    balancer = TagBalancer()
+    for i in range(0, len(text), chunk_size):
+        balancer.feed(text[i:i + chunk_size])
+    return balancer
+
+def test_unclosed_tags_in_document_order():
+    from starvector.data.util import find_unclosed_tags
+    svg = '<svg viewBox="0 0 10 10"><g fill="red"><path d="M0 0L1 1"/><g><circle r="1"></circle>'
+    assert find_unclosed_tags(svg) == ['svg', 'g']
+    assert TagBalancer().feed(svg).unclosed_tags == ['svg', 'g', 'g']
+
+def test_closed_document():
+    svg = '<svg><g><path d="M0 0"/></g></svg>'
+    balancer = TagBalancer().feed(svg)
+    assert balancer.unclosed_tags == []
+    assert balancer.closing_suffix() == ''
+    assert balancer.num_closed == 3
+
+def test_comments_cdata_and_quoted_gt():
+    svg = '<svg><!-- <g> --><style><![CDATA[ a > b { } <g> ]]></style><text title="a > b">x</text><g>'
+    assert TagBalancer().feed(svg).unclosed_tags == ['svg', 'g']
+
+def test_truncated_suffixes():
+    cases = {
+        '<svg><path d="M0 0 L1': '"/></svg>',
+        '<svg><path d=': '""/></svg>',
+        '<svg><path d': '=""/></svg>',
+        '<svg><path ': '/></svg>',
+        '<svg><path d="M0 0" /': '></svg>',
+        '<svg><g></': 'g></svg>',
+        '<svg><g></g': '></svg>',
+        '<svg></sv': 'g>',
+        '<svg><': '!----></svg>',
+        '<svg><!-- note': '--></svg>',
+        '<svg><!-': '---></svg>',
+        '<svg><?xml': '?></svg>',
+    }
+    for svg, suffix in cases.items():
+        assert TagBalancer().feed(svg).closing_suffix() == suffix, svg
+        assert balance_tags(svg) == svg + suffix
+
+def test_incremental_matches_single_pass():
+    svg = ('<svg xmlns="http://www.w3.org/2000/svg"><!-- a > b --><g id="x">'
+           + '<path d="M0 0 L10 10" fill="#000"/>' * 20
+           + '<text font-family="a>b">hi</text><![CDATA[ <g> ]]><g><path d="M1 2 L3')
+    expected = TagBalancer().feed(svg)
+    for chunk_size in (1, 2, 3, 7, 64):
+        balancer = feed_in_chunks(svg, chunk_size)
+        assert balancer.unclosed_tags == expected.unclosed_tags
+        assert balancer.closing_suffix() == expected.closing_suffix()
+        assert balancer.num_closed == expected.num_closed
+
+def test_closing_suffix_does_not_change_state():
+    balancer = TagBalancer().feed('<svg><g></')
+    assert balancer.closing_suffix() == balancer.closing_suffix()
+    balancer.feed('g>')
+    assert balancer.unclosed_tags == ['svg']
+
+def test_long_token_in_small_chunks_is_linear():
+    import time
+    svg = '<svg><path d="' + 'L1 2 ' * 200000 + '"/><!-- ' + 'x' * 200000 + ' --><g>'
+    start = time.time()
+    balancer = feed_in_chunks(svg, 4)
+    # Copying the pending token on every chunk takes well over that here
+    assert time.time() - start < 5
+    assert balancer.unclosed_tags == ['svg', 'g'] and balancer.num_closed == 1
+    partial = feed_in_chunks(svg[:100000], 3)
+    assert partial.pending == svg[5:100000] and partial.closing_suffix() == '"/></svg>'
@@ -0,0 +1,50 @@
+import numpy as np
+from starvector.data.tracer import boundary_loops, image_complexity, quantize_colors, trace_image
+
+def flat_logo(size=64):
+    image = np.full((size, size, 3), 255, dtype=np.uint8)
+    y, x = np.mgrid[:size, :size]
+    image[(x - size / 2) ** 2 + (y - size / 2) ** 2 < (size / 3) ** 2] = (200, 30, 30)
+    image[size // 3:2 * size // 3, size // 3:2 * size // 3] = (20, 20, 120)
+    return image
+
+def test_boundary_loops_with_hole():
+    mask = np.zeros((6, 6), dtype=bool)
+    mask[1:5, 1:5] = True
+    mask[2:4, 2:4] = False
+    loops = boundary_loops(mask)
+    assert sorted(len(loop) for loop in loops) == [8, 16]
+    for loop in loops:
+        # Consecutive corners (closing the loop) are one pixel edge apart
+        assert np.all(np.abs(np.diff(np.append(loop, loop[0]))) == 1)
+
+def test_complexity_of_flat_and_noisy_images():
+    flat = image_complexity(flat_logo())
+    assert flat['num_colors'] <= 3
+    assert flat['gradient_density'] < 0.01
+    noisy = image_complexity(np.random.RandomState(0).randint(0, 256, (64, 64, 3), dtype=np.uint8))
+    assert noisy['num_colors'] > 100
+
+def test_quantize_and_trace():
+    image = flat_logo()
+    palette, labels = quantize_colors(image, max_colors=3)
+    assert len(palette) == 3
+    assert tuple(palette[labels[0, 0]]) == (255, 255, 255)
+    svg = trace_image(image, max_colors=3)
+    assert svg.startswith('<svg') and svg.endswith('</svg>')
+    assert svg.count('<path') == 2
+    # The square keeps its corners, edges are not chamfered
+    assert 'd="M21 21H42V42H21V21z"' in svg
+
+def test_router_thumbnails_arrays_and_images():
+    from PIL import Image
+    from starvector.serve.router import ImageRouter
+    router = ImageRouter(max_size=64)
+    large = np.kron(flat_logo(64), np.ones((8, 8, 1), dtype=np.uint8))
+    from_array = router._prepare(large)
+    assert from_array.shape == (64, 64, 3)
+    assert np.array_equal(from_array, router._prepare(Image.fromarray(large)))
+    # RGBA and non-square arrays are converted and padded like images
+    rgba = np.dstack([large[:256], np.full(large.shape[:2], 255, dtype=np.uint8)[:256]])
+    assert router._prepare(rgba).shape == (64, 64, 3)
+    assert router._prepare(flat_logo(32)).shape == (32, 32, 3)